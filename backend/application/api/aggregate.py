@@ -0,0 +1,99 @@
+"""
+Bucketed aggregation of data entries in SQL.
+"""
+from django.db import connection
+
+
+AGGREGATE_FUNCTIONS = ('avg', 'min', 'max', 'count', 'first', 'last')
+
+NUMERIC_FUNCTIONS = AGGREGATE_FUNCTIONS
+"""
+Functions that apply to numeric fields.
+"""
+
+TEXT_FUNCTIONS = ('count', 'first', 'last')
+"""
+Functions that apply to text fields.
+"""
+
+def bucket_sql(width):
+    """
+    Returns the SQL expression of the start of the `width` second bucket of each row, in
+    seconds since the epoch. Buckets are aligned to the epoch, like the climate rollups.
+    """
+    # SQLite stores times as UTC text, which strftime converts to epoch seconds
+    return f"CAST(strftime('%%s', time) AS INTEGER) / {int(width)} * {int(width)}"
+
+def aggregate_query(model, columns, width, zone=False):
+    """
+    Builds the query aggregating the entries of `model` between two times into buckets.
+
+    Args:
+        model (Model): Model to aggregate.
+        columns (list[tuple[str, str]]): The (field, function) of each column.
+        width (int): Bucket width in seconds.
+        zone (bool, optional): If True, only the entries of one zone are aggregated. Defaults to False.
+
+    Returns:
+        str: The query. Takes the start (inclusive) and end (exclusive) times, then the zone
+        if `zone` is True, as parameters.
+    """
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    bucket = bucket_sql(width)
+
+    inner = [f"{bucket} AS bucket"]
+    outer = ["bucket"]
+    windowed = False
+    for field, function in columns:
+        column = quote(field)
+        if function in ('first', 'last'):
+            # the window covers the whole bucket, so every row of it carries the same value
+            windowed = True
+            value = 'FIRST_VALUE' if function == 'first' else 'LAST_VALUE'
+            inner.append(f"{value}({column}) OVER bucket_window AS {quote(field + '_' + function)}")
+            outer.append(f"MIN({quote(field + '_' + function)})")
+        else:
+            if column not in inner:
+                inner.append(column)
+            outer.append(f"{function.upper()}({column})")
+
+    query = (
+        f"SELECT {', '.join(outer)} FROM ("
+        f"SELECT {', '.join(inner)} FROM {table} WHERE time >= %s AND time < %s"
+    )
+    if zone:
+        query += " AND zone = %s"
+    if windowed:
+        query += (
+            f" WINDOW bucket_window AS (PARTITION BY {bucket} ORDER BY time, id"
+            " ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING)"
+        )
+    return query + ") GROUP BY bucket ORDER BY bucket"
+
+def run_aggregate(model, columns, width, start, end, zone=None):
+    """
+    Runs the aggregation. The number of buckets is bounded by the caller, so every bucket
+    is fetched at once.
+
+    Returns:
+        dict: The bucket `width`, the `columns` of each bucket (the start of the bucket in
+        seconds since the epoch, then `<field>_<function>` for each aggregate), and `data`,
+        a list of buckets as lists of values.
+    """
+    params = [
+        connection.ops.adapt_datetimefield_value(start),
+        connection.ops.adapt_datetimefield_value(end),
+    ]
+    if zone is not None:
+        params.append(zone)
+
+    with connection.cursor() as cursor:
+        cursor.execute(aggregate_query(model, columns, width, zone is not None), params)
+        rows = cursor.fetchall()
+
+    return {
+        'width': int(width),
+        'columns': ['time'] + [f"{field}_{function}" for field, function in columns],
+        'data': [list(row) for row in rows],
+    }
@@ -0,0 +1,117 @@
+"""
+Lightweight validation for bulk ingest.
+
+Batches posted by the embedded controllers can hold tens of thousands of rows, which is
+far too many to run through serializer field machinery one row at a time. Instead each
+model declares a schema: a mapping of field names to plain parse functions that either
+return the cleaned value or raise `ValueError`.
+"""
+import math
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+
+MAX_ERRORS = 50
+"""
+Number of row errors reported before validation gives up.
+"""
+
+def parse_float(value):
+    """
+    Parses a finite number.
+    """
+    if isinstance(value, bool):
+        raise ValueError("Must be a number.")
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValueError("Must be a number.")
+    if not math.isfinite(value):
+        raise ValueError("Must be finite.")
+    return value
+
+def parse_percentage(value):
+    """
+    Parses a number between 0 and 100.
+    """
+    value = parse_float(value)
+    if not 0.0 <= value <= 100.0:
+        raise ValueError("Must be between 0 and 100.")
+    return value
+
+def parse_time(value):
+    """
+    Parses an ISO 8601 date and time. The embedded controllers send `str(datetime)`, which
+    separates the date and time with a space; that is accepted too. Naive times are taken
+    to be in the server's time zone.
+    """
+    if not isinstance(value, str):
+        raise ValueError("Must be a date and time string.")
+    try:
+        parsed = parse_datetime(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValueError("Must be a date and time in ISO 8601 format.")
+    if settings.USE_TZ and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+def parse_string(max_length):
+    """
+    Returns a parser for non-empty strings of at most `max_length` characters.
+    """
+    def parse(value):
+        if not isinstance(value, str) or not value:
+            raise ValueError("Must be a non-empty string.")
+        if len(value) > max_length:
+            raise ValueError(f"Must be at most {max_length} characters.")
+        return value
+    return parse
+
+def parse_rows(rows, model, schema, optional=()):
+    """
+    Validates `rows` against `schema` and builds unsaved `model` instances from them.
+
+    Keys that are not in the schema are ignored, so clients can send extra context such
+    as the zone or sensor a reading came from. Fields in `optional` may be left out, in
+    which case the model default is used.
+
+    Args:
+        rows (list[dict]): Rows to validate.
+        model (Model): Model to create instances of.
+        schema (dict[str, Callable]): Parse function of each field.
+        optional (tuple[str]): Fields that may be missing.
+
+    Returns:
+        tuple[list[Model], list[dict]]: The instances, and an error for each invalid field as
+        `{"index", "field", "error"}`. Instances are only complete if there are no errors.
+    """
+    objects = []
+    errors = []
+
+    for index, row in enumerate(rows):
+        if not isinstance(row, dict):
+            errors.append({"index": index, "field": None, "error": "Must be an object."})
+        else:
+            values = {}
+            for field, parse in schema.items():
+                value = row.get(field)
+                if value is None:
+                    if field not in optional:
+                        errors.append({"index": index, "field": field, "error": "This field is required."})
+                    continue
+                try:
+                    values[field] = parse(value)
+                except ValueError as e:
+                    errors.append({"index": index, "field": field, "error": str(e)})
+
+            if not errors:
+                objects.append(model(**values))
+
+        if len(errors) >= MAX_ERRORS:
+            break
+
+    return objects, errors
@@ -0,0 +1,143 @@
+"""
+Background deletion of old data entries.
+"""
+import logging
+import time
+
+from threading import Thread, Lock
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+
+LOGGER = logging.getLogger(__name__)
+
+PURGE_CHUNK_SIZE = 5000
+"""
+Rows deleted per statement. Each chunk is its own transaction, so the SQLite write lock is
+only held for one chunk at a time.
+"""
+
+PURGE_PAUSE = 0.05
+"""
+Seconds to wait between chunks so that inserts waiting on the write lock can run.
+"""
+
+class PurgeJob(Thread):
+
+    def __init__(self, model, before=None):
+        """
+        Deletes the entries of `model` recorded at or before `before`, in chunks of
+        consecutive primary keys.
+
+        Args:
+            model (Model): Model to delete entries of.
+            before (datetime, optional): Newest time deleted. If None, every entry is deleted.
+        """
+        Thread.__init__(self, name=f"Purge{model.__name__}", daemon=True)
+        self.model = model
+        self.before = before
+
+        self.state = 'pending'
+        """
+        One of 'pending', 'running', 'done' or 'failed'.
+        """
+        self.total = None
+        """
+        Number of entries that matched when the job started.
+        """
+        self.deleted = 0
+        self.chunks = 0
+        self.started = None
+        self.finished = None
+        self.error = None
+
+    def queryset(self):
+        queryset = self.model.objects.all()
+        if self.before is not None:
+            queryset = queryset.filter(time__lte=self.before)
+        return queryset
+
+    def delete_chunk(self):
+        """
+        Deletes up to `PURGE_CHUNK_SIZE` of the matching entries with the lowest keys.
+
+        Returns:
+            int: Number of entries deleted.
+        """
+        queryset = self.queryset()
+        # the key of the last entry in the chunk bounds a range delete, which avoids
+        # sending thousands of keys back to the database in an IN clause
+        last = queryset.order_by('pk').values_list('pk', flat=True)[PURGE_CHUNK_SIZE - 1:PURGE_CHUNK_SIZE]
+        if last:
+            queryset = queryset.filter(pk__lte=last[0])
+        with transaction.atomic():
+            deleted, _ = queryset.delete()
+        return deleted
+
+    def run(self):
+        self.state = 'running'
+        self.started = timezone.now()
+        try:
+            self.total = self.queryset().count()
+            while True:
+                deleted = self.delete_chunk()
+                self.deleted += deleted
+                self.chunks += 1
+                if deleted < PURGE_CHUNK_SIZE:
+                    break
+                time.sleep(PURGE_PAUSE)
+            self.state = 'done'
+        except Exception as e:
+            LOGGER.exception(f"Purge of {self.model.__name__} failed.")
+            self.state = 'failed'
+            self.error = str(e)
+        finally:
+            self.finished = timezone.now()
+            # each thread opens its own connection
+            connection.close()
+
+    def is_active(self):
+        return self.state in ('pending', 'running')
+
+    def status(self):
+        """
+        Returns the progress of the job.
+        """
+        return {
+            'state': self.state,
+            'before': self.before,
+            'total': self.total,
+            'deleted': self.deleted,
+            'chunks': self.chunks,
+            'started': self.started,
+            'finished': self.finished,
+            'error': self.error,
+        }
+
+_jobs = {}
+"""
+The most recent purge job of each model.
+"""
+_jobs_lock = Lock()
+
+def start_purge(model, before=None):
+    """
+    Starts purging `model` in the background unless a purge of it is already running.
+
+    Returns:
+        tuple[PurgeJob, bool]: The job of the model, and whether it was started by this call.
+    """
+    with _jobs_lock:
+        job = _jobs.get(model)
+        if job is not None and job.is_active():
+            return job, False
+        job = _jobs[model] = PurgeJob(model, before)
+    job.start()
+    return job, True
+
+def get_purge(model):
+    """
+    Returns the most recent purge job of `model`, or None if it was never purged.
+    """
+    return _jobs.get(model)
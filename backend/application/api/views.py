@@ -2,33 +2,118 @@
 from rest_framework import permissions, status, viewsets
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from django.db import transaction
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone as dt_timezone
 
-from application.models import ClimateData, DeviceData
-from application.serializers import ClimateDataSerializer, DeviceDataSerializer
+from application.pagination import KeysetPagination
+from application.models import ClimateData, DeviceData, CLIMATE_ROLLUPS
+from application.rollups import remove_from_rollups, rollup_series, update_rollups
+from application.serializers import ClimateDataSerializer, DeviceDataSerializer, ClimateRollupSerializer
+from application.api.aggregate import run_aggregate, AGGREGATE_FUNCTIONS, NUMERIC_FUNCTIONS, TEXT_FUNCTIONS
+from application.api.purge import start_purge, get_purge
+from application.api.ingest import parse_rows, parse_float, parse_percentage, parse_string, parse_time
 
 
 DEFAULT_TIME_DURATION = timedelta(hours=3)
 
+DEFAULT_BUCKET_WIDTH = 300
+
+MAX_BUCKETS = 20000
+"""
+Most buckets `aggregate` returns for one request.
+"""
+
+BULK_CHUNK_SIZE = 500
+"""
+Rows per INSERT statement in `createbatch`. SQLite limits the number of variables in a statement.
+"""
+
 class TimedDataView(viewsets.ViewSet):
 
     permission_classes = [ permissions.IsAuthenticatedOrReadOnly ]
     model = None
     serializer = None
+    schema = {}
+    """
+    Parse function of each field accepted by `createbatch`.
+    """
+    optional = ('time', 'zone')
+    """
+    Fields of `schema` that may be left out of a row.
+    """
+    rollups = ()
+    """
+    Models summarizing the data at lower resolutions, from the finest to the coarsest.
+    """
+    rollup_serializer = None
+    paginator_class = KeysetPagination
+    aggregate_fields = {}
+    """
+    Functions `aggregate` accepts for each field.
+    """
 
     def list(self, request, *args, **kwargs):
         """
-        Lists all data entries.
+        Lists the data entries of the last `duration` seconds, one page at a time (see `KeysetPagination`).
+
+        If a `points` budget is given and the raw entries would exceed it, entries are served
+        from the finest rollup that fits the budget instead (the coarsest one if none does).
+        Rollup responses are a single page of at most `max_page_size` buckets without a cursor.
+
+        If `since` is given, the raw entries after that cursor are listed instead, whatever their
+        age, so clients can fetch only what was added since their last request.
+
+        If `zone` is given, only entries of that zone are listed.
         """
-        # determine how far backwards to retrieve data
-        duration = int(request.data.get("duration")) if request.data.get("duration") else DEFAULT_TIME_DURATION
+        paginator = self.paginator_class()
+        zone = request.query_params.get("zone")
 
-        # sort the query by time and filter out times outside of `duration`
-        queryset = self.model.objects.order_by('time').filter(time__gte=datetime.now() - duration)
-        serializer = self.serializer(queryset, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        queryset = self.model.objects.all()
+        if zone is not None:
+            queryset = queryset.filter(zone=zone)
+
+        if not request.query_params.get("since"):
+            # determine how far backwards to retrieve data
+            duration = request.query_params.get("duration") or request.data.get("duration")
+            points = request.query_params.get("points")
+            try:
+                duration = timedelta(seconds=int(duration)) if duration else DEFAULT_TIME_DURATION
+                points = int(points) if points else None
+            except ValueError:
+                return Response({'error': "duration and points must be integers."}, status=status.HTTP_400_BAD_REQUEST)
+            if points is not None and points <= 0:
+                return Response({'error': "points must be positive."}, status=status.HTTP_400_BAD_REQUEST)
+            start = timezone.now() - duration
+
+            # filter out times outside of `duration`; the paginator sorts by time
+            queryset = queryset.filter(time__gte=start)
+
+            # a cursor continues paging through raw entries, so rollups are only used for a first page
+            if points and self.rollups and not request.query_params.get("cursor"):
+                rollup = self.select_rollup(queryset, duration, points)
+                if rollup is not None:
+                    # rollup buckets have their own keys, so they are not paged and carry no cursor
+                    rows = rollup_series(rollup, start, zone)[:paginator.max_page_size]
+                    return Response(self.rollup_serializer(rows, many=True).data, status=status.HTTP_200_OK)
+
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = self.serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    def select_rollup(self, queryset, duration, points):
+        """
+        Returns the rollup to serve `duration` of data from in at most `points` entries,
+        or None if the raw entries of `queryset` fit.
+        """
+        if queryset.count() <= points:
+            return None
+        for rollup in self.rollups:
+            if duration.total_seconds() / rollup.width <= points:
+                return rollup
+        return self.rollups[-1]
 
     def retrieve(self, request, pk=None):
         """
@@ -47,7 +132,9 @@ class TimedDataView(viewsets.ViewSet):
         serializer = self.serializer(data=request.data)
         if serializer.is_valid():
 
-            serializer.save()
+            with transaction.atomic():
+                instance = serializer.save()
+                self.created([instance])
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -56,46 +143,136 @@ class TimedDataView(viewsets.ViewSet):
     def createbatch(self, request, *args, **kwargs):
         """
         Creates a batch of data entries.
-        """
 
-        if not request.data.get('batch'):
+        Rows are checked against `schema` instead of the serializer and written in a single
+        transaction with chunked bulk inserts, so large backlogs can be flushed in one request.
+        The capture time of each row is kept; rows without one are stamped with the current time.
+        Nothing is written if any row is invalid.
+        """
+        batch = request.data.get('batch')
+        if not batch or not isinstance(batch, list):
             return Response(status=status.HTTP_400_BAD_REQUEST)
 
-        serializer = self.serializer(data=request.data.get('batch'), many=True)
-        if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        objects, errors = parse_rows(batch, self.model, self.schema, self.optional)
+        if errors:
+            return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
 
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        with transaction.atomic():
+            self.model.objects.bulk_create(objects, batch_size=BULK_CHUNK_SIZE)
+            self.created(objects)
+
+        return Response({'created': len(objects)}, status=status.HTTP_201_CREATED)
 
     @action(detail=False, methods=['delete'])
     def purge(self, request):
         """
-        Removes old entries from the database.
-        """
-        expire_time = int(request.data.get("expire_time")) if request.data.get("expire_time") else DEFAULT_TIME_DURATION
+        Removes entries older than `expire_time` seconds from the database.
 
-        queryset = self.model.objects.filter(time__lte=datetime.now() - expire_time)
-        serializer = self.serializer(queryset, many=True)
-
-        for object in queryset:
-            object.delete()
+        The entries are deleted by a background job in chunks, so ingest continues while a
+        large purge runs. Responds with the status of the job; its progress can be followed
+        with `purgestatus`.
+        """
+        expire_time = request.data.get("expire_time")
+        try:
+            expire_time = int(expire_time) if expire_time else None
+        except (TypeError, ValueError):
+            return Response({'error': "expire_time must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+        if expire_time is not None and expire_time <= 0:
+            return Response({'error': "expire_time must be positive."}, status=status.HTTP_400_BAD_REQUEST)
+        expire_time = timedelta(seconds=expire_time) if expire_time else DEFAULT_TIME_DURATION
 
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return self.start_purge(timezone.now() - expire_time)
 
     @action(detail=False, methods=['delete'])
     def purgeall(self, request):
         """
-        Removes all entries from the database.
+        Removes all entries from the database in the background. See `purge`.
         """
+        return self.start_purge(None)
 
-        queryset = self.model.objects.all()
-        serializer = self.serializer(queryset, many=True)
+    @action(detail=False, methods=['get'])
+    def purgestatus(self, request):
+        """
+        Gets the status of the most recent purge.
+        """
+        job = get_purge(self.model)
+        if job is None:
+            return Response({'state': 'idle'}, status=status.HTTP_200_OK)
+        return Response(job.status(), status=status.HTTP_200_OK)
 
-        for object in queryset:
-            object.delete()
+    def start_purge(self, before):
+        """
+        Starts purging entries recorded at or before `before`, or all entries if it is None.
+        Responds with a conflict if a purge is already running.
+        """
+        job, started = start_purge(self.model, before)
+        if not started:
+            return Response(job.status(), status=status.HTTP_409_CONFLICT)
+        return Response(job.status(), status=status.HTTP_202_ACCEPTED)
 
-        return Response(serializer.data, status=status.HTTP_200_OK)
+    @action(detail=False, methods=['get'])
+    def aggregate(self, request):
+        """
+        Aggregates the entries between `start` and `end` into buckets of `width` seconds.
+
+        Query parameters:
+            start: ISO 8601 time or seconds since the epoch. Defaults to three hours before `end`.
+            end: ISO 8601 time or seconds since the epoch. Defaults to now.
+            width: Bucket width in seconds. Defaults to 300.
+            functions: Comma separated list of avg, min, max, count, first and last. Defaults to avg.
+            fields: Comma separated list of fields to aggregate. Defaults to every field that supports the functions.
+            zone: Only aggregate the entries of this zone. Defaults to all entries.
+        """
+        params = request.query_params
+        try:
+            end = parse_bound(params.get('end')) or timezone.now()
+            start = parse_bound(params.get('start')) or end - DEFAULT_TIME_DURATION
+            width = int(params.get('width', DEFAULT_BUCKET_WIDTH))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if width <= 0 or start >= end:
+            return Response({'error': "Requires a positive width and a start before the end."}, status=status.HTTP_400_BAD_REQUEST)
+        if (end - start).total_seconds() / width > MAX_BUCKETS:
+            return Response({'error': f"Requests more than {MAX_BUCKETS} buckets."}, status=status.HTTP_400_BAD_REQUEST)
+
+        functions = params.get('functions', 'avg').split(',')
+        unknown = [function for function in functions if function not in AGGREGATE_FUNCTIONS]
+        if unknown:
+            return Response({'error': f"Unknown functions {unknown}."}, status=status.HTTP_400_BAD_REQUEST)
+
+        fields = params.get('fields')
+        if fields:
+            fields = fields.split(',')
+            unknown = [field for field in fields if field not in self.aggregate_fields]
+            if unknown:
+                return Response({'error': f"Can't aggregate fields {unknown}."}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            fields = [field for field, allowed in self.aggregate_fields.items() if set(functions) <= set(allowed)]
+
+        columns = []
+        for field in fields:
+            for function in functions:
+                if function not in self.aggregate_fields[field]:
+                    return Response({'error': f"Can't aggregate {field} with {function}."}, status=status.HTTP_400_BAD_REQUEST)
+                columns.append((field, function))
+        if not columns:
+            return Response({'error': "Nothing to aggregate."}, status=status.HTTP_400_BAD_REQUEST)
+
+        zone = params.get('zone')
+        return Response(run_aggregate(self.model, columns, width, start, end, zone), status=status.HTTP_200_OK)
+
+    def created(self, objects):
+        """
+        Called in the transaction that stored new `objects`.
+        """
+        pass
+
+    def deleted(self, instance):
+        """
+        Called in the transaction that deleted `instance`.
+        """
+        pass
 
     def destroy(self, request, pk=None):
         """
@@ -103,18 +280,59 @@ class TimedDataView(viewsets.ViewSet):
         """
         queryset = self.model.objects.all()
         data = get_object_or_404(queryset, pk=pk)
-        data.delete()
+        with transaction.atomic():
+            data.delete()
+            self.deleted(data)
 
         return Response(status=status.HTTP_200_OK)
 
 
 
+def parse_bound(value):
+    """
+    Parses a time given as seconds since the epoch or in ISO 8601 format, or returns None if it is empty.
+    """
+    if not value:
+        return None
+    try:
+        return datetime.fromtimestamp(float(value), tz=dt_timezone.utc)
+    except ValueError:
+        return parse_time(value)
+
 class ClimateDataAPI(TimedDataView):
 
     model = ClimateData
     serializer = ClimateDataSerializer
+    rollups = CLIMATE_ROLLUPS
+    rollup_serializer = ClimateRollupSerializer
+    aggregate_fields = {
+        'temperature': NUMERIC_FUNCTIONS,
+        'humidity': NUMERIC_FUNCTIONS,
+    }
+    schema = {
+        'temperature': parse_float,
+        'humidity': parse_percentage,
+        'time': parse_time,
+        'zone': parse_string(32),
+    }
+
+    def created(self, objects):
+        update_rollups(objects)
+
+    def deleted(self, instance):
+        remove_from_rollups(instance)
 
 class DeviceDataAPI(TimedDataView):
 
     model = DeviceData
-    serializer = DeviceDataSerializer
\ No newline at end of file
+    serializer = DeviceDataSerializer
+    schema = {
+        'device': parse_string(12),
+        'event': parse_string(12),
+        'time': parse_time,
+        'zone': parse_string(32),
+    }
+    aggregate_fields = {
+        'device': TEXT_FUNCTIONS,
+        'event': TEXT_FUNCTIONS,
+    }
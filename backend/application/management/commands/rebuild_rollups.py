@@ -0,0 +1,32 @@
+"""
+Rebuilds the climate rollups from the stored climate data.
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from application.models import ClimateData
+from application.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+
+    help = (
+        "Rebuilds the climate rollups from the stored climate data, e.g. after a backfill or "
+        "after upgrading a database that has data from before rollups were kept. Rollup buckets "
+        "older than the oldest stored reading are kept."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=float, help="Only rebuild the rollups of the last DAYS days.")
+        parser.add_argument("--chunk-size", type=int, default=10000, help="Readings fetched from the database at once.")
+
+    def handle(self, *args, **options):
+        queryset = ClimateData.objects.all()
+        if options["days"]:
+            queryset = queryset.filter(time__gte=timezone.now() - timedelta(days=options["days"]))
+
+        written = rebuild_rollups(queryset, chunk_size=options["chunk_size"])
+        for name, count in written.items():
+            self.stdout.write(f"{name}: {count} buckets")
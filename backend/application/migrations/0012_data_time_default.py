@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:44
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('application', '0011_auto_20211109_2101'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='climatedata',
+            name='time',
+            field=models.DateTimeField(blank=True, default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='devicedata',
+            name='time',
+            field=models.DateTimeField(blank=True, default=django.utils.timezone.now),
+        ),
+    ]
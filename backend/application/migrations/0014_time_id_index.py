@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('application', '0013_climate_rollups'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='climatedata',
+            index=models.Index(fields=['time', 'id'], name='climatedata_time_id'),
+        ),
+        migrations.AddIndex(
+            model_name='devicedata',
+            index=models.Index(fields=['time', 'id'], name='devicedata_time_id'),
+        ),
+    ]
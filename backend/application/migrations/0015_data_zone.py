@@ -0,0 +1,73 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('application', '0014_time_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='climatedata',
+            name='zone',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name='climaterollupday',
+            name='zone',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='climaterolluphour',
+            name='zone',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='climaterollupminute',
+            name='zone',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='devicedata',
+            name='zone',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+        migrations.AlterField(
+            model_name='climaterollupday',
+            name='time',
+            field=models.DateTimeField(),
+        ),
+        migrations.AlterField(
+            model_name='climaterolluphour',
+            name='time',
+            field=models.DateTimeField(),
+        ),
+        migrations.AlterField(
+            model_name='climaterollupminute',
+            name='time',
+            field=models.DateTimeField(),
+        ),
+        migrations.AddIndex(
+            model_name='climatedata',
+            index=models.Index(fields=['zone', 'time', 'id'], name='climatedata_zone_time_id'),
+        ),
+        migrations.AddIndex(
+            model_name='devicedata',
+            index=models.Index(fields=['zone', 'time', 'id'], name='devicedata_zone_time_id'),
+        ),
+        migrations.AddConstraint(
+            model_name='climaterollupday',
+            constraint=models.UniqueConstraint(fields=('time', 'zone'), name='climaterollupday_time_zone'),
+        ),
+        migrations.AddConstraint(
+            model_name='climaterolluphour',
+            constraint=models.UniqueConstraint(fields=('time', 'zone'), name='climaterolluphour_time_zone'),
+        ),
+        migrations.AddConstraint(
+            model_name='climaterollupminute',
+            constraint=models.UniqueConstraint(fields=('time', 'zone'), name='climaterollupminute_time_zone'),
+        ),
+    ]
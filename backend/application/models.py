@@ -2,6 +2,7 @@
 Contains all database models for the application.
 """
 from django.db import models
+from django.utils import timezone
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db.models import CheckConstraint, Q
 
@@ -11,9 +12,18 @@ class ClimateData(models.Model):
     """
     temperature = models.FloatField(max_length=6, blank=False)
     humidity = models.FloatField(max_length=6, blank=False, validators=[MinValueValidator(0.0), MaxValueValidator(100.0)])
-    time = models.DateTimeField(auto_now_add=True, blank=True)
+    # the capture time sent by the client, or the time of insertion if none was sent
+    time = models.DateTimeField(default=timezone.now, blank=True)
+    # the climate zone the reading was taken in, if the client sent one
+    zone = models.CharField(max_length=32, null=True, blank=True)
 
     class Meta:
+        indexes = (
+            # serves time ranges and keyset pagination
+            models.Index(fields=['time', 'id'], name='%(class)s_time_id'),
+            # serves the same for a single zone
+            models.Index(fields=['zone', 'time', 'id'], name='%(class)s_zone_time_id'),
+        )
         constraints = (
             # validates humidity
             CheckConstraint(
@@ -27,4 +37,71 @@ class DeviceData(models.Model):
     """
     device = models.CharField(max_length=12, blank=False)
     event = models.CharField(max_length=12, blank=False)
-    time = models.DateTimeField(auto_now_add=True, blank=True)
\ No newline at end of file
+    # the capture time sent by the client, or the time of insertion if none was sent
+    time = models.DateTimeField(default=timezone.now, blank=True)
+    # the climate zone of the device, if the client sent one
+    zone = models.CharField(max_length=32, null=True, blank=True)
+
+    class Meta:
+        indexes = (
+            # serves time ranges and keyset pagination
+            models.Index(fields=['time', 'id'], name='%(class)s_time_id'),
+            # serves the same for a single zone
+            models.Index(fields=['zone', 'time', 'id'], name='%(class)s_zone_time_id'),
+        )
+
+class ClimateRollup(models.Model):
+    """
+    Summary of the climate data recorded in one zone in one time bucket. Buckets are aligned to
+    the Unix epoch, so daily buckets start at midnight UTC.
+    """
+    width = None
+    """
+    Length of a bucket in seconds.
+    """
+
+    # the start of the bucket
+    time = models.DateTimeField()
+    # the zone of the readings, or an empty string for readings without one
+    zone = models.CharField(max_length=32, blank=True, default='')
+    count = models.IntegerField()
+    temperature_sum = models.FloatField()
+    temperature_min = models.FloatField()
+    temperature_max = models.FloatField()
+    humidity_sum = models.FloatField()
+    humidity_min = models.FloatField()
+    humidity_max = models.FloatField()
+
+    class Meta:
+        abstract = True
+        constraints = (
+            models.UniqueConstraint(fields=['time', 'zone'], name='%(class)s_time_zone'),
+        )
+
+    @property
+    def temperature(self):
+        """
+        The average temperature of the bucket.
+        """
+        return self.temperature_sum / self.count
+
+    @property
+    def humidity(self):
+        """
+        The average humidity of the bucket.
+        """
+        return self.humidity_sum / self.count
+
+class ClimateRollupMinute(ClimateRollup):
+    width = 60
+
+class ClimateRollupHour(ClimateRollup):
+    width = 60 * 60
+
+class ClimateRollupDay(ClimateRollup):
+    width = 24 * 60 * 60
+
+CLIMATE_ROLLUPS = (ClimateRollupMinute, ClimateRollupHour, ClimateRollupDay)
+"""
+Climate rollups from the finest to the coarsest resolution.
+"""
@@ -0,0 +1,109 @@
+"""
+Keyset pagination of time series data.
+"""
+import base64
+
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+CURSOR_HEADER = 'X-Next-Cursor'
+"""
+Response header holding the cursor of the last entry returned.
+"""
+
+MORE_HEADER = 'X-Has-More'
+"""
+Response header that is "true" if there are more entries after the page.
+"""
+
+def encode_cursor(model, time, pk):
+    """
+    Returns an opaque cursor pointing at the entry of `model` with `time` and `pk`.
+    """
+    microseconds = (time - EPOCH) // timedelta(microseconds=1)
+    source = model._meta.model_name
+    return base64.urlsafe_b64encode(f"{source}.{microseconds}.{pk}".encode()).decode().rstrip('=')
+
+def decode_cursor(model, cursor):
+    """
+    Returns the time and key of the entry of `model` that `cursor` points at.
+
+    Raises:
+        ValidationError: If the cursor is malformed or points at an entry of another model,
+            whose keys would mean something else.
+    """
+    try:
+        source, microseconds, pk = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode().split('.')
+        time, pk = EPOCH + timedelta(microseconds=int(microseconds)), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise ValidationError({'cursor': "Invalid cursor."})
+    if source != model._meta.model_name:
+        raise ValidationError({'cursor': f"Cursor belongs to {source}, not {model._meta.model_name}."})
+    return time, pk
+
+class KeysetPagination(BasePagination):
+    """
+    Pages through entries ordered by (time, id), starting after the entry a cursor points at.
+    Unlike offset pagination, each page is a range scan of the (time, id) index, so it costs the
+    same however far into the table it is and entries added meanwhile never shift pages.
+
+    Pages are returned as plain lists. The cursor of the last entry is sent in the `X-Next-Cursor`
+    header, and `X-Has-More` says if another page follows. Passing the cursor back as `cursor`
+    (or `since`) fetches the entries after it, so clients can also poll for new entries.
+    """
+    page_size = 10000
+    max_page_size = 10000
+    """
+    Hard limit on the entries of a page.
+    """
+
+    def get_limit(self, request):
+        limit = request.query_params.get('limit')
+        if not limit:
+            return self.page_size
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValidationError({'limit': "Must be an integer."})
+        return max(1, min(limit, self.max_page_size))
+
+    def get_cursor(self, request):
+        """
+        Returns the cursor the page starts after, or None to start at the beginning.
+        """
+        return request.query_params.get('cursor') or request.query_params.get('since')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        limit = self.get_limit(request)
+        self.cursor = self.get_cursor(request)
+
+        queryset = queryset.order_by('time', 'id')
+        if self.cursor:
+            time, pk = decode_cursor(queryset.model, self.cursor)
+            # the redundant lower bound lets the database seek to the cursor in the index
+            queryset = queryset.filter(Q(time__gt=time) | Q(time=time, id__gt=pk), time__gte=time)
+
+        # fetches one extra entry to find out if there is another page
+        page = list(queryset[:limit + 1])
+        self.has_more = len(page) > limit
+        page = page[:limit]
+
+        if page:
+            self.cursor = encode_cursor(queryset.model, page[-1].time, page[-1].pk)
+        return page
+
+    def get_headers(self):
+        headers = {MORE_HEADER: 'true' if self.has_more else 'false'}
+        if self.cursor:
+            headers[CURSOR_HEADER] = self.cursor
+        return headers
+
+    def get_paginated_response(self, data):
+        return Response(data, headers=self.get_headers())
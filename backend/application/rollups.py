@@ -0,0 +1,214 @@
+"""
+Maintains the climate rollups: summaries of `ClimateData` at fixed resolutions that let
+long time ranges be charted without reading every raw reading.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import connection, transaction
+from django.db.models import Count, ExpressionWrapper, FloatField, Max, Min, Q, Sum
+
+from application.models import ClimateData, CLIMATE_ROLLUPS
+
+
+def bucket_start(time, width):
+    """
+    Returns the start of the `width` second bucket containing `time`.
+    """
+    timestamp = int(time.timestamp())
+    return datetime.fromtimestamp(timestamp - timestamp % width, tz=dt_timezone.utc)
+
+def summarize(readings, width):
+    """
+    Summarizes `readings` into buckets of `width` seconds for each zone.
+
+    Args:
+        readings (Iterable): Objects with `time`, `zone`, `temperature` and `humidity` attributes.
+        width (int): Bucket width in seconds.
+
+    Returns:
+        dict[tuple[datetime, str], list]: Count, temperature sum, min and max, and humidity sum,
+        min and max of each bucket, by the start of the bucket and the zone. Readings without
+        a zone are summarized under an empty string.
+    """
+    buckets = {}
+    for reading in readings:
+        key = (bucket_start(reading.time, width), reading.zone or '')
+        summary = buckets.get(key)
+        if summary is None:
+            buckets[key] = [1, reading.temperature, reading.temperature, reading.temperature,
+                              reading.humidity, reading.humidity, reading.humidity]
+            continue
+        summary[0] += 1
+        summary[1] += reading.temperature
+        summary[2] = min(summary[2], reading.temperature)
+        summary[3] = max(summary[3], reading.temperature)
+        summary[4] += reading.humidity
+        summary[5] = min(summary[5], reading.humidity)
+        summary[6] = max(summary[6], reading.humidity)
+    return buckets
+
+def upsert_sql(model):
+    """
+    Returns the statement that adds a bucket summary to the rollup table of `model`,
+    merging it with the summary already stored for the bucket.
+    """
+    table = connection.ops.quote_name(model._meta.db_table)
+    return (
+        f"INSERT INTO {table} "
+        "(time, zone, count, temperature_sum, temperature_min, temperature_max, humidity_sum, humidity_min, humidity_max) "
+        "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s) "
+        "ON CONFLICT (time, zone) DO UPDATE SET "
+        "count = count + excluded.count, "
+        "temperature_sum = temperature_sum + excluded.temperature_sum, "
+        "temperature_min = CASE WHEN excluded.temperature_min < temperature_min THEN excluded.temperature_min ELSE temperature_min END, "
+        "temperature_max = CASE WHEN excluded.temperature_max > temperature_max THEN excluded.temperature_max ELSE temperature_max END, "
+        "humidity_sum = humidity_sum + excluded.humidity_sum, "
+        "humidity_min = CASE WHEN excluded.humidity_min < humidity_min THEN excluded.humidity_min ELSE humidity_min END, "
+        "humidity_max = CASE WHEN excluded.humidity_max > humidity_max THEN excluded.humidity_max ELSE humidity_max END"
+    )
+
+def update_rollups(readings):
+    """
+    Adds newly stored `readings` to every rollup. Each bucket touched is updated with a single
+    upsert, so the cost depends on the number of buckets the readings span rather than their
+    number. Should run in the transaction that stored the readings.
+
+    Args:
+        readings (list[ClimateData]): The readings.
+    """
+    if not readings:
+        return
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        for model in CLIMATE_ROLLUPS:
+            buckets = summarize(readings, model.width)
+            cursor.executemany(upsert_sql(model), [
+                (connection.ops.adapt_datetimefield_value(start), zone, *summary)
+                for (start, zone), summary in buckets.items()
+            ])
+
+def remove_from_rollups(reading):
+    """
+    Removes a deleted `reading` from every rollup. Its values are subtracted from the counts
+    and sums of its buckets, and buckets left empty are deleted. If the reading was the minimum
+    or maximum of a bucket, they are recomputed from the readings left in the bucket, as long as
+    none of the bucket's readings have been purged. Otherwise the old bounds are kept. Should run
+    in the transaction that deleted the reading.
+
+    Args:
+        reading (ClimateData): The deleted reading.
+    """
+    zone = reading.zone or ''
+    # readings without a zone share the rollups of the empty zone
+    in_zone = Q(zone=zone) | Q(zone__isnull=True) if not zone else Q(zone=zone)
+    with transaction.atomic():
+        for model in CLIMATE_ROLLUPS:
+            start = bucket_start(reading.time, model.width)
+            bucket = model.objects.select_for_update().filter(time=start, zone=zone).first()
+            if bucket is None:
+                continue
+            if bucket.count <= 1:
+                bucket.delete()
+                continue
+
+            bucket.count -= 1
+            bucket.temperature_sum -= reading.temperature
+            bucket.humidity_sum -= reading.humidity
+
+            extremes = (reading.temperature in (bucket.temperature_min, bucket.temperature_max)
+                        or reading.humidity in (bucket.humidity_min, bucket.humidity_max))
+            if extremes:
+                remaining = ClimateData.objects.filter(
+                    in_zone, time__gte=start, time__lt=start + timedelta(seconds=model.width),
+                ).aggregate(
+                    count=Count('id'),
+                    temperature_low=Min('temperature'), temperature_high=Max('temperature'),
+                    humidity_low=Min('humidity'), humidity_high=Max('humidity'),
+                )
+                if remaining['count'] == bucket.count:
+                    bucket.temperature_min = remaining['temperature_low']
+                    bucket.temperature_max = remaining['temperature_high']
+                    bucket.humidity_min = remaining['humidity_low']
+                    bucket.humidity_max = remaining['humidity_high']
+            bucket.save()
+
+def rebuild_rollups(queryset, chunk_size=10000):
+    """
+    Replaces the rollups covering the readings of `queryset` with ones computed from them.
+    Buckets that start before the oldest reading are kept, so summaries of data that was
+    already purged are not lost.
+
+    Args:
+        queryset (QuerySet): The `ClimateData` to summarize.
+        chunk_size (int, optional): Readings fetched from the database at once. Defaults to 10000.
+
+    Returns:
+        dict[str, int]: The number of buckets written to each rollup.
+    """
+    first = queryset.order_by('time').values_list('time', flat=True).first()
+    if first is None:
+        return {model.__name__: 0 for model in CLIMATE_ROLLUPS}
+
+    buckets = {model: {} for model in CLIMATE_ROLLUPS}
+
+    def add(chunk):
+        for model in CLIMATE_ROLLUPS:
+            merge(buckets[model], summarize(chunk, model.width))
+
+    chunk = []
+    for reading in queryset.only('time', 'zone', 'temperature', 'humidity').iterator(chunk_size=chunk_size):
+        chunk.append(reading)
+        if len(chunk) >= chunk_size:
+            add(chunk)
+            chunk = []
+    add(chunk)
+
+    written = {}
+    with transaction.atomic():
+        for model in CLIMATE_ROLLUPS:
+            model.objects.filter(time__gte=bucket_start(first, model.width)).delete()
+            model.objects.bulk_create((
+                model(time=start, zone=zone, count=summary[0],
+                      temperature_sum=summary[1], temperature_min=summary[2], temperature_max=summary[3],
+                      humidity_sum=summary[4], humidity_min=summary[5], humidity_max=summary[6])
+                for (start, zone), summary in buckets[model].items()
+            ), batch_size=500)
+            written[model.__name__] = len(buckets[model])
+    return written
+
+def rollup_series(model, start, zone=None):
+    """
+    Returns the buckets of the rollup `model` starting at or after `start`, oldest first, as
+    dictionaries with the fields of `ClimateRollupSerializer`. The buckets of every zone are
+    combined unless `zone` is given.
+    """
+    queryset = model.objects.filter(time__gte=start)
+    if zone is not None:
+        queryset = queryset.filter(zone=zone)
+    # the annotations can't reuse the names of the fields they are computed from
+    return queryset.values('time').annotate(
+        total=Sum('count'),
+        temperature_avg=ExpressionWrapper(Sum('temperature_sum') / Sum('count'), output_field=FloatField()),
+        temperature_low=Min('temperature_min'),
+        temperature_high=Max('temperature_max'),
+        humidity_avg=ExpressionWrapper(Sum('humidity_sum') / Sum('count'), output_field=FloatField()),
+        humidity_low=Min('humidity_min'),
+        humidity_high=Max('humidity_max'),
+    ).order_by('time')
+
+def merge(buckets, other):
+    """
+    Merges the bucket summaries of `other` into `buckets`.
+    """
+    for key, summary in other.items():
+        current = buckets.get(key)
+        if current is None:
+            buckets[key] = summary
+            continue
+        current[0] += summary[0]
+        current[1] += summary[1]
+        current[2] = min(current[2], summary[2])
+        current[3] = max(current[3], summary[3])
+        current[4] += summary[4]
+        current[5] = min(current[5], summary[5])
+        current[6] = max(current[6], summary[6])
@@ -25,7 +25,7 @@ class ClimateDataSerializer(serializers.ModelSerializer):
     """
     class Meta:
         model = ClimateData
-        fields = ['id', 'temperature', 'humidity', 'time']
+        fields = ['id', 'temperature', 'humidity', 'time', 'zone']
 
 class DeviceDataSerializer(serializers.ModelSerializer):
     """
@@ -33,4 +33,18 @@ class DeviceDataSerializer(serializers.ModelSerializer):
     """
     class Meta:
         model = DeviceData
-        fields = ['id', 'device', 'event', 'time']
\ No newline at end of file
+        fields = ['id', 'device', 'event', 'time', 'zone']
+
+class ClimateRollupSerializer(serializers.Serializer):
+    """
+    Serializer for the climate rollup buckets returned by `rollup_series`. `temperature` and
+    `humidity` are the averages of each bucket, so rollups can be charted like `ClimateData`.
+    """
+    time = serializers.DateTimeField()
+    temperature = serializers.FloatField(source='temperature_avg')
+    humidity = serializers.FloatField(source='humidity_avg')
+    count = serializers.IntegerField(source='total')
+    temperature_min = serializers.FloatField(source='temperature_low')
+    temperature_max = serializers.FloatField(source='temperature_high')
+    humidity_min = serializers.FloatField(source='humidity_low')
+    humidity_max = serializers.FloatField(source='humidity_high')
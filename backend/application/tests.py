@@ -1,3 +1,477 @@
-from django.test import TestCase
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from application.api import purge
+from application.api.views import ClimateDataAPI
+from application.pagination import CURSOR_HEADER, MORE_HEADER
+from application.models import ClimateData, DeviceData, ClimateRollupMinute, ClimateRollupHour, ClimateRollupDay
+from application.rollups import rebuild_rollups
+
+
+class AuthenticatedMixin:
+    """
+    Makes every request of a test as an authenticated user, like the embedded controllers.
+    """
+    def setUp(self):
+        super().setUp()
+        user = User.objects.create_user('controller', password='password')
+        self.client.force_authenticate(user)
+
+    def create_batch(self, rows, endpoint='/api/data/'):
+        return self.client.post(f'{endpoint}createbatch/', {'batch': rows}, format='json')
+
+class CreateBatchTest(AuthenticatedMixin, APITestCase):
+
+    def test_creates_every_row(self):
+        rows = [{'temperature': 70 + i, 'humidity': 50, 'zone': 'left'} for i in range(1200)]
+        response = self.create_batch(rows)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data, {'created': 1200})
+        self.assertEqual(ClimateData.objects.count(), 1200)
+        self.assertEqual(ClimateData.objects.filter(zone='left').count(), 1200)
+
+    def test_creates_device_events(self):
+        response = self.create_batch([{'device': 'heater', 'event': 'ON'}, {'device': 'lamp', 'event': 'OFF'}], '/api/device/')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(list(DeviceData.objects.order_by('id').values_list('device', 'event')), [('heater', 'ON'), ('lamp', 'OFF')])
+
+    def test_invalid_rows_write_nothing(self):
+        rows = [
+            {'temperature': 70, 'humidity': 50},
+            {'temperature': 'warm', 'humidity': 50},
+            {'temperature': 70, 'humidity': 101},
+            {'humidity': 50},
+            [70, 50],
+            {'temperature': 70, 'humidity': 50, 'time': 'yesterday'},
+            {'temperature': 70, 'humidity': 50, 'zone': 'z' * 33},
+        ]
+        response = self.create_batch(rows)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual([(error['index'], error['field']) for error in response.data['errors']], [
+            (1, 'temperature'), (2, 'humidity'), (3, 'temperature'), (4, None), (5, 'time'), (6, 'zone'),
+        ])
+        self.assertEqual(ClimateData.objects.count(), 0)
+
+    def test_rejects_non_finite_numbers(self):
+        response = self.client.post('/api/data/createbatch/', '{"batch": [{"temperature": NaN, "humidity": 50}]}',
+                                    content_type='application/json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(ClimateData.objects.count(), 0)
+
+    def test_requires_a_list(self):
+        for data in ({}, {'batch': []}, {'batch': {'temperature': 70, 'humidity': 50}}):
+            response = self.client.post('/api/data/createbatch/', data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_requires_authentication(self):
+        self.client.force_authenticate(None)
+        response = self.create_batch([{'temperature': 70, 'humidity': 50}])
+
+        self.assertIn(response.status_code, (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN))
+        self.assertEqual(ClimateData.objects.count(), 0)
+
+    def test_keeps_client_times(self):
+        rows = [
+            # sent by the controllers as str(datetime)
+            {'temperature': 70, 'humidity': 50, 'time': '2023-03-01 12:00:00.500000-06:00'},
+            {'temperature': 70, 'humidity': 50, 'time': '2023-07-01T12:00:00Z'},
+            # naive times are in the server's time zone
+            {'temperature': 70, 'humidity': 50, 'time': '2023-07-01 07:00:00'},
+        ]
+        self.create_batch(rows)
+
+        times = list(ClimateData.objects.order_by('id').values_list('time', flat=True))
+        self.assertEqual(times, [
+            datetime(2023, 3, 1, 18, 0, 0, 500000, tzinfo=dt_timezone.utc),
+            datetime(2023, 7, 1, 12, tzinfo=dt_timezone.utc),
+            datetime(2023, 7, 1, 12, tzinfo=dt_timezone.utc),
+        ])
+
+    def test_stamps_rows_without_a_time(self):
+        before = timezone.now()
+        self.create_batch([{'temperature': 70, 'humidity': 50}])
+        after = timezone.now()
+
+        self.assertTrue(before <= ClimateData.objects.get().time <= after)
+
+    def test_single_create_keeps_client_time(self):
+        response = self.client.post('/api/data/', {'temperature': 70, 'humidity': 50, 'time': '2023-07-01T12:00:00Z', 'zone': 'left'}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        reading = ClimateData.objects.get()
+        self.assertEqual(reading.time, datetime(2023, 7, 1, 12, tzinfo=dt_timezone.utc))
+        self.assertEqual(reading.zone, 'left')
+
+@mock.patch.object(purge, 'PURGE_CHUNK_SIZE', 3)
+@mock.patch.object(purge, 'PURGE_PAUSE', 0)
+class PurgeTest(AuthenticatedMixin, APITransactionTestCase):
+    """
+    Purges run on their own thread and database connection, so the data they delete must be committed.
+    """
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(purge._jobs.clear)
+        now = timezone.now()
+        ClimateData.objects.bulk_create(
+            [ClimateData(temperature=70, humidity=50, time=now - timedelta(hours=5)) for _ in range(7)]
+            + [ClimateData(temperature=70, humidity=50, time=now - timedelta(minutes=5)) for _ in range(2)]
+        )
+
+    def wait(self, model=ClimateData):
+        purge.get_purge(model).join(10)
+        return self.client.get('/api/data/purgestatus/' if model is ClimateData else '/api/device/purgestatus/').data
+
+    def test_status_is_idle_before_a_purge(self):
+        self.assertEqual(self.client.get('/api/data/purgestatus/').data, {'state': 'idle'})
+
+    def test_purges_old_entries_in_chunks(self):
+        response = self.client.delete('/api/data/purge/', {'expire_time': 3600}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        job = self.wait()
+        self.assertEqual(job['state'], 'done')
+        self.assertEqual((job['total'], job['deleted'], job['chunks']), (7, 7, 3))
+        self.assertEqual(ClimateData.objects.count(), 2)
+
+    def test_rejects_invalid_expire_times(self):
+        for expire_time in ('abc', '1.5', -3600, [3600]):
+            response = self.client.delete('/api/data/purge/', {'expire_time': expire_time}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, expire_time)
+        self.assertIsNone(purge.get_purge(ClimateData))
+        self.assertEqual(ClimateData.objects.count(), 9)
+
+    def test_purges_everything(self):
+        self.client.delete('/api/data/purgeall/')
+
+        self.assertEqual(self.wait()['deleted'], 9)
+        self.assertEqual(ClimateData.objects.count(), 0)
+
+    def test_only_purges_its_model(self):
+        DeviceData.objects.create(device='heater', event='ON')
+        self.client.delete('/api/device/purgeall/')
+
+        self.assertEqual(self.wait(DeviceData)['deleted'], 1)
+        self.assertEqual(ClimateData.objects.count(), 9)
+
+    def test_rejects_a_second_purge_while_running(self):
+        running = purge.PurgeJob(ClimateData)
+        running.state = 'running'
+        purge._jobs[ClimateData] = running
+
+        response = self.client.delete('/api/data/purgeall/')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(ClimateData.objects.count(), 9)
+
+class RollupTest(AuthenticatedMixin, APITestCase):
+
+    START = datetime(2023, 7, 1, 12, tzinfo=dt_timezone.utc)
+
+    def rows(self, *values, zone=None):
+        """
+        Returns readings of `(seconds after START, temperature)`, all at 50% humidity.
+        """
+        rows = [{'temperature': temp, 'humidity': 50, 'time': (self.START + timedelta(seconds=seconds)).isoformat()} for seconds, temp in values]
+        if zone is not None:
+            for row in rows:
+                row['zone'] = zone
+        return rows
+
+    def buckets(self, model):
+        return list(model.objects.order_by('time', 'zone').values_list(
+            'time', 'zone', 'count', 'temperature_sum', 'temperature_min', 'temperature_max'))
+
+    def test_ingest_updates_every_rollup(self):
+        self.create_batch(self.rows((10, 70), (20, 74), (70, 80), (3700, 60)))
+
+        start = self.START
+        self.assertEqual(self.buckets(ClimateRollupMinute), [
+            (start, '', 2, 144, 70, 74),
+            (start + timedelta(minutes=1), '', 1, 80, 80, 80),
+            (start + timedelta(hours=1, minutes=1), '', 1, 60, 60, 60),
+        ])
+        self.assertEqual(self.buckets(ClimateRollupHour), [
+            (start, '', 3, 224, 70, 80),
+            (start + timedelta(hours=1), '', 1, 60, 60, 60),
+        ])
+        self.assertEqual(self.buckets(ClimateRollupDay), [(datetime(2023, 7, 1, tzinfo=dt_timezone.utc), '', 4, 284, 60, 80)])
+
+    def test_later_batches_merge_into_buckets(self):
+        self.create_batch(self.rows((10, 70)))
+        self.create_batch(self.rows((20, 65), (30, 75)))
+        self.client.post('/api/data/', {'temperature': 72, 'humidity': 50, 'time': (self.START + timedelta(seconds=40)).isoformat()}, format='json')
+
+        self.assertEqual(self.buckets(ClimateRollupMinute), [(self.START, '', 4, 282, 65, 75)])
+
+    def test_zones_have_their_own_buckets(self):
+        self.create_batch(self.rows((10, 70), zone='left') + self.rows((20, 80), zone='right') + self.rows((30, 90)))
+
+        self.assertEqual(self.buckets(ClimateRollupHour), [
+            (self.START, '', 1, 90, 90, 90),
+            (self.START, 'left', 1, 70, 70, 70),
+            (self.START, 'right', 1, 80, 80, 80),
+        ])
+
+    def test_rebuild_matches_incremental_rollups(self):
+        self.create_batch(self.rows(*[(seconds, 60 + seconds % 17) for seconds in range(0, 7200, 13)], zone='left'))
+        self.create_batch(self.rows(*[(seconds, 70 + seconds % 5) for seconds in range(0, 7200, 29)]))
+        incremental = {model: self.buckets(model) for model in (ClimateRollupMinute, ClimateRollupHour, ClimateRollupDay)}
+
+        ClimateRollupMinute.objects.update(count=0)
+        written = rebuild_rollups(ClimateData.objects.all(), chunk_size=100)
+
+        self.assertEqual(written['ClimateRollupMinute'], len(incremental[ClimateRollupMinute]))
+        for model, buckets in incremental.items():
+            rebuilt = self.buckets(model)
+            self.assertEqual(len(rebuilt), len(buckets))
+            for actual, expected in zip(rebuilt, buckets):
+                self.assertEqual(actual[:3], expected[:3])
+                self.assertAlmostEqual(actual[3], expected[3])
+                self.assertEqual(actual[4:], expected[4:])
+
+    def test_rebuild_keeps_buckets_of_purged_data(self):
+        self.create_batch(self.rows((10, 70), (3700, 60)))
+        ClimateData.objects.filter(time__lt=self.START + timedelta(hours=1)).delete()
+
+        rebuild_rollups(ClimateData.objects.all())
+        self.assertEqual(self.buckets(ClimateRollupHour), [
+            (self.START, '', 1, 70, 70, 70),
+            (self.START + timedelta(hours=1), '', 1, 60, 60, 60),
+        ])
+
+    def test_destroy_removes_the_reading_from_rollups(self):
+        self.create_batch(self.rows((10, 70), (20, 80), (30, 75)))
+        hottest = ClimateData.objects.get(temperature=80)
+
+        response = self.client.delete(f'/api/data/{hottest.pk}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.buckets(ClimateRollupMinute), [(self.START, '', 2, 145, 70, 75)])
+
+        for reading in ClimateData.objects.all():
+            self.client.delete(f'/api/data/{reading.pk}/')
+        self.assertEqual(self.buckets(ClimateRollupMinute), [])
+        self.assertEqual(self.buckets(ClimateRollupDay), [])
+
+    def test_destroy_keeps_bounds_of_purged_readings(self):
+        self.create_batch(self.rows((10, 60), (20, 80), (30, 75)))
+        # the coolest reading is purged, but its rollups remain
+        ClimateData.objects.filter(temperature=60).delete()
+
+        self.client.delete(f'/api/data/{ClimateData.objects.get(temperature=80).pk}/')
+        self.assertEqual(self.buckets(ClimateRollupMinute), [(self.START, '', 2, 135, 60, 80)])
+
+class SelectRollupTest(AuthenticatedMixin, APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        # a reading every 30 seconds over the last two hours
+        self.create_batch([
+            {'temperature': 70 + i % 3, 'humidity': 50, 'time': (now - timedelta(seconds=30 * i)).isoformat(), 'zone': 'left' if i % 2 else 'right'}
+            for i in range(240)
+        ])
+
+    def test_selects_the_finest_rollup_that_fits(self):
+        view = ClimateDataAPI()
+        queryset = ClimateData.objects.all()
+        duration = timedelta(hours=3)
+
+        self.assertIsNone(view.select_rollup(queryset, duration, 240))
+        self.assertIs(view.select_rollup(queryset, duration, 200), ClimateRollupMinute)
+        self.assertIs(view.select_rollup(queryset, duration, 100), ClimateRollupHour)
+        self.assertIs(view.select_rollup(queryset, timedelta(days=30), 10), ClimateRollupDay)
+
+    def test_list_serves_raw_entries_within_budget(self):
+        response = self.client.get('/api/data/', {'points': 1000})
+
+        self.assertEqual(len(response.data), 240)
+        self.assertIn('id', response.data[0])
+
+    def test_list_serves_rollups_over_budget(self):
+        response = self.client.get('/api/data/', {'points': 200})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('X-Next-Cursor', response)
+        self.assertEqual(sum(bucket['count'] for bucket in response.data), 240)
+        self.assertLessEqual(len(response.data), 181)
+        times = [bucket['time'] for bucket in response.data]
+        self.assertEqual(times, sorted(times))
+        self.assertEqual(set(response.data[0]), {
+            'time', 'temperature', 'humidity', 'count', 'temperature_min', 'temperature_max', 'humidity_min', 'humidity_max',
+        })
+
+    def test_rollups_filter_by_zone(self):
+        response = self.client.get('/api/data/', {'points': 50, 'zone': 'left'})
+
+        self.assertEqual(sum(bucket['count'] for bucket in response.data), 120)
+
+    def test_rejects_invalid_parameters(self):
+        for params in ({'duration': 'an hour'}, {'points': 'x'}, {'points': 0}, {'points': -5}):
+            response = self.client.get('/api/data/', params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+class AggregateTest(AuthenticatedMixin, APITestCase):
+
+    START = datetime(2023, 7, 1, 12, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        super().setUp()
+        # two readings with the same time are ordered by id
+        values = [(0, 70, 'left'), (100, 72, 'right'), (100, 74, 'left'), (350, 60, 'left'), (599, 66, 'right')]
+        self.create_batch([
+            {'temperature': temp, 'humidity': 50, 'time': (self.START + timedelta(seconds=seconds)).isoformat(), 'zone': zone}
+            for seconds, temp, zone in values
+        ])
+        self.create_batch([
+            {'device': 'heater', 'event': event, 'time': (self.START + timedelta(seconds=seconds)).isoformat()}
+            for seconds, event in ((10, 'ON'), (20, 'OFF'), (400, 'ON'))
+        ], '/api/device/')
+
+    def aggregate(self, endpoint='/api/data/', **params):
+        params.setdefault('start', self.START.timestamp())
+        params.setdefault('end', (self.START + timedelta(minutes=10)).timestamp())
+        return self.client.get(f'{endpoint}aggregate/', params)
+
+    def test_aggregates_into_buckets(self):
+        response = self.aggregate(functions='avg,min,max,count', fields='temperature')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        start = int(self.START.timestamp())
+        self.assertEqual(response.data, {
+            'width': 300,
+            'columns': ['time', 'temperature_avg', 'temperature_min', 'temperature_max', 'temperature_count'],
+            'data': [[start, 72.0, 70.0, 74.0, 3], [start + 300, 63.0, 60.0, 66.0, 2]],
+        })
+
+    def test_first_and_last(self):
+        response = self.aggregate(functions='first,last', fields='temperature', width=600)
+
+        self.assertEqual(response.data['data'], [[int(self.START.timestamp()), 70.0, 66.0]])
+
+        response = self.aggregate(functions='last', fields='temperature', width=120)
+        self.assertEqual([row[1] for row in response.data['data']], [74.0, 60.0, 66.0])
+
+    def test_text_fields(self):
+        response = self.aggregate('/api/device/', functions='count,first,last', fields='event')
+
+        self.assertEqual(response.data['columns'], ['time', 'event_count', 'event_first', 'event_last'])
+        self.assertEqual([row[1:] for row in response.data['data']], [[2, 'ON', 'OFF'], [1, 'ON', 'ON']])
+
+    def test_defaults_to_every_field_supporting_the_functions(self):
+        response = self.aggregate()
+        self.assertEqual(response.data['columns'], ['time', 'temperature_avg', 'humidity_avg'])
+
+        response = self.aggregate('/api/device/', functions='count')
+        self.assertEqual(response.data['columns'], ['time', 'device_count', 'event_count'])
+
+    def test_filters_by_zone(self):
+        response = self.aggregate(functions='count', fields='temperature', zone='right')
+
+        self.assertEqual([row[1] for row in response.data['data']], [1, 1])
+
+    def test_accepts_iso_times(self):
+        response = self.aggregate(functions='count', fields='humidity', start='2023-07-01T12:05:00Z', end='2023-07-01T12:10:00Z')
+
+        self.assertEqual(response.data['data'], [[int(self.START.timestamp()) + 300, 2]])
+
+    def test_rejects_invalid_requests(self):
+        invalid = (
+            {'functions': 'median'},
+            {'fields': 'pressure'},
+            {'fields': 'event'},
+            {'functions': 'avg', 'fields': 'temperature', 'width': 0},
+            {'width': 'wide'},
+            {'start': 'soon'},
+            {'start': self.START.timestamp(), 'end': self.START.timestamp()},
+            {'width': 1, 'start': 0},
+        )
+        for params in invalid:
+            response = self.aggregate(**params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+        response = self.aggregate('/api/device/', functions='avg')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class KeysetPaginationTest(AuthenticatedMixin, APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        # pairs of readings share a time, so pages must break ties by id
+        self.create_batch([
+            {'temperature': i, 'humidity': 50, 'time': (now - timedelta(seconds=60 - i // 2)).isoformat()}
+            for i in range(25)
+        ])
+
+    def page(self, endpoint='/api/data/', **params):
+        params.setdefault('duration', 3600)
+        return self.client.get(endpoint, params)
+
+    def temperatures(self, response):
+        return [entry['temperature'] for entry in response.data]
+
+    def test_pages_follow_the_cursor(self):
+        seen = []
+        cursor = None
+        while True:
+            response = self.page(limit=4, **({'cursor': cursor} if cursor else {}))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen += self.temperatures(response)
+            cursor = response[CURSOR_HEADER]
+            if response[MORE_HEADER] == 'false':
+                break
+        self.assertEqual(seen, list(range(25)))
+
+    def test_single_page(self):
+        response = self.page()
+
+        self.assertEqual(self.temperatures(response), list(range(25)))
+        self.assertEqual(response[MORE_HEADER], 'false')
+        self.assertIn(CURSOR_HEADER, response)
+
+    def test_since_returns_new_entries(self):
+        cursor = self.page()[CURSOR_HEADER]
+
+        response = self.client.get('/api/data/', {'since': cursor})
+        self.assertEqual(response.data, [])
+        self.assertEqual(response[CURSOR_HEADER], cursor)
+
+        # entries added later are found whatever their capture time
+        self.create_batch([{'temperature': 100, 'humidity': 50}, {'temperature': 101, 'humidity': 50}])
+        response = self.client.get('/api/data/', {'since': cursor})
+        self.assertEqual(self.temperatures(response), [100, 101])
+        self.assertNotEqual(response[CURSOR_HEADER], cursor)
+
+    def test_since_ignores_duration(self):
+        cursor = self.page(limit=1)[CURSOR_HEADER]
+        response = self.client.get('/api/data/', {'since': cursor, 'duration': 1})
+
+        self.assertEqual(self.temperatures(response), list(range(1, 25)))
+
+    def test_zone_filter(self):
+        self.create_batch([{'temperature': 200 + i, 'humidity': 50, 'zone': 'left'} for i in range(3)])
+
+        response = self.page(zone='left', limit=2)
+        self.assertEqual(self.temperatures(response), [200, 201])
+        response = self.page(zone='left', cursor=response[CURSOR_HEADER])
+        self.assertEqual(self.temperatures(response), [202])
+
+    def test_rejects_invalid_cursors(self):
+        self.create_batch([{'device': 'heater', 'event': 'ON'}], '/api/device/')
+        device_cursor = self.page('/api/device/')[CURSOR_HEADER]
+
+        for params in ({'cursor': 'garbage'}, {'since': '!!'}, {'cursor': device_cursor}, {'limit': 'ten'}):
+            response = self.page(**params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+    def test_limit_is_clamped(self):
+        self.assertEqual(len(self.page(limit=0).data), 1)
+        self.assertEqual(len(self.page(limit=100000).data), 25)
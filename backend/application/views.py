@@ -7,6 +7,7 @@ from rest_framework import permissions
 
 from application.serializers import UserSerializer, GroupSerializer, ClimateDataSerializer
 from application.models import ClimateData
+from application.pagination import KeysetPagination
 
 
 class UserViewSet(viewsets.ModelViewSet):
@@ -28,8 +29,9 @@ class GroupViewSet(viewsets.ModelViewSet):
 
 class ClimateDataViewSet(viewsets.ModelViewSet):
     """
-    All climate data posted from the embedded device.
+    All climate data posted from the embedded device, paged by `KeysetPagination`.
     """
     queryset = ClimateData.objects.all()
     serializer_class = ClimateDataSerializer
+    pagination_class = KeysetPagination
     permission_classes = [permissions.IsAuthenticatedOrReadOnly ]
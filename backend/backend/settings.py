@@ -29,6 +29,8 @@ DEBUG = True
 # add react application to whitelist
 #CORS_ORIGIN_WHITELIST = ['*']
 CORS_ALLOW_ALL_ORIGINS=True
+# lets the dashboard read the pagination cursor of data listings
+CORS_EXPOSE_HEADERS = ['X-Next-Cursor', 'X-Has-More']
 ALLOWED_HOSTS=["*"]
 
 # global time formatting
@@ -37,6 +39,9 @@ REST_FRAMEWORK = {
     'DATETIME_FORMAT': "%Y-%m-%d %H:%M:%S",
 }
 
+# batches of readings posted by the controllers after an outage can be several megabytes
+DATA_UPLOAD_MAX_MEMORY_SIZE = 32 * 1024 * 1024
+
 WSGI_APPLICATION = "backend.wsgi.application"
 ASGI_APPLICATION = "backend.asgi.application"
 
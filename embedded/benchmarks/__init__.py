@@ -0,0 +1,2 @@
+from .suite import BENCHMARKS, benchmark
+from .runner import measure, run, compare
@@ -0,0 +1,53 @@
+"""
+Runs the embedded microbenchmarks.
+
+Usage:
+    python -m benchmarks [pattern ...] [--json results.json] [--save baseline.json] [--compare baseline.json]
+
+Patterns are shell-style, e.g. `buffer.*`. The exit code is 1 if any benchmark is slower
+than the baseline by more than `--threshold`.
+"""
+import argparse
+import logging
+import sys
+
+from . import runner
+
+def main():
+    parser = argparse.ArgumentParser(prog = "python -m benchmarks", description = "Run the embedded microbenchmarks.")
+    parser.add_argument("patterns", nargs = "*", help = "Only run benchmarks matching these patterns.")
+    parser.add_argument("--repeat", type = int, default = 5, help = "Timed runs per benchmark. The fastest is kept.")
+    parser.add_argument("--min-time", type = float, default = 0.2, help = "Minimum seconds per timed run.")
+    parser.add_argument("--json", help = "Write the results to this file.")
+    parser.add_argument("--save", help = "Save the results as a baseline to this file.")
+    parser.add_argument("--compare", help = "Compare the results against this baseline.")
+    parser.add_argument("--threshold", type = float, default = 0.1, help = "Relative slowdown reported as a regression.")
+    args = parser.parse_args()
+
+    # keep log handlers out of the measurements
+    logging.disable(logging.CRITICAL)
+
+    results = runner.run(args.patterns, repeat = args.repeat, min_time = args.min_time, log = print)
+
+    for path in (args.json, args.save):
+        if path:
+            runner.save(results, path)
+
+    if not args.compare:
+        return 0
+
+    baseline = runner.load(args.compare)
+    rows = runner.compare(results, baseline, threshold = args.threshold)
+    print(f"\nCompared with {args.compare} ({baseline['python']} on {baseline['machine']}):")
+    for row in rows:
+        flag = "  REGRESSION" if row["regression"] else ""
+        print(f"{row['name']:<36} {row['baseline_ns']:>12.1f} -> {row['current_ns']:>12.1f} ns/op {row['change']:>+8.1%}{flag}")
+
+    regressions = [row["name"] for row in rows if row["regression"]]
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+import fnmatch
+import json
+import platform
+import sys
+import timeit
+
+from datetime import datetime
+
+from .suite import BENCHMARKS
+
+def measure(setup, repeat = 5, min_time = 0.2):
+    """
+    Times a benchmark. The number of calls per run is calibrated so each run takes at
+    least `min_time` seconds, and the fastest of `repeat` runs is kept, since slower runs
+    only measure interference from the rest of the system.
+
+    Args:
+        setup (Callable[[], tuple[Callable, int]]): Benchmark setup function.
+        repeat (int, optional): Number of timed runs. Defaults to 5.
+        min_time (float, optional): Minimum seconds per run. Defaults to 0.2.
+
+    Returns:
+        dict: Nanoseconds per operation of the fastest and median runs, and the operations per run.
+    """
+    operation, ops_per_call = setup()
+    timer = timeit.Timer(operation)
+
+    number = 1
+    while True:
+        if timer.timeit(number) >= min_time:
+            break
+        number *= 2
+
+    runs = sorted(timer.repeat(repeat, number))
+    ops = number * ops_per_call
+    return {
+        "ns_per_op": runs[0] / ops * 1e9,
+        "median_ns_per_op": runs[len(runs) // 2] / ops * 1e9,
+        "ops": ops,
+    }
+
+def run(patterns: list = None, repeat = 5, min_time = 0.2, log = None):
+    """
+    Runs the benchmarks whose names match any of `patterns`, or all benchmarks.
+
+    Returns:
+        dict: Machine-readable results, including the environment they were measured in.
+    """
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if patterns and not any(fnmatch.fnmatch(name, pattern) for pattern in patterns):
+            continue
+        results[name] = measure(setup, repeat = repeat, min_time = min_time)
+        if log:
+            log(f"{name:<36} {results[name]['ns_per_op']:>12.1f} ns/op")
+
+    return {
+        "time": datetime.now().isoformat(timespec = "seconds"),
+        "python": sys.version.split()[0],
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+def compare(current: dict, baseline: dict, threshold = 0.1):
+    """
+    Compares results against a baseline.
+
+    Args:
+        current (dict): Results returned by `run`.
+        baseline (dict): Results of an earlier run.
+        threshold (float, optional): Relative slowdown counted as a regression. Defaults to 10%.
+
+    Returns:
+        list[dict]: One entry per benchmark in both results, with its change and whether it regressed.
+    """
+    rows = []
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        change = result["ns_per_op"] / base["ns_per_op"] - 1
+        rows.append({
+            "name": name,
+            "baseline_ns": base["ns_per_op"],
+            "current_ns": result["ns_per_op"],
+            "change": change,
+            "regression": change > threshold,
+        })
+    return rows
+
+def load(path: str):
+    with open(path) as f:
+        return json.load(f)
+
+def save(results: dict, path: str):
+    with open(path, "w") as f:
+        json.dump(results, f, indent = 2)
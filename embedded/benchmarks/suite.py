@@ -0,0 +1,117 @@
+import asyncio
+import json
+
+from utils import Reading, ReadingBuffer, SimulatedClock, SocketConnector
+from utils.now import now
+
+BENCHMARKS = {}
+""" Registered benchmarks, mapping each name to a function that sets it up and returns (operation, operations per call). """
+
+WINDOWS = (30, 300, 3000)
+""" Buffer durations benchmarked, in seconds. With one reading per second this is also the number of entries. """
+
+def benchmark(name: str):
+    """
+    Registers the decorated setup function as the benchmark `name`.
+    """
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+def filled_buffer(window: int):
+    """
+    Returns a buffer of `window` seconds holding one reading per second, and its clock.
+    """
+    clock = SimulatedClock(start = 1_700_000_000)
+    buffer = ReadingBuffer(window, clock = clock)
+    for i in range(window):
+        clock.advance(1)
+        buffer.append_values(75.0 + i % 7, 50.0 + i % 5, clock.time())
+    return buffer, clock
+
+def register_window_benchmarks(window: int):
+
+    @benchmark(f"buffer.append[{window}]")
+    def buffer_append():
+        # steady state: every append evicts the oldest entry
+        buffer, clock = filled_buffer(window)
+        def append():
+            clock.advance(1)
+            buffer.append_values(75.5, 50.5, clock.time())
+        return append, 1
+
+    @benchmark(f"buffer.remove_old_entries[{window}]")
+    def buffer_remove_old_entries():
+        # the clock moves between calls, so each call evicts the oldest entry.
+        # A new entry is appended afterwards to keep the buffer at its steady-state size
+        buffer, clock = filled_buffer(window)
+        def remove_old_entries():
+            clock.advance(1)
+            buffer.remove_old_entries()
+            buffer.append_values(75.5, 50.5, clock.time())
+        return remove_old_entries, 1
+
+    @benchmark(f"tempsensor.get_avg[{window}]")
+    def tempsensor_get_avg():
+        from devices.tempsensor import TempSensor
+        buffer, clock = filled_buffer(window)
+        sensor = TempSensor(4, None, buffer_duration = window, clock = clock)
+        sensor.reading_buff = buffer
+        return sensor.get_avg, 1
+
+for window in WINDOWS:
+    register_window_benchmarks(window)
+
+@benchmark("reading.construct")
+def reading_construct():
+    clock = SimulatedClock(start = 1_700_000_000)
+    return (lambda: Reading(23.4, 51.2, is_fahrenheit = False, convert = True, clock = clock)), 1
+
+@benchmark("reading.construct_raw")
+def reading_construct_raw():
+    return (lambda: Reading(74.12, 51.2, timestamp = 1_700_000_000.0, is_fahrenheit = True, convert = False)), 1
+
+@benchmark("reading.convert")
+def reading_convert():
+    reading = Reading(74.12, 51.2, timestamp = 1_700_000_000.0, is_fahrenheit = True, convert = False)
+    return reading.convert, 1
+
+@benchmark("reading.to_dict_json")
+def reading_to_dict_json():
+    reading = Reading(74.12, 51.2, timestamp = 1_700_000_000.0, is_fahrenheit = True, convert = False)
+    return (lambda: json.dumps(reading.to_dict())), 1
+
+def socket_message():
+    reading = Reading(74.12, 51.2, timestamp = 1_700_000_000.0, is_fahrenheit = True, convert = False)
+    message = reading.to_dict()
+    message.update(sensor = "DHT22", zone = "default")
+    return message
+
+@benchmark("socket.frame")
+def socket_frame():
+    message = socket_message()
+    return (lambda: SocketConnector.frame(message)), 1
+
+@benchmark("socket.send")
+def socket_send():
+    class NullSocket:
+        async def send(self, data):
+            pass
+
+    connector = SocketConnector("ws://localhost", "", "")
+    connector.ws = NullSocket()
+    message = socket_message()
+    loop = asyncio.new_event_loop()
+    batch = 1000
+
+    async def send_batch():
+        for _ in range(batch):
+            await connector._send(message)
+
+    # one event loop iteration per batch, so loop overhead doesn't dominate
+    return (lambda: loop.run_until_complete(send_batch())), batch
+
+@benchmark("now")
+def bench_now():
+    return now, 1
@@ -18,6 +18,9 @@ class Mock_Adafruit_DHT:
 
     DHT22 = DHT22()
 
+    def read(sensor: DHT22, pin: int):
+        return (random() * 10 + 60, random() * 10 + 20)
+
     def read_retry(sensor: DHT22, pin: int):
         return (random() * 10 + 60, random() * 10 + 20)
 
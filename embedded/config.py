@@ -1,10 +1,142 @@
 
 import configparser
+import logging
+import os
+import signal
 
-class Config:
+from threading import Thread, Event, Lock
+from types import MappingProxyType
+
+LOGGER = logging.getLogger()
+
+ZONE_PREFIX = "ZONE "
+""" Prefix of config sections that define a zone, e.g. `[ZONE left]`. """
+
+RESTART_SETTINGS = (
+    "sample_interval", "read_deadline", "max_read_backoff", "sensor_workers", "sensors",
+    "gpio_backend", "gpio_chip", "gpio_verify_interval",
+    "history_enabled", "history_directory", "history_hours",
+    "metrics_enabled", "metrics_host", "metrics_port",
+    "filter_stages", "filter_temp_min", "filter_temp_max", "filter_hum_min", "filter_hum_max",
+    "filter_max_temp_rate", "filter_max_hum_rate", "filter_median_window", "filter_ewma_time_constant",
+    "server_hostname", "server_port", "socket_endpoint", "socket_queue_size", "http_workers",
+    "outbox_enabled", "outbox_path", "outbox_batch_size", "outbox_flush_interval", "outbox_max_size",
+)
+""" Settings that are only read at startup. A reloaded config that changes them is rejected. """
+
+class FrozenConfig:
+    """
+    Base class of config objects that can't be modified once loaded, so a loaded
+    config can be shared between threads and swapped out as a whole.
+    """
+
+    _frozen = False
+
+    def freeze(self):
+        """
+        Makes this object immutable.
+        """
+        object.__setattr__(self, "_frozen", True)
+
+    def __setattr__(self, name, value):
+        if self._frozen:
+            raise AttributeError(f"{type(self).__name__} is immutable. Edit the config file and reload it instead.")
+        super().__setattr__(name, value)
+
+class ZoneConfig(FrozenConfig):
+
+    def __init__(self, zone_id: str, config: configparser.ConfigParser, defaults: "Config", section: str = None):
+        """
+        Settings of a single climate zone: one enclosure with its own sensors, relays,
+        setpoints and day schedule. Any thermostat or schedule setting missing from the
+        zone's section is taken from the global THERMOSTAT and SCHEDULE sections.
+
+        Args:
+            zone_id (str): Identifier of the zone. Included in all data sent from this zone.
+            config (ConfigParser): Parsed config file.
+            defaults (Config): Global settings used for missing values.
+            section (str, optional): Section defining the zone. If None, the zone is built from
+                the legacy GPIO section and uses every configured sensor.
+        """
+        self.id = zone_id
+        """ Identifier of the zone. """
+
+        if section is None:
+            self.heater_gpio = defaults.heater_gpio
+            self.humidifier_gpio = defaults.humidifier_gpio
+            self.lamp_gpio = defaults.lamp_gpio
+            self.sensors = tuple(defaults.sensors.keys())
+        else:
+            self.heater_gpio = config.getint(section, "heater")
+            """ The GPIO pin controlling this zone's heater, in BCM. """
+
+            self.humidifier_gpio = config.getint(section, "humidifier")
+            """ The GPIO pin controlling this zone's humidifier, in BCM. """
+
+            self.lamp_gpio = config.getint(section, "lamp")
+            """ The GPIO pin controlling this zone's lamp, in BCM. """
+
+            self.sensors = tuple(name.strip() for name in config.get(section, "sensors").split(",") if name.strip())
+            """ Names of the sensors in this zone. Their readings are averaged together. """
+
+        section = section or "THERMOSTAT"
+        self.desired_temp = config.getint(section, "desired_temp", fallback = defaults.desired_temp)
+        """ The desired temperature levels in Fahrenheit. """
+
+        self.desired_hum = config.getint(section, "desired_humidity", fallback = defaults.desired_hum)
+        """ The desired humidity level, from 0 to 100. """
+
+        self.temp_range = config.getint(section, "temp_range", fallback = defaults.temp_range)
+        """ Acceptable range from `desired_temp` before a heater is activated. """
+
+        self.hum_range = config.getint(section, "humidity_range", fallback = defaults.hum_range)
+        """ Acceptable range from `desired_hum` before humidifier is activated. """
+
+        self.spray_dur = config.getint(section, "spray_duration", fallback = defaults.spray_dur)
+        """ How long to spray the humidifier for. """
+
+        self.day_start = config.getint(section, "day_start", fallback = defaults.day_start)
+        """ What time to consider daytime, in military hours. """
+
+        self.day_end = config.getint(section, "day_end", fallback = defaults.day_end)
+        """ What time to consider nighttime, in military hours. """
+
+        self.freeze()
+
+    def layout(self):
+        """
+        Returns the settings of this zone that can only change with a restart.
+        """
+        return (self.id, self.heater_gpio, self.humidifier_gpio, self.lamp_gpio, self.sensors)
+
+    def validate(self):
+        """
+        Makes sure the thermostat and schedule settings of this zone are in range.
+
+        Raises:
+            ValueError: If a setting is out of range.
+        """
+        if not 0 <= self.desired_hum <= 100:
+            raise ValueError(f"Zone '{self.id}': desired_humidity must be between 0 and 100.")
+        if self.temp_range < 0 or self.hum_range < 0:
+            raise ValueError(f"Zone '{self.id}': temp_range and humidity_range can't be negative.")
+        if self.spray_dur <= 0:
+            raise ValueError(f"Zone '{self.id}': spray_duration must be positive.")
+        if not (0 <= self.day_start <= 23 and 0 <= self.day_end <= 23):
+            raise ValueError(f"Zone '{self.id}': day_start and day_end must be hours from 0 to 23.")
+
+class Config(FrozenConfig):
 
     def __init__(self, file: str):
+        """
+        Application configuration loaded from an INI file. Once loaded a config is
+        immutable; use `ConfigWatcher` to pick up changes to the file.
+
+        Raises:
+            configparser.Error, ValueError: If the file is missing settings or has invalid values.
+        """
         self.load(file)
+        self.freeze()
 
     def load(self, file: str):
         config = configparser.ConfigParser()
@@ -33,6 +165,51 @@ class Config:
         self.hardware_interval = config.getint("THERMOSTAT", "hardware_interval")
         """ Minimum amount of time to wait between updating hardware power status. """
 
+        # sensor settings
+
+        self.sample_interval = config.getint("SENSOR", "sample_interval", fallback = 2)
+        """ Seconds between sensor samples. The DHT22 supports at most one read every 2 seconds. """
+
+        self.read_deadline = config.getint("SENSOR", "read_deadline", fallback = 6)
+        """ Maximum seconds spent retrying a single sample before it is abandoned. """
+
+        self.max_read_backoff = config.getint("SENSOR", "max_backoff", fallback = 60)
+        """ Maximum seconds between samples while the sensor keeps failing. """
+
+        self.sensor_workers = config.getint("SENSOR", "workers", fallback = 2)
+        """ Number of threads used to read sensors. """
+
+        # filter settings
+
+        self.filter_stages = tuple(
+            name.strip() for name in config.get("FILTER", "stages", fallback = "range, rate, median").split(",") if name.strip()
+        )
+        """ Filter stages each sample passes through before it is buffered, in order. """
+
+        self.filter_temp_min = config.getfloat("FILTER", "temp_min", fallback = -40.0)
+        """ Lowest plausible temperature. Colder samples are rejected. """
+
+        self.filter_temp_max = config.getfloat("FILTER", "temp_max", fallback = 176.0)
+        """ Highest plausible temperature. Hotter samples are rejected. """
+
+        self.filter_hum_min = config.getfloat("FILTER", "humidity_min", fallback = 0.0)
+        """ Lowest plausible humidity. Drier samples are rejected. """
+
+        self.filter_hum_max = config.getfloat("FILTER", "humidity_max", fallback = 100.0)
+        """ Highest plausible humidity. More humid samples are rejected. """
+
+        self.filter_max_temp_rate = config.getfloat("FILTER", "max_temp_rate", fallback = 1.0)
+        """ Maximum plausible temperature change per second. """
+
+        self.filter_max_hum_rate = config.getfloat("FILTER", "max_humidity_rate", fallback = 5.0)
+        """ Maximum plausible humidity change per second. """
+
+        self.filter_median_window = config.getint("FILTER", "median_window", fallback = 5)
+        """ Number of samples the rolling median is taken over. """
+
+        self.filter_ewma_time_constant = config.getfloat("FILTER", "ewma_time_constant", fallback = 10.0)
+        """ Seconds for the moving average to move 63% of the way to a new value. """
+
         # schedule settings
 
         self.day_start = config.getint("SCHEDULE", "day_start")
@@ -52,25 +229,314 @@ class Config:
         self.socket_endpoint = config.get("SERVER", "socket_endpoint")
         """ Websocket endpoint. """
 
+        self.socket_queue_size = config.getint("SERVER", "socket_queue_size", fallback = 100)
+        """ Maximum number of messages waiting to be sent over the websocket before the oldest is dropped. """
+
         self.db_interval = config.getint("SERVER", "data_update_interval")
         """ How often to update the server climate information. """
 
+        self.http_connect_timeout = config.getfloat("SERVER", "connect_timeout", fallback = 3)
+        """ Seconds to wait for an HTTP connection to the server. """
+
+        self.http_read_timeout = config.getfloat("SERVER", "read_timeout", fallback = 5)
+        """ Seconds to wait for the server to respond to an HTTP request. """
+
+        self.http_workers = config.getint("SERVER", "http_workers", fallback = 2)
+        """ Number of worker threads used to send HTTP requests. """
+
         self.device_endpoint = config.get('SERVER', 'device_endpoint')
         """ Server endpoint used to post device information. """
 
         self.climate_endpoint = config.get('SERVER', 'climate_endpoint')
         """ Server endpoint used to post climate information. """
 
+        # outbox settings
+
+        self.outbox_enabled = config.getboolean("OUTBOX", "enabled", fallback = True)
+        """ If True, data is stored locally and sent in batches. If False, data is posted as it is captured. """
+
+        self.outbox_path = config.get("OUTBOX", "path", fallback = "data/outbox.sqlite3")
+        """ Path of the file that data is stored in until the server accepts it. """
+
+        self.outbox_batch_size = config.getint("OUTBOX", "batch_size", fallback = 500)
+        """ Maximum number of entries sent to the server per request. """
+
+        self.outbox_flush_interval = config.getint("OUTBOX", "flush_interval", fallback = 30)
+        """ How often to send stored data to the server, in seconds. """
+
+        self.outbox_max_size = config.getint("OUTBOX", "max_size", fallback = 10 * 1024 * 1024)
+        """ Maximum bytes of data stored in the outbox. The oldest entries are discarded beyond this. """
+
+        # history settings
+
+        self.history_enabled = config.getboolean("HISTORY", "enabled", fallback = True)
+        """ If True, readings are kept in a history file per sensor and reloaded after a restart. """
+
+        self.history_directory = config.get("HISTORY", "directory", fallback = "data/history")
+        """ Directory the history files are kept in. """
+
+        self.history_hours = config.getfloat("HISTORY", "hours", fallback = 24)
+        """ Hours of readings kept in each history file. """
+
+        # metrics settings
+
+        self.metrics_enabled = config.getboolean("METRICS", "enabled", fallback = False)
+        """ If True, metrics are served over HTTP for Prometheus to scrape. """
+
+        self.metrics_host = config.get("METRICS", "host", fallback = "127.0.0.1")
+        """ Address the metrics endpoint listens on. """
+
+        self.metrics_port = config.getint("METRICS", "port", fallback = 9110)
+        """ Port the metrics endpoint listens on. """
+
         # gpio settings
 
-        self.heater_gpio = config.getint("GPIO", "heater")
-        """ The GPIO pin controlling the heater, in BCM. """
+        self.heater_gpio = config.getint("GPIO", "heater", fallback = None)
+        """ The GPIO pin controlling the heater of the default zone, in BCM. Unused if zones are defined. """
+
+        self.humidifier_gpio = config.getint("GPIO", "humidifier", fallback = None)
+        """ The GPIO pin controlling the humidifier of the default zone, in BCM. Unused if zones are defined. """
+
+        self.lamp_gpio = config.getint("GPIO", "lamp", fallback = None)
+        """ The GPIO pin controlling the lamp of the default zone, in BCM. Unused if zones are defined. """
 
-        self.humidifier_gpio = config.getint("GPIO", "humidifier")
-        """ The GPIO pin controlling the humidifier, in BCM. """
+        self.gpio_backend = config.get("GPIO", "backend", fallback = "rpi")
+        """ GPIO backend: "rpi" for RPi.GPIO, "chardev" for the GPIO character device, or "fake" for an in-memory backend. """
 
-        self.lamp_gpio = config.getint("GPIO", "lamp")
-        """ The GPIO pin controlling the lamp, in BCM. """
+        self.gpio_chip = config.get("GPIO", "chip", fallback = "/dev/gpiochip0")
+        """ GPIO chip used by the chardev backend. """
 
-        self.dht_gpio = config.getint("GPIO", "dht22")
+        self.gpio_verify_interval = config.getint("GPIO", "verify_interval", fallback = 60)
+        """ Seconds between read-back checks of the relay pins. 0 disables them. """
+
+        self.dht_gpio = config.getint("GPIO", "dht22", fallback = None)
         """ The GPIO pin reading from the DHT22 sensor, in BCM. """
+
+        self.sensors = MappingProxyType(self.parse_sensors(config.get("SENSOR", "sensors", fallback = "")))
+        """ Names of all DHT22 sensors mapped to their GPIO pins, in BCM. Defaults to the `dht22` pin. """
+
+        # zone settings
+
+        self.zones = tuple(
+            ZoneConfig(section[len(ZONE_PREFIX):].strip(), config, self, section)
+            for section in config.sections() if section.startswith(ZONE_PREFIX)
+        )
+        """ All climate zones. If no zones are defined, a single zone named "default" uses the GPIO section. """
+
+        if not self.zones:
+            self.zones = (ZoneConfig("default", config, self),)
+
+        self.validate()
+
+    def validate(self):
+        """
+        Makes sure all settings are in range and the zones are consistent.
+
+        Raises:
+            ValueError: If the settings are invalid.
+        """
+        if self.buffer_dur <= 0:
+            raise ValueError("buffer_duration must be positive.")
+        if self.hardware_interval < 0 or self.db_interval < 0:
+            raise ValueError("hardware_interval and data_update_interval can't be negative.")
+        if self.sample_interval < 2:
+            raise ValueError("sample_interval must be at least 2 seconds.")
+        if self.history_hours <= 0:
+            raise ValueError("History hours must be positive.")
+        if self.gpio_backend not in ("rpi", "chardev", "fake"):
+            raise ValueError(f"Unknown GPIO backend '{self.gpio_backend}'. Must be rpi, chardev or fake.")
+        for name in self.filter_stages:
+            if name not in ("range", "rate", "median", "ewma"):
+                raise ValueError(f"Unknown filter stage '{name}'. Must be one of range, rate, median or ewma.")
+        if self.filter_median_window < 1 or self.filter_ewma_time_constant <= 0:
+            raise ValueError("median_window and ewma_time_constant must be positive.")
+        for zone in self.zones:
+            zone.validate()
+        self.validate_zones()
+
+    def get_zone(self, zone_id: str):
+        """
+        Returns the settings of the zone `zone_id`, or None if there is no such zone.
+        """
+        for zone in self.zones:
+            if zone.id == zone_id:
+                return zone
+        return None
+
+    def restart_changes(self, other: "Config"):
+        """
+        Returns the names of settings that differ between this config and `other`
+        and can only be changed by restarting.
+        """
+        changes = [name for name in RESTART_SETTINGS if getattr(self, name) != getattr(other, name)]
+        if [zone.layout() for zone in self.zones] != [zone.layout() for zone in other.zones]:
+            changes.append("zones")
+        return changes
+
+    def validate_zones(self):
+        """
+        Makes sure zones only use defined sensors and that no pin is used twice.
+
+        Raises:
+            ValueError: If the zone settings are invalid.
+        """
+        pins = list(self.sensors.values())
+        ids = set()
+        for zone in self.zones:
+            if zone.id in ids:
+                raise ValueError(f"Zone '{zone.id}' is defined more than once.")
+            ids.add(zone.id)
+
+            if not zone.sensors:
+                raise ValueError(f"Zone '{zone.id}' has no sensors.")
+            for name in zone.sensors:
+                if name not in self.sensors:
+                    raise ValueError(f"Zone '{zone.id}' uses undefined sensor '{name}'.")
+            relays = [zone.heater_gpio, zone.humidifier_gpio, zone.lamp_gpio]
+            if None in relays:
+                raise ValueError(f"Zone '{zone.id}' is missing a heater, humidifier or lamp pin.")
+            pins += relays
+
+        duplicates = {pin for pin in pins if pins.count(pin) > 1}
+        if duplicates:
+            raise ValueError(f"GPIO pins {sorted(duplicates)} are used more than once.")
+
+    def parse_sensors(self, value: str):
+        """
+        Parses a comma separated list of `name:pin` pairs. Returns a single sensor on
+        `dht_gpio` if the list is empty.
+        """
+        sensors = {}
+        for entry in value.split(","):
+            if not entry.strip():
+                continue
+            name, _, pin = entry.partition(":")
+            sensors[name.strip()] = int(pin)
+
+        if not sensors:
+            if self.dht_gpio is None:
+                raise ValueError("No sensors are defined. Set `dht22` in the GPIO section or `sensors` in the SENSOR section.")
+            sensors["DHT22"] = self.dht_gpio
+        return sensors
+
+class ConfigWatcher(Thread):
+
+    def __init__(self, file: str, poll_interval = 5):
+        """
+        Holds the current `Config` and reloads it when the file changes or SIGHUP is
+        received. A reloaded config is validated before it replaces the current one,
+        and the replacement is a single reference swap, so readers always see either
+        the old or the new config in full. Settings in `RESTART_SETTINGS` and zone
+        layouts can't change without a restart; a reload that changes them is rejected.
+
+        Args:
+            file (str): Path of the config file.
+            poll_interval (int, optional): Seconds between checks of the file's modification time. Defaults to 5.
+
+        Raises:
+            configparser.Error, ValueError: If the initial config is invalid.
+        """
+        Thread.__init__(self, name = "ConfigWatcher")
+
+        self.daemon = True
+        """ Sets this thread in `daemon` mode so it never keeps the process alive. """
+
+        self.file = file
+        """ Path of the config file. """
+
+        self.poll_interval = poll_interval
+        """ Seconds between checks of the file's modification time. """
+
+        self.mtime = self.get_mtime()
+        """ Modification time of the file when it was last loaded. """
+
+        self.current = Config(file)
+        """ The current config. Replaced, never modified, on reload. """
+
+        self.listeners = []
+        """ Called with (old, new) after each successful reload. """
+
+        self.lock = Lock()
+        """ Serializes reloads. """
+
+        self.term = Event()
+        """ Used to terminate this thread. """
+
+        self.reload_requested = Event()
+        """ Set to reload the config immediately. """
+
+    def get_mtime(self):
+        try:
+            return os.stat(self.file).st_mtime
+        except OSError:
+            return None
+
+    def add_listener(self, listener):
+        """
+        Registers `listener` to be called with the old and new config after each successful reload.
+        """
+        self.listeners.append(listener)
+
+    def request_reload(self, sig = None, frame = None):
+        """
+        Asks this thread to reload the config. Safe to use as a signal handler.
+        """
+        self.reload_requested.set()
+
+    def install_signal_handler(self):
+        """
+        Reloads the config when the process receives SIGHUP. Must be called from the main thread.
+        """
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, self.request_reload)
+
+    def reload(self):
+        """
+        Loads the config file and, if it is valid, makes it the current config.
+
+        Returns:
+            bool: True if the config was replaced.
+        """
+        with self.lock:
+            self.mtime = self.get_mtime()
+            try:
+                new = Config(self.file)
+            except (configparser.Error, ValueError) as e:
+                LOGGER.error(f"Rejected config reload. {type(e).__name__}: {e}")
+                return False
+
+            old = self.current
+            changes = old.restart_changes(new)
+            if changes:
+                LOGGER.error(f"Rejected config reload. These settings require a restart: {', '.join(changes)}")
+                return False
+
+            self.current = new
+            for listener in self.listeners:
+                try:
+                    listener(old, new)
+                except Exception as e:
+                    LOGGER.error(f"Error applying reloaded config: {str(e)}")
+
+        LOGGER.info(f"Reloaded config from {self.file}.")
+        return True
+
+    def run(self):
+        """
+        Reloads the config when requested or when the file's modification time changes,
+        until terminate() is called.
+        """
+        while not self.term.is_set():
+            requested = self.reload_requested.wait(self.poll_interval)
+            self.reload_requested.clear()
+            if self.term.is_set():
+                break
+            if requested or self.get_mtime() != self.mtime:
+                self.reload()
+
+    def terminate(self):
+        """
+        Stops this thread.
+        """
+        self.term.set()
+        self.reload_requested.set()
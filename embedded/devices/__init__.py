@@ -2,3 +2,7 @@ from .tempsensor import TempSensor, Reading
 from .heater import Heater
 from .humidifier import Humidifier
 from .device import RelayDevice
+from .gpio import GPIOController
+from .acquisition import AcquisitionEngine
+
+from .zone import Zone
\ No newline at end of file
@@ -0,0 +1,240 @@
+import logging
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread, Event, Lock
+
+from utils import Reading, Clock, DEFAULT_CLOCK
+
+from .tempsensor import TempSensor, GET_AVG_TIME
+
+LOGGER = logging.getLogger()
+
+class AcquisitionEngine(Thread):
+
+    def __init__(self, sensors: list, workers = 2, clock: Clock = None):
+        """
+        Reads several `TempSensor` objects from a single scheduling thread and a small
+        pool of worker threads, instead of running one thread per sensor. Each sensor keeps
+        its own sampling grid and reading buffer, so every pin still gets at least 2 seconds
+        between reads. The engine dispatches whichever sensor is due next to the pool.
+
+        Args:
+            sensors (list[TempSensor]): Sensors to read. Their threads are never started.
+            workers (int, optional): Number of threads used to read sensors. Defaults to 2.
+            clock (Clock, optional): Clock used to wait for the next sample. Defaults to the system clock.
+        """
+        Thread.__init__(self, name = "AcquisitionEngine")
+
+        self.daemon = True
+        """ Sets this thread in `daemon` mode so it never keeps the process alive. """
+
+        pins = [sensor.pin for sensor in sensors]
+        if len(set(pins)) != len(pins):
+            raise ValueError(f"Each sensor must use a different pin. Got pins {pins}.")
+
+        self.sensors: list[TempSensor] = list(sensors)
+        """ Sensors read by this engine. """
+
+        self.clock = clock or DEFAULT_CLOCK
+        """ Clock used to wait for the next sample. """
+
+        self.executor = ThreadPoolExecutor(max_workers = max(1, min(workers, len(self.sensors))), thread_name_prefix = "Acquisition")
+        """ Worker threads that read the sensors. """
+
+        self.in_flight = set()
+        """ Sensors currently being read by a worker. """
+
+        self.lock = Lock()
+        """ Guards `in_flight`. """
+
+        self.term = Event()
+        """ Used to terminate this thread. """
+
+        self.wakeup = Event()
+        """ Set when a worker finishes, so the next due sensor is recalculated. """
+
+        self.updated = set()
+        """ Names of sensors that have taken a sample since `wait_for_update` last returned. Guarded by `lock`. """
+
+        self.update_event = Event()
+        """ Set when `updated` is not empty, or when the engine is terminated. """
+
+    @classmethod
+    def create(cls, pins: dict, db, workers = 2, clock: Clock = None, filters = None, history = None, **kwargs):
+        """
+        Creates an engine for named sensors, staggering their sampling grids evenly
+        across one sample interval.
+
+        Args:
+            pins (dict[str, int]): Sensor names mapped to their GPIO data pins.
+            db (Database): `Database` object sensors publish data to.
+            workers (int, optional): Number of threads used to read sensors. Defaults to 2.
+            clock (Clock, optional): Clock shared by the engine and its sensors. Defaults to the system clock.
+            filters (Callable[[], FilterPipeline], optional): Creates the filter pipeline of each sensor. Defaults to no filtering.
+            history (Callable[[str, bool], HistoryFile], optional): Opens the history file of the sensor with the given name,
+                storing temperatures in Fahrenheit if the second argument is True. Defaults to no history.
+            **kwargs: Passed to each `TempSensor`.
+        """
+        interval = kwargs.get("sample_interval", 2)
+        use_fahrenheit = kwargs.get("use_fahrenheit", True)
+        sensors = [
+            TempSensor(pin, db, clock = clock, name = name, offset = index * interval / len(pins),
+                       filters = filters() if filters else None, history = history(name, use_fahrenheit) if history else None, **kwargs)
+            for index, (name, pin) in enumerate(pins.items())
+        ]
+        return cls(sensors, workers = workers, clock = clock)
+
+    def get_sensor(self, name: str):
+        """
+        Returns the sensor named `name`, or None if there isn't one.
+        """
+        for sensor in self.sensors:
+            if sensor.sensor_name == name:
+                return sensor
+        return None
+
+    def available(self):
+        """
+        Returns true if any sensor has data in its buffer.
+        """
+        return any(sensor.available() for sensor in self.sensors)
+
+    def get_avg(self, names: list = None):
+        """
+        Returns a `Reading` containing the average of all readings in all sensor buffers.
+        Every reading is weighted equally, so a sensor that is failing contributes less.
+        The returned time is the latest time of any sensor.
+
+        Args:
+            names (list[str], optional): Only average the sensors with these names. Defaults to all sensors.
+
+        Returns:
+            Reading, None: Averaged reading if any sensor has data. None otherwise.
+        """
+        start = time.perf_counter()
+        count = 0
+        temp_sum = 0.0
+        hum_sum = 0.0
+        latest = None
+        is_fahrenheit = True
+
+        for sensor in self.sensors:
+            if names is not None and sensor.sensor_name not in names:
+                continue
+            n, t, h, timestamp, unit = sensor.reading_buff.totals()
+            count += n
+            temp_sum += t
+            hum_sum += h
+            if timestamp is not None and (latest is None or timestamp > latest):
+                latest = timestamp
+                is_fahrenheit = unit
+
+        average = None
+        if count > 0:
+            average = Reading(temp_sum / count, hum_sum / count, timestamp = latest, is_fahrenheit = is_fahrenheit, convert = False, clock = self.clock)
+        GET_AVG_TIME.labels(scope = "zone").observe(time.perf_counter() - start)
+        return average
+
+    def get_averages(self):
+        """
+        Returns the average reading of each sensor.
+
+        Returns:
+            dict[str, Reading]: Sensor names mapped to their average readings, or None if a sensor has no data.
+        """
+        return {sensor.sensor_name: sensor.get_avg() for sensor in self.sensors}
+
+    def send_to_database(self, reading: Reading):
+        """
+        Sends a Reading object to the backend database for storage.
+        """
+        self.sensors[0].send_to_database(reading)
+
+    def _sample(self, sensor: TempSensor):
+        """
+        Samples `sensor` and publishes its new average. Runs on a worker thread.
+        """
+        sampled = False
+        try:
+            sampled = sensor.sample() is not None
+            sensor.publish()
+        except Exception as e:
+            LOGGER.error(f"Error sampling {sensor.sensor_name}: {str(e)}")
+        finally:
+            with self.lock:
+                self.in_flight.discard(sensor)
+                if sampled:
+                    self.updated.add(sensor.sensor_name)
+                    self.update_event.set()
+            self.wakeup.set()
+
+    def wait_for_update(self, timeout: float = None):
+        """
+        Blocks until at least one sensor has a new sample in its buffer, the timeout
+        passes, or the engine is terminated.
+
+        Args:
+            timeout (float, optional): Maximum seconds to wait. Waits indefinitely if None.
+
+        Returns:
+            set[str]: Names of sensors with new samples since the last call. Empty on timeout or termination.
+        """
+        if timeout is None:
+            self.update_event.wait()
+        else:
+            self.clock.wait(self.update_event, timeout)
+
+        with self.lock:
+            updated, self.updated = self.updated, set()
+            if not self.term.is_set():
+                self.update_event.clear()
+        return updated
+
+    def next_sensor(self):
+        """
+        Returns the idle sensor whose next sample is due soonest, or None if all sensors are being read.
+        """
+        with self.lock:
+            idle = [sensor for sensor in self.sensors if sensor not in self.in_flight]
+        if not idle:
+            return None
+        return min(idle, key = lambda sensor: sensor.scheduler.next_time)
+
+    def run(self):
+        """
+        Dispatches each sensor to the worker pool as its sample comes due.
+        Runs indefinitely until terminate() is called.
+        """
+        while not self.term.is_set():
+            sensor = self.next_sensor()
+            delay = None if sensor is None else sensor.scheduler.delay()
+
+            if delay is None or delay > 0:
+                # wait for the sensor to come due, or for a worker to finish
+                if delay is None:
+                    self.wakeup.wait()
+                else:
+                    self.clock.wait(self.wakeup, delay)
+                self.wakeup.clear()
+                continue
+
+            with self.lock:
+                self.in_flight.add(sensor)
+            self.executor.submit(self._sample, sensor)
+
+        self.executor.shutdown(wait = False)
+        for sensor in self.sensors:
+            sensor.log_stats()
+
+    def terminate(self, sig, frame):
+        """
+        Stops this thread and any sample in progress, and closes the history files of the sensors.
+        """
+        print("Terminating acquisition engine.")
+        for sensor in self.sensors:
+            sensor.term.set()
+            sensor.close()
+        self.term.set()
+        self.wakeup.set()
+        self.update_event.set()
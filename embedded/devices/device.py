@@ -1,18 +1,24 @@
 import logging
 
-from time import sleep
-from threading import Thread
+from threading import Lock
 
 from utils import Database
+from utils.metrics import REGISTRY
+from utils.timers import TimerScheduler
 
+from .gpio import GPIOController
 from .relay import Relay
 
 
 LOGGER = logging.getLogger()
 
+TOGGLES = REGISTRY.counter("climate_relay_toggles_total", "Times each relay device was switched.", ("device", "zone"))
+RELAY_ON = REGISTRY.gauge("climate_relay_on", "1 if the relay device is on, 0 otherwise.", ("device", "zone"))
+
 class RelayDevice:
 
-    def __init__(self, pin: int, database: Database, name = "Device", normally_closed = True):
+    def __init__(self, pin: int, database: Database, name = "Device", normally_closed = True, zone: str = None,
+                 timers: TimerScheduler = None, gpio: GPIOController = None):
         """
         Class to control a relay-controlled device.
 
@@ -22,10 +28,31 @@ class RelayDevice:
             normally_closed (bool, optional): If True, the relay for this device is normally closed i.e. turns off when its GPIO is activated.
                                     If False, the relay for this device is normally open i.e. turns on when its GPIO is activated.
                                     Defaults to True.
+            zone (str, optional): Identifier of the zone this device belongs to. Included in its events if set.
+            timers (TimerScheduler, optional): Scheduler used to turn the device off after a timed activation.
+                Required to use `on_timed`.
+            gpio (GPIOController, optional): Controller the relay is driven through. Defaults to a controller shared by all relays.
         """
-        self.relay = Relay(pin, normally_closed = normally_closed)
+        self.relay = Relay(pin, normally_closed = normally_closed, gpio = gpio)
         self.name = name
         self.db = database
+        self.zone = zone
+        self.timers = timers
+
+        self.lock = Lock()
+        """ Makes switching the relay and publishing its event atomic, since timers switch devices from their own thread. """
+
+        labels = {"device": name, "zone": zone or ""}
+        self.toggles = TOGGLES.labels(**labels)
+        """ Counts the times this device was switched. """
+        RELAY_ON.labels(**labels).set_function(lambda: int(self.is_on()))
+
+    @property
+    def label(self):
+        """
+        Name of this device, including its zone if set.
+        """
+        return self.name if self.zone is None else f"{self.name} ({self.zone})"
 
     def is_on(self):
         """
@@ -34,42 +61,54 @@ class RelayDevice:
         return self.relay.is_on()
 
     def send_event(self, event):
-
+        """
+        Publishes a device event, timestamped now. This never blocks on the network;
+        events are shipped to the database in batches.
+        """
         data = {
             "device": self.name,
             "event": event,
+            "time": str(self.db.clock.now()),
         }
-        self.db.send_device_data(data)
+        if self.zone is not None:
+            data["zone"] = self.zone
+        self.db.publish_device_event(data)
 
     def on(self):
         """
         Turns device on.
         """
-        if not self.is_on():
-            LOGGER.info(f"Activating {self.name}.")
+        with self.lock:
+            if self.is_on():
+                return
+            LOGGER.info(f"Activating {self.label}.")
             self.relay.on()
+            self.toggles.inc()
             self.send_event("ON")
 
     def off(self):
         """
         Turns device off.
         """
-        if self.is_on():
-            LOGGER.info(f"Deactivating {self.name}.")
+        with self.lock:
+            if not self.is_on():
+                return
+            LOGGER.info(f"Deactivating {self.label}.")
             self.relay.off()
+            self.toggles.inc()
             self.send_event("OFF")
 
-    def _activate_timed(self, activation_time):
+    def on_timed(self, activation_time):
         """
-        Activates the device for `activation_time` seconds.
+        Activates the device for `activation_time` seconds. If a timed activation is
+        already in progress, it is extended to end `activation_time` seconds from now
+        when that is later than its current end.
         """
         self.on()
-        sleep(activation_time)
-        self.off()
+        self.timers.schedule(self, activation_time, self.off)
 
-    def on_timed(self, activation_time):
+    def cancel_timed(self):
         """
-        Activates the device for `activation_time` seconds in a separate thread.
+        Cancels a timed activation in progress, leaving the device in its current state.
         """
-        t = Thread(target = self._activate_timed, args = [activation_time])
-        t.start()
\ No newline at end of file
+        self.timers.cancel(self)
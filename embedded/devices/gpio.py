@@ -0,0 +1,309 @@
+import atexit
+import logging
+import threading
+
+from collections import Counter
+from contextlib import contextmanager
+
+LOGGER = logging.getLogger()
+
+LOW = 0
+HIGH = 1
+
+class GPIOBackend:
+    """
+    Interface to the hardware pins. Backends only move levels to and from the pins;
+    `GPIOController` decides when to touch them.
+    """
+
+    name = "backend"
+
+    def setup_output(self, pin: int, level: int):
+        """
+        Configures `pin` as an output driven to `level`.
+        """
+        raise NotImplementedError()
+
+    def write(self, pin: int, level: int):
+        """
+        Drives `pin` to `level`.
+        """
+        raise NotImplementedError()
+
+    def write_many(self, levels: dict):
+        """
+        Drives several pins at once. Backends that can't update pins together write them one at a time.
+        """
+        for pin, level in levels.items():
+            self.write(pin, level)
+
+    def read(self, pin: int):
+        """
+        Returns the level `pin` is driven to, read back from the hardware.
+        """
+        raise NotImplementedError()
+
+    def cleanup(self):
+        """
+        Releases the pins.
+        """
+        pass
+
+class RPiBackend(GPIOBackend):
+
+    name = "rpi"
+
+    def __init__(self, module):
+        """
+        Backend using the `RPi.GPIO` module, with BCM pin numbers.
+
+        Args:
+            module (module): The `RPi.GPIO` module.
+        """
+        self.GPIO = module
+        self.GPIO.setwarnings(False)
+        self.GPIO.setmode(self.GPIO.BCM)
+        atexit.register(self.cleanup)
+
+    def setup_output(self, pin, level):
+        self.GPIO.setup(pin, self.GPIO.OUT, initial = level)
+
+    def write(self, pin, level):
+        self.GPIO.output(pin, level)
+
+    def write_many(self, levels):
+        # RPi.GPIO accepts lists, so all pins are written in a single call
+        pins = list(levels.keys())
+        self.GPIO.output(pins, [levels[pin] for pin in pins])
+
+    def read(self, pin):
+        return self.GPIO.input(pin)
+
+    def cleanup(self):
+        self.GPIO.cleanup()
+
+class CharDevBackend(GPIOBackend):
+
+    name = "chardev"
+
+    def __init__(self, chip = "/dev/gpiochip0", consumer = "climate-controller"):
+        """
+        Backend using the Linux GPIO character device through libgpiod's Python bindings
+        (v1 API, the `python3-libgpiod` package). Unlike the deprecated sysfs interface used by
+        `RPi.GPIO`, lines requested this way are released automatically if the process dies.
+
+        Args:
+            chip (str, optional): GPIO chip device. Defaults to "/dev/gpiochip0".
+            consumer (str, optional): Name the lines are requested under. Defaults to "climate-controller".
+        """
+        import gpiod
+
+        self.gpiod = gpiod
+        self.chip = gpiod.Chip(chip)
+        self.consumer = consumer
+        self.lines = {}
+        """ Requested line of each pin. """
+        atexit.register(self.cleanup)
+
+    def setup_output(self, pin, level):
+        line = self.chip.get_line(pin)
+        line.request(consumer = self.consumer, type = self.gpiod.LINE_REQ_DIR_OUT, default_vals = [level])
+        self.lines[pin] = line
+
+    def write(self, pin, level):
+        self.lines[pin].set_value(level)
+
+    def read(self, pin):
+        return self.lines[pin].get_value()
+
+    def cleanup(self):
+        for line in self.lines.values():
+            line.release()
+        self.lines.clear()
+
+class FakeBackend(GPIOBackend):
+
+    name = "fake"
+
+    def __init__(self):
+        """
+        In-memory backend for tests and machines without GPIO. Reading a pin returns
+        the level last written to it.
+        """
+        self.levels = {}
+        """ Level of each pin. """
+
+        self.writes = 0
+        """ Number of backend calls that wrote pins. """
+
+    def setup_output(self, pin, level):
+        self.levels[pin] = level
+
+    def write(self, pin, level):
+        self.writes += 1
+        self.levels[pin] = level
+
+    def write_many(self, levels):
+        self.writes += 1
+        self.levels.update(levels)
+
+    def read(self, pin):
+        return self.levels.get(pin, LOW)
+
+def create_backend(name = "rpi", chip = "/dev/gpiochip0"):
+    """
+    Creates the GPIO backend `name`. If `rpi` is requested but `RPi.GPIO` isn't
+    installed, an in-memory backend is used instead.
+
+    Args:
+        name (str, optional): One of "rpi", "chardev" or "fake". Defaults to "rpi".
+        chip (str, optional): GPIO chip used by the chardev backend. Defaults to "/dev/gpiochip0".
+    """
+    if name == "rpi":
+        try:
+            import RPi.GPIO
+        except (ImportError, ModuleNotFoundError, RuntimeError):
+            print("Warning: Using in-memory GPIO subsystem.")
+            return FakeBackend()
+        return RPiBackend(RPi.GPIO)
+    if name == "chardev":
+        return CharDevBackend(chip)
+    if name == "fake":
+        return FakeBackend()
+    raise ValueError(f"Unknown GPIO backend '{name}'.")
+
+class GPIOController:
+
+    def __init__(self, backend: GPIOBackend = None):
+        """
+        Keeps a shadow register of the level of every output pin, so reading a pin's state
+        is a memory read rather than a hardware call. Writes go to the backend only when a
+        pin's level changes, and writes made inside `batch()` are sent together when the
+        batch ends. `verify()` reads the pins back from the hardware and restores any pin
+        that doesn't match the shadow register.
+
+        Args:
+            backend (GPIOBackend, optional): Hardware backend. Defaults to RPi.GPIO if installed, an in-memory backend otherwise.
+        """
+        self.backend = backend or create_backend()
+        """ Hardware backend. """
+
+        self.levels = {}
+        """ Shadow register: the level each output pin should be at. """
+
+        self.lock = threading.RLock()
+        """ Guards the shadow register and calls to the backend. """
+
+        self.local = threading.local()
+        """ Holds the pending writes of a batch in progress on each thread. """
+
+        self.unflushed = Counter()
+        """ Pins with writes waiting in a batch, on any thread. Their hardware level is expected to lag the shadow register. """
+
+        self.mismatches = 0
+        """ Number of pins found at the wrong level by `verify`. """
+
+    def setup_output(self, pin: int, level = LOW):
+        """
+        Configures `pin` as an output at `level`.
+        """
+        with self.lock:
+            if pin not in self.levels:
+                self.backend.setup_output(pin, level)
+                self.levels[pin] = level
+
+    def write(self, pin: int, level: int):
+        """
+        Sets `pin` to `level`. Inside a batch, the hardware is updated when the batch ends.
+        """
+        level = HIGH if level else LOW
+        pending = getattr(self.local, "pending", None)
+        with self.lock:
+            if self.levels.get(pin) == level:
+                return
+            self.levels[pin] = level
+            if pending is not None:
+                if pin not in pending:
+                    self.unflushed[pin] += 1
+                pending[pin] = level
+                return
+            self.backend.write(pin, level)
+
+    def read(self, pin: int):
+        """
+        Returns the level of `pin` from the shadow register. Never touches the hardware.
+        """
+        return self.levels.get(pin, LOW)
+
+    @contextmanager
+    def batch(self):
+        """
+        Collects writes made by this thread and sends them to the backend in one call when
+        the block exits. Nested batches are merged into the outermost one.
+        """
+        if getattr(self.local, "pending", None) is not None:
+            yield
+            return
+
+        self.local.pending = {}
+        try:
+            yield
+        finally:
+            pending, self.local.pending = self.local.pending, None
+            if pending:
+                with self.lock:
+                    try:
+                        self.backend.write_many(pending)
+                    finally:
+                        self.unflushed -= Counter(pending.keys())
+
+    def verify(self):
+        """
+        Reads every output pin back from the hardware. Pins that don't match the shadow
+        register, e.g. after a failed write or interference from another process, are
+        driven back to the level they should be at. Pins with writes waiting in a batch
+        are skipped, since the hardware hasn't been told their new level yet.
+
+        Returns:
+            list[int]: Pins that were restored.
+        """
+        restored = []
+        with self.lock:
+            for pin, level in self.levels.items():
+                if self.unflushed[pin]:
+                    continue
+                actual = HIGH if self.backend.read(pin) else LOW
+                if actual != level:
+                    self.backend.write(pin, level)
+                    restored.append(pin)
+        if restored:
+            self.mismatches += len(restored)
+            LOGGER.warning(f"GPIO read-back found pins {restored} at the wrong level. Restored them.")
+        return restored
+
+    def verify_every(self, timers, interval: float):
+        """
+        Verifies the pins every `interval` seconds using `timers`.
+        """
+        def run():
+            try:
+                self.verify()
+            finally:
+                timers.schedule(self, interval, run)
+        timers.schedule(self, interval, run)
+
+    def cleanup(self):
+        self.backend.cleanup()
+
+_default_controller = None
+_default_lock = threading.Lock()
+
+def default_controller():
+    """
+    Returns a controller shared by relays that aren't given one, created on first use.
+    """
+    global _default_controller
+    with _default_lock:
+        if _default_controller is None:
+            _default_controller = GPIOController()
+        return _default_controller
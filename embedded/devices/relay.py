@@ -1,14 +1,12 @@
-import atexit
 import logging
-from conditional_dependencies.gpio import GPIO
+
+from .gpio import GPIOController, LOW, HIGH, default_controller
 
 LOGGER = logging.getLogger()
-GPIO.setmode(GPIO.BCM)
-atexit.register(GPIO.cleanup)
 
 class Relay:
 
-    def __init__(self, relay_pin, normally_closed = True):
+    def __init__(self, relay_pin, normally_closed = True, gpio: GPIOController = None):
         """
         Controls a GPIO-controlled relay module.
 
@@ -17,34 +15,33 @@ class Relay:
             normally_closed (bool, optional): If True, voltage initially starts low and voltage is applied to close the relay.
                                             If False, voltage initially starts high and is cut to close the relay.
                                             Defaults to True.
+            gpio (GPIOController, optional): Controller the pin is driven through. Defaults to a controller shared by all relays.
         """
         self.pin = relay_pin
         self.normally_closed = normally_closed
+        self.gpio = gpio or default_controller()
 
         if self.normally_closed:
-            self.ON = GPIO.LOW
-            self.OFF = GPIO.HIGH
+            self.ON = LOW
+            self.OFF = HIGH
         else:
-            self.ON = GPIO.HIGH
-            self.OFF = GPIO.LOW
+            self.ON = HIGH
+            self.OFF = LOW
 
-        GPIO.setup(self.pin, GPIO.OUT)
+        self.gpio.setup_output(self.pin, LOW)
 
     def is_on(self):
         """
-        Returns the current state of the relay.
+        Returns the current state of the relay. This reads the controller's shadow register, not the hardware.
 
         Returns:
             bool: True if self.normally_open is True and GPIO is active, or if self.normally_open is False and GPIO is inactive.
                   False if self.normally_open is True and GPIO is inactive, or if self.normally_open is False and GPIO is active.
         """
-        pin_state = bool(GPIO.input(self.pin))
-        if self.normally_closed:
-            return not pin_state
-        return pin_state
+        return self.gpio.read(self.pin) == self.ON
 
     def on(self):
-        GPIO.output(self.pin, self.ON)
+        self.gpio.write(self.pin, self.ON)
 
     def off(self):
-        GPIO.output(self.pin, self.OFF)
+        self.gpio.write(self.pin, self.OFF)
@@ -1,25 +1,49 @@
 import logging
+import time
 
 from threading import Thread, Event
-from utils import Reading, Database, SocketConnector
+from utils import Reading, Database, SocketConnector, Clock, DEFAULT_CLOCK
+from utils.sample_scheduler import SampleScheduler
+from utils.filters import FilterPipeline
+from utils.history import HistoryFile
+from utils.metrics import REGISTRY
 from conditional_dependencies.adafruit_dht import Adafruit_DHT
 
 LOGGER = logging.getLogger()
 
+READ_LATENCY = REGISTRY.histogram("climate_sensor_read_seconds", "Time taken by each sensor sample, including retries.", [], ("sensor",))
+READ_RETRIES = REGISTRY.histogram("climate_sensor_read_retries", "Retries needed by each sensor sample.", [], ("sensor",))
+SAMPLES = REGISTRY.counter("climate_sensor_samples_total", "Sensor samples by outcome.", ("sensor", "result"))
+BUFFER_SIZE = REGISTRY.gauge("climate_sensor_buffer_size", "Readings in each sensor's buffer.", ("sensor",))
+GET_AVG_TIME = REGISTRY.histogram("climate_get_avg_seconds", "Time taken to average buffered readings.",
+                                  [1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 1e-2], ("scope",))
+
 class TempSensor(Thread):
 
-    def __init__(self, pin: int, db: Database, use_fahrenheit = True, buffer_duration = 30):
+    def __init__(self, pin: int, db: Database, use_fahrenheit = True, buffer_duration = 30, clock: Clock = None,
+                 sample_interval = 2, read_deadline = 6, max_backoff = 60, name = "DHT22", offset = 0,
+                 filters: FilterPipeline = None, history: HistoryFile = None):
         """
         Continuously captures temperature and humidity data from DHT22. This class
-        can be instantiated, and then run as a thread using its run() method.
+        can be instantiated, and then run as a thread using its run() method. It can
+        also be sampled by an `AcquisitionEngine` without starting its thread.
 
         Args:
             pin (int): GPIO data pin for DHT sensor.
             db (Database): `Database` object to use to publish data.
             use_fahrenheit (bool, optional): If True, uses fahrenheit units, else uses Celsius. Defaults to True.
             buffer_duration (int, optional): How many seconds of history should be contained in the reading buffer. Defaults to 30.
-        """
-        Thread.__init__(self)
+            clock (Clock, optional): Clock used to timestamp readings and pace reads. Defaults to the system clock.
+            sample_interval (int, optional): Seconds between samples. Defaults to 2, the minimum supported by the DHT22.
+            read_deadline (int, optional): Maximum seconds spent retrying a single sample. Defaults to 6.
+            max_backoff (int, optional): Maximum seconds between samples while the sensor is failing. Defaults to 60.
+            name (str, optional): Name of the sensor, included in data sent to the websocket. Defaults to "DHT22".
+            offset (float, optional): Seconds to shift this sensor's sampling grid by. Defaults to 0.
+            filters (FilterPipeline, optional): Filters applied to each sample before it is buffered. Defaults to no filtering.
+            history (HistoryFile, optional): File every buffered reading is also written to. Its recent readings
+                are loaded into the buffer on creation, so a restarted sensor starts with a full window.
+        """
+        Thread.__init__(self, name = name)
         from utils import ReadingBuffer
 
         self.daemon = True
@@ -34,9 +58,33 @@ class TempSensor(Thread):
         self.pin = pin
         """ The GPIO pin used to read from the sensor."""
 
-        self.reading_buff = ReadingBuffer(buffer_duration)
+        self.sensor_name = name
+        """ Name of the sensor, included in data sent to the websocket. """
+
+        self.zone = None
+        """ Identifier of the zone this sensor belongs to, included in data sent to the websocket if set. """
+
+        self.clock = clock or DEFAULT_CLOCK
+        """ Clock used to timestamp readings and pace reads. """
+
+        self.scheduler = SampleScheduler(sample_interval, read_deadline, max_backoff = max_backoff,
+                                         offset = offset, clock = self.clock)
+        """ Paces samples on a fixed grid and bounds the time spent retrying them. """
+
+        self.reading_buff = ReadingBuffer(buffer_duration, clock = self.clock)
         """ A reading buffer that will only hold readings that are less than `buffer_duration` old. """
 
+        self.filters = filters
+        """ Filters applied to each sample before it is buffered. None if samples are buffered unfiltered. """
+
+        self.history = history
+        """ File every buffered reading is also written to. None if history is disabled. """
+
+        if history is not None:
+            restored = self.reading_buff.restore(history.since(self.clock.time() - buffer_duration), is_fahrenheit = history.is_fahrenheit)
+            if restored:
+                LOGGER.info(f"Restored {restored} readings of {name} from {history.path}.")
+
         self.use_fahrenheit = use_fahrenheit
         """ If true, Celsius readings are converted to fahrenheit. """
 
@@ -46,11 +94,16 @@ class TempSensor(Thread):
         self.term = Event()
         """ Used to terminate this thread. """
 
+        # the scheduler's histograms are exported as they are, so samples are only observed once
+        READ_LATENCY.attach(self.scheduler.latency, sensor = name)
+        READ_RETRIES.attach(self.scheduler.retries, sensor = name)
+        BUFFER_SIZE.labels(sensor = name).set_function(lambda: len(self.reading_buff))
+
     def available(self):
         """
         Returns true if the data buffer is full of data.
         """
-        return len(self.reading_buff.all()) > 0
+        return len(self.reading_buff) > 0
 
     def get_avg(self):
         """
@@ -60,17 +113,11 @@ class TempSensor(Thread):
         Returns:
             Reading, None: Reading object if readings are available in the buffer. False otherwise.
         """
-        # toList creates shallow copy to prevent threads from modifying during iteration
-        buff = self.reading_buff.toList()
-        buff_size = len(buff)
-
-        if buff_size > 0:
-            latest = buff[-1]
-            t_avg = sum([r.temp for r in buff])/buff_size
-            h_avg = sum([r.hum for r in buff])/buff_size
-
-            return Reading(t_avg, h_avg, time = latest.time, convert = False, is_fahrenheit=True)
-        return None
+        # the buffer keeps running sums over its columns, so this doesn't iterate over its entries
+        start = time.perf_counter()
+        average = self.reading_buff.average()
+        GET_AVG_TIME.labels(scope = "sensor").observe(time.perf_counter() - start)
+        return average
 
     def add_to_buffer(self, reading : Reading):
         """
@@ -84,6 +131,8 @@ class TempSensor(Thread):
             self.reading_buff.remove_old_entries()
             return
         self.reading_buff.append(reading)
+        if self.history is not None:
+            self.history.append(reading.timestamp, reading.temp, reading.hum)
 
     def send_to_database(self, reading : Reading):
         """
@@ -101,56 +150,94 @@ class TempSensor(Thread):
         Args:
             reading (Reading): Reading object to send.
         """
-        self.db.send_climate_data_websocket(reading.to_dict())
+        data = reading.to_dict()
+        data["sensor"] = self.sensor_name
+        if self.zone is not None:
+            data["zone"] = self.zone
+        self.db.send_climate_data_websocket(data)
+
+    def publish(self):
+        """
+        Sends the current running average to the database's websocket, if there is one.
+        """
+        try:
+            average = self.get_avg()
+            if average is not None:
+                self.send_to_websocket(average)
+        except Exception as e:
+            LOGGER.error(f"Error sending data to database: {str(e)}")
 
     def get_buffer(self):
         """
-        Returns all values in the buffer.
+        Returns the reading buffer.
 
         Returns:
-            RotatingTimeList: List of captured `Reading` entries.
+            ReadingBuffer: Buffer of captured `Reading` entries.
         """
         return self.reading_buff
 
     def read(self):
         """
-        Reads from the DHT sensor.
+        Makes a single attempt to read from the DHT sensor.
 
         Returns:
-            Reading: Reading object containing the captured data.
+            Reading: Reading object containing the captured data, or None if the read failed.
         """
-        humidity, temperature = Adafruit_DHT.read_retry(self.sensor, self.pin)
+        try:
+            humidity, temperature = Adafruit_DHT.read(self.sensor, self.pin)
+        except Exception as e:
+            LOGGER.debug(f"Error reading from DHT22: {str(e)}")
+            return None
+
         if humidity is not None and temperature is not None:
-            humidity = round(humidity, 2)
-            temperature = round(temperature, 2)
-            return Reading(temperature, humidity, convert = self.use_fahrenheit, is_fahrenheit=False)
+            # Reading rounds the values once after conversion
+            return Reading(temperature, humidity, convert = self.use_fahrenheit, is_fahrenheit=False, clock = self.clock)
+        return None
+
+    def sample(self):
+        """
+        Takes a sample, retrying failed reads until the scheduler's deadline, filters it and adds it to the buffer.
+
+        Returns:
+            Reading: The filtered reading, or None if the sample failed or was rejected by a filter.
+        """
+        reading = self.scheduler.sample(self.read, self.term)
+        if reading is None:
+            if not self.term.is_set():
+                LOGGER.error(f"Failed to read sensor on pin {self.pin} within {self.scheduler.deadline} seconds.")
+                SAMPLES.labels(sensor = self.sensor_name, result = "failed").inc()
         else:
-            LOGGER.error(f"Failed to read sensor. Sensor returned {temperature}, {humidity}.")
-            return None
+            if self.filters is not None:
+                reading = self.filters.apply(reading)
+            SAMPLES.labels(sensor = self.sensor_name, result = "ok" if reading is not None else "rejected").inc()
+        self.add_to_buffer(reading)
+        return reading
 
     def run(self):
         """
-        Continuously reads from sensor every 2 seconds.
+        Continuously samples the sensor on the scheduler's grid, every 2 seconds by default.
         Runs indefinitely until terminate() is called.
         """
-        while not self.term.is_set():
+        while not self.scheduler.wait(self.term):
+            self.sample()
+            self.publish()
 
-            try:
-                reading = self.read()
-                average = self.get_avg()
-            except Exception as e:
-                LOGGER.error(f"Error reading from DHT22: {str(e)}")
-                self.term.wait(2)
-                continue
+        self.log_stats()
 
-            try:
-                self.add_to_buffer(reading)
-                self.send_to_websocket(average)
-            except Exception as e:
-                LOGGER.error(f"Error sending data to database: {str(e)}")
+    def log_stats(self):
+        """
+        Logs the read latency and retry histograms and the filter counters of this sensor.
+        """
+        LOGGER.info(f"{self.sensor_name} on pin {self.pin}: read latency {self.scheduler.latency}, retries {self.scheduler.retries}")
+        if self.filters is not None:
+            LOGGER.info(f"{self.sensor_name} filters: {self.filters}")
 
-            # dht sensors need a minimum of 2 seconds between readings
-            self.term.wait(2)
+    def close(self):
+        """
+        Closes the history file of this sensor, if it has one.
+        """
+        if self.history is not None:
+            self.history.close()
 
     def terminate(self, sig, frame):
         """
@@ -158,6 +245,7 @@ class TempSensor(Thread):
         """
         print("Terminating temp sensor.")
         self.term.set()
+        self.close()
 
 
 
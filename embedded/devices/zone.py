@@ -0,0 +1,127 @@
+import logging
+
+from config import ZoneConfig
+from utils import Database, Reading
+from utils.timers import TimerScheduler
+
+from .acquisition import AcquisitionEngine
+from .device import RelayDevice
+from .gpio import GPIOController
+
+LOGGER = logging.getLogger()
+
+class Zone:
+
+    def __init__(self, config: ZoneConfig, database: Database, engine: AcquisitionEngine, timers: TimerScheduler,
+                 gpio: GPIOController = None):
+        """
+        A single climate zone: one enclosure with its own relays, sensors, setpoints and
+        day schedule. All zones share the service's database connection and acquisition engine.
+
+        Args:
+            config (ZoneConfig): Settings of this zone.
+            database (Database): Database object to upload data to.
+            engine (AcquisitionEngine): Engine reading this zone's sensors.
+            timers (TimerScheduler): Scheduler for timed activations, shared by all zones.
+            gpio (GPIOController, optional): Controller the relays are driven through. Defaults to a controller shared by all relays.
+        """
+        self.config = config
+        """ Settings of this zone. """
+
+        self.id = config.id
+        """ Identifier of this zone. Included in all data sent from it. """
+
+        self.database = database
+        """ Database object to upload data to. """
+
+        self.engine = engine
+        """ Engine reading this zone's sensors. """
+
+        self.heater = RelayDevice(config.heater_gpio, database, name = "Heating Pad", normally_closed = True, zone = self.id, timers = timers, gpio = gpio)
+
+        self.lamp = RelayDevice(config.lamp_gpio, database, name = "Lamp", normally_closed = False, zone = self.id, timers = timers, gpio = gpio)
+
+        self.humidifier = RelayDevice(config.humidifier_gpio, database, name = "Humidifier", normally_closed = False, zone = self.id, timers = timers, gpio = gpio)
+
+        self.gpio = self.heater.relay.gpio
+        """ Controller the relays are driven through. Used to switch several relays in one write. """
+
+        self.next_hardware_update = 0.0
+        """ Monotonic time after which the devices of this zone may next be updated. """
+
+        self.next_db_update = 0.0
+        """ Monotonic time after which the average of this zone may next be sent to the database. """
+
+    def get_avg(self):
+        """
+        Returns the average of all readings from this zone's sensors, or None if none are available.
+        """
+        return self.engine.get_avg(self.config.sensors)
+
+    def send_to_database(self, reading: Reading):
+        """
+        Sends a Reading object to the backend database for storage, tagged with this zone.
+        """
+        data = reading.to_dict()
+        data["zone"] = self.id
+        self.database.send_climate_data(data)
+
+    def shutdown(self):
+        """
+        Puts the relays in their safe state for when the service isn't running.
+        """
+        self.humidifier.cancel_timed()
+        with self.gpio.batch():
+            self.heater.on()
+            self.humidifier.off()
+            self.lamp.off()
+
+    def update_devices(self, reading: Reading, hour: int):
+        """
+        Updates power state of heating and humidity devices.
+
+        During daytime hours the lamp is prioritized as a heating device.
+        At night, only the heat mat is used.
+
+        Args:
+            reading (Reading): Reading object to get environment data from.
+            hour (int): Current hour, in military hours.
+        """
+        config = self.config
+        temp = reading.temp
+        hum = reading.hum
+
+        # relays switched together are written to the hardware in one call
+        with self.gpio.batch():
+            # run thermostat checks
+            is_daytime = hour > config.day_start and hour < config.day_end
+
+            # forces lamp to be off at night
+            if not is_daytime:
+                self.lamp.off()
+
+            if temp < config.desired_temp - config.temp_range:
+                if is_daytime:
+                    # if the lamp is not on, turn it on first.
+                    # If its still too cold on next check, turn on heater
+                    if not self.lamp.is_on():
+                        self.lamp.on()
+                    else:
+                        self.heater.on()
+                else:
+                    self.heater.on()
+
+            if temp > config.desired_temp + config.temp_range:
+                if is_daytime:
+                    # if the heater is on, turn it off first.
+                    # If its still too hot on next check, turn off lamp
+                    if self.heater.is_on():
+                        self.heater.off()
+                    else:
+                        self.lamp.off()
+                else:
+                    self.heater.off()
+
+
+            if hum < config.desired_hum-config.hum_range and not hum < 0 and not hum > 100:
+                self.humidifier.on_timed(config.spray_dur)
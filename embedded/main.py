@@ -1,17 +1,22 @@
-import datetime
+import atexit
 import logging
 import os
 import signal
 import sys
-import time
 import traceback
 
 from threading import Event
-from config import Config
-from utils import SocketConnector, now
+from config import Config, ConfigWatcher
+from utils import SocketConnector, Clock, DEFAULT_CLOCK
+from utils.filters import FilterPipeline
+from utils.history import HistoryFile
+from utils.metrics import MetricsServer
+from utils.logging_pipeline import CompressingFileHandler, setup_logging
+from utils.timers import TimerScheduler
 
 
-from devices import TempSensor, RelayDevice
+from devices import AcquisitionEngine, Zone, GPIOController
+from devices.gpio import create_backend
 from utils import Database
 from utils.reading import Reading
 
@@ -25,25 +30,14 @@ LOG_DATE_FORMAT = '%H:%M:%S'
 # log format
 LOG_FORMATTER = logging.Formatter(LOG_FORMAT, datefmt=LOG_DATE_FORMAT)
 
-# log level
-LOGGER.setLevel(logging.DEBUG)
-logging.getLogger("urllib3").setLevel(logging.WARNING)
+STALE_READING_TIMEOUT = 60
+""" Seconds without a new sensor reading before the main loop logs an error. """
 
-LOG_FILE_HANDLER = None
-def update_log_file():
-    """
-    Updates the current log file name to the current date.
-    """
-    global LOG_FILE_HANDLER, LOG_FORMATTER
-
-    if(not os.path.exists("logs")):
-        os.mkdir("logs")
+LOG_DIRECTORY = "logs"
+""" Directory log files are written to. """
 
-    if LOG_FILE_HANDLER != None: LOGGER.removeHandler(LOG_FILE_HANDLER)
-    LOG_FILE_HANDLER = logging.FileHandler(f"logs/{datetime.datetime.now().date()}.log", mode='a')
-    LOG_FILE_HANDLER.setFormatter(LOG_FORMATTER)
-    LOG_FILE_HANDLER.setLevel(logging.DEBUG)
-    LOGGER.addHandler(LOG_FILE_HANDLER)
+LOG_RETENTION = 14
+""" Number of days of compressed log files to keep. """
 
 def log_exception_handler(e_type, value, tb):
     """
@@ -51,55 +45,154 @@ def log_exception_handler(e_type, value, tb):
     """
     message = f"{e_type.__name__}: {value}\n{''.join(str(line) for line in traceback.format_tb(tb))}"
     LOGGER.critical(message)
-sys.excepthook = log_exception_handler
 
-# stdout logging
-log_stdout_handler = logging.StreamHandler(sys.stdout)
-log_stdout_handler.setFormatter(LOG_FORMATTER)
-log_stdout_handler.setLevel(logging.DEBUG)
-LOGGER.addHandler(log_stdout_handler)
+def configure_logging():
+    """
+    Sends logs to stdout and to a log file in `LOG_DIRECTORY`, written from a background thread,
+    and logs uncaught exceptions. Only called when the service is run as a program, so importing
+    this module leaves logging untouched.
+    """
+    LOGGER.setLevel(logging.DEBUG)
+    logging.getLogger("urllib3").setLevel(logging.WARNING)
+    sys.excepthook = log_exception_handler
+
+    if not os.path.exists(LOG_DIRECTORY):
+        os.mkdir(LOG_DIRECTORY)
+
+    log_stdout_handler = logging.StreamHandler(sys.stdout)
+    log_file_handler = CompressingFileHandler(os.path.join(LOG_DIRECTORY, "climate.log"), retention = LOG_RETENTION)
+
+    listener = setup_logging(LOGGER, LOG_FORMATTER, [log_stdout_handler, log_file_handler])
+    atexit.register(listener.stop)
 
 class Service:
 
-    def __init__(self, config_file):
-        self.config = Config(config_file)
+    engine_class = AcquisitionEngine
+    """ Engine that reads the sensors. Replaced by the simulation harness. """
+
+    def __init__(self, config_file, clock: Clock = None, database: Database = None, gpio: GPIOController = None):
+        self.watcher = ConfigWatcher(config_file)
+        """ Holds the current config and reloads it when the file changes or SIGHUP is received. """
+
+        self.clock = clock or DEFAULT_CLOCK
+        """ Clock used for scheduling and timestamps. Can be replaced with a `SimulatedClock`. """
+
+        self.database = database
+        """ Database connection. Created from the config unless one is given, e.g. by the simulation harness. """
+
+        self.gpio = gpio
+        """ Drives the relay pins. Created from the config unless one is given. """
+
+        self.metrics = None
+        """ Serves the service's metrics, if enabled. """
 
         LOGGER.debug("Starting service.")
 
         # terminate event
         self.term = Event()
 
+        self.init_devices()
+
+        self.watcher.add_listener(self.apply_config)
+
+    def install_signal_handlers(self):
+        """
+        Exits on SIGINT and SIGTERM, and reloads the config on SIGHUP. Must be called from the main thread.
+        """
         signal.signal(signal.SIGINT, self.exit_handler)
         signal.signal(signal.SIGTERM, self.exit_handler)
+        self.watcher.install_signal_handler()
 
-        self.init_devices()
+    def start_threads(self):
+        """
+        Starts the threads that reload the config and run timers. The simulation harness
+        leaves them stopped, so nothing moves the simulated clock behind its back.
+        """
+        self.watcher.start()
+        self.timers.start()
+
+    @property
+    def config(self) -> Config:
+        """
+        The current config. Read it once per use; it may be replaced by a reload at any time.
+        """
+        return self.watcher.current
+
+    def apply_config(self, old: Config, new: Config):
+        """
+        Applies a reloaded config to the running devices. Only settings that can change
+        without a restart reach this point, so every zone in `new` already exists.
+        """
+        for zone in self.zones:
+            zone.config = new.get_zone(zone.id)
+        for sensor in self.dht.sensors:
+            sensor.reading_buff.duration = new.buffer_dur
+        self.database.apply_config(new)
 
     def exit_handler(self, sig, frame):
         LOGGER.info("Exiting Session")
-        if self.heater: self.heater.on()
-        if self.humidifier: self.humidifier.off()
-        if self.lamp: self.lamp.off()
+        self.watcher.terminate()
+        self.timers.terminate()
+        for zone in self.zones:
+            zone.shutdown()
         if self.dht: self.dht.terminate(sig, frame)
+        if self.database: self.database.close()
+        if self.metrics: self.metrics.terminate()
         self.term.set()
 
     def init_devices(self):
         """
-        Initializes the database connection and all GPIO devices.
+        Initializes the database connection, the sensors and the GPIO devices of every zone.
         """
 
-        self.database = Database(self.config)
+        if self.database is None:
+            self.database = Database(self.config, clock = self.clock)
+
+        self.dht = self.engine_class.create(self.config.sensors, self.database, workers = self.config.sensor_workers,
+                                            clock = self.clock, buffer_duration = self.config.buffer_dur,
+                                            sample_interval = self.config.sample_interval, read_deadline = self.config.read_deadline,
+                                            max_backoff = self.config.max_read_backoff,
+                                            filters = lambda: FilterPipeline.from_config(self.config),
+                                            history = self.open_history if self.config.history_enabled else None)
+
+        self.timers = TimerScheduler(self.clock)
+
+        if self.gpio is None:
+            self.gpio = GPIOController(create_backend(self.config.gpio_backend, self.config.gpio_chip))
+        if self.config.gpio_verify_interval > 0:
+            self.gpio.verify_every(self.timers, self.config.gpio_verify_interval)
 
-        self.heater = RelayDevice(self.config.heater_gpio, self.database, name = "Heating Pad", normally_closed = True)
+        self.zones = [Zone(zone_config, self.database, self.dht, self.timers, self.gpio) for zone_config in self.config.zones]
 
-        self.lamp = RelayDevice(self.config.lamp_gpio, self.database, name = "Lamp", normally_closed = False)
+        if self.config.metrics_enabled:
+            try:
+                self.metrics = MetricsServer(self.config.metrics_host, self.config.metrics_port)
+                self.metrics.start()
+            except OSError as e:
+                LOGGER.error(f"Failed to start metrics endpoint on port {self.config.metrics_port}: {str(e)}")
+                self.metrics = None
 
-        self.humidifier = RelayDevice(self.config.humidifier_gpio, self.database, name = "Humidifier", normally_closed = False)
+        for zone in self.zones:
+            for name in zone.config.sensors:
+                self.dht.get_sensor(name).zone = zone.id
 
-        self.dht = TempSensor(self.config.dht_gpio, self.database, buffer_duration=self.config.buffer_dur)
+    def open_history(self, name: str, is_fahrenheit = True):
+        """
+        Opens the history file of the sensor `name`, sized to hold `history_hours` of readings
+        in the sensor's unit. Returns None if the file can't be opened, so the sensor runs without history.
+        """
+        config = self.config
+        capacity = max(1, int(config.history_hours * 3600 / config.sample_interval))
+        try:
+            os.makedirs(config.history_directory, exist_ok = True)
+            return HistoryFile(os.path.join(config.history_directory, f"{name}.ring"), capacity, is_fahrenheit = is_fahrenheit)
+        except (OSError, ValueError) as e:
+            LOGGER.error(f"Failed to open history of {name}: {str(e)}")
+            return None
 
     def begin_reading(self):
         """
-        Starts a thread that continuously reads data from the DHT sensor.
+        Starts a thread that continuously reads data from the DHT sensors.
         This waits for the sensor to to fully available before returning.
 
         NOTE: Is blocking if the sensor is unresponsive.
@@ -108,101 +201,88 @@ class Service:
 
         LOGGER.info("Waiting for self.dht readings..")
         while not self.dht.available() and not self.term.is_set():
-            self.term.wait(0.1)
+            self.clock.wait(self.term, 0.1)
 
     def start(self):
         """
-        Starts the main service thread. This updates the hardware power
-        states every 60 seconds based on the current running average
-        of the DHT sensor readings.
+        Starts the main service thread. This waits for new sensor readings and,
+        when a zone's sensors have a new sample, updates the hardware power states
+        of that zone based on the current running average of its sensors.
+
+        Hardware updates are limited to one every `hardware_interval` seconds and
+        database updates to one every `db_interval` seconds, per zone.
         """
         self.begin_reading()
 
         LOGGER.info("Starting main loop.")
 
-        last_hardware_update = time.time()
-        last_db_update = time.time()
-
         while not self.term.is_set():
 
-            update_log_file()
-
-            # get current running average of sensor
-            reading = self.dht.get_avg()
+            # blocks until a sensor takes a new sample
+            updated = self.dht.wait_for_update(STALE_READING_TIMEOUT)
+            if self.term.is_set() or self.dht.term.is_set():
+                break
 
-            # if reading failed, log error and skip this loop iteration
-            if reading is None or reading.temp is None or reading.hum is None:
-                LOGGER.error("ERROR: Failed to read averages from sensor.")
-                self.term.wait(60)
+            if not updated:
+                LOGGER.error(f"ERROR: No new sensor readings in {STALE_READING_TIMEOUT} seconds.")
                 continue
 
-            # log reading values
-            LOGGER.info(f"{reading}   -   Heater: {self.heater.is_on()}   -   Lamp: {self.lamp.is_on()}")
-            LOGGER.debug(f"DHT Reading Buffer: {[str(r) for r in self.dht.get_buffer()]}")
+            current = self.clock.monotonic()
+            for zone in self.zones:
+                if not updated.isdisjoint(zone.config.sensors):
+                    self.update_zone(zone, current)
 
-            # only update hardware every `hardware_interval` seconds
-            if time.time() - last_hardware_update > self.config.hardware_interval:
-                last_hardware_update = time.time()
-                self.update_devices(reading)
+        LOGGER.info("Exited main loop.")
 
-            # only update database every `db_interval` seconds
-            if time.time() - last_db_update > self.config.db_interval:
-                last_db_update = time.time()
-                self.dht.send_to_database(reading)
+    def update_zone(self, zone: Zone, current: float):
+        """
+        Reads the current running average of a zone and, if their deadlines have
+        passed, updates its devices and the database.
 
-            # update database every minute
-            self.term.wait(60)
+        Args:
+            zone (Zone): Zone to update.
+            current (float): Current monotonic time.
+        """
+        config = self.config
 
-        LOGGER.info("Exited main loop.")
+        # get current running average of the zone's sensors
+        reading = zone.get_avg()
 
+        # if reading failed, log error and skip this zone
+        if reading is None or reading.temp is None or reading.hum is None:
+            LOGGER.error(f"ERROR: Failed to read averages from sensors in zone {zone.id}.")
+            return
 
-    def update_devices(self, reading: Reading):
-        """
-        Updates power state of heating and humidity devices.
+        # only update hardware every `hardware_interval` seconds
+        if current >= zone.next_hardware_update:
+            zone.next_hardware_update = current + config.hardware_interval
 
-        During daytime hours the lamp is prioritized as a heating device.
-        At night, only the heat mat is used.
+            # log reading values
+            LOGGER.info(f"[{zone.id}] {reading}   -   Heater: {zone.heater.is_on()}   -   Lamp: {zone.lamp.is_on()}")
+            # snapshots are immutable, so they are only formatted by the log thread if DEBUG is enabled
+            for name in zone.config.sensors:
+                LOGGER.debug("%s Reading Buffer: %s", name, self.dht.get_sensor(name).get_buffer().snapshot())
+
+            self.update_devices(zone, reading)
+
+        # only update database every `db_interval` seconds
+        if current >= zone.next_db_update:
+            zone.next_db_update = current + config.db_interval
+            zone.send_to_database(reading)
+
+    def update_devices(self, zone: Zone, reading: Reading):
+        """
+        Updates power state of the heating and humidity devices of `zone`.
 
         Args:
+            zone (Zone): Zone to update.
             reading (Reading): Reading object to get environment data from.
         """
-        temp = reading.temp
-        hum = reading.hum
-
-        # run thermostat checks
-        current_hour = datetime.datetime.now().hour
-        is_daytime = current_hour > self.config.day_start and current_hour < self.config.day_end
-
-        # forces lamp to be off at night
-        if not is_daytime:
-            self.lamp.off()
-
-        if temp < self.config.desired_temp - self.config.temp_range:
-            if is_daytime:
-                # if the lamp is not on, turn it on first.
-                # If its still too cold on next check, turn on heater
-                if not self.lamp.is_on():
-                    self.lamp.on()
-                else:
-                    self.heater.on()
-            else:
-                self.heater.on()
-
-        if temp > self.config.desired_temp + self.config.temp_range:
-            if is_daytime:
-                # if the heater is on, turn it off first.
-                # If its still too hot on next check, turn off lamp
-                if self.heater.is_on():
-                    self.heater.off()
-                else:
-                    self.lamp.off()
-            else:
-                self.heater.off()
-
-
-        if hum < self.config.desired_hum-self.config.hum_range and not hum < 0 and not hum > 100:
-            self.humidifier.on_timed(self.config.spray_dur)
+        zone.update_devices(reading, self.clock.now().hour)
 
 if __name__ == "__main__":
+    configure_logging()
     service = Service("config.ini")
+    service.install_signal_handlers()
+    service.start_threads()
     service.start()
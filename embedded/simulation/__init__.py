@@ -0,0 +1,3 @@
+from .gpio import RecordingGPIO
+from .sources import ThermalModel, TraceReplay, SimulatedDHT
+from .harness import Simulation, SimulatedDatabase, format_report
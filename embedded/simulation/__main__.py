@@ -0,0 +1,35 @@
+"""
+Runs the control loop against simulated sensors and relays, faster than real time.
+
+Usage:
+    python -m simulation [config.ini] [--days 7] [--trace trace.csv] [--seed 0] [--failure-rate 0.02] [--json report.json]
+"""
+import argparse
+import json
+import logging
+
+from .harness import Simulation, format_report
+
+def main():
+    parser = argparse.ArgumentParser(prog = "python -m simulation", description = "Simulate the climate controller.")
+    parser.add_argument("config", nargs = "?", default = "config.ini", help = "Config file to simulate.")
+    parser.add_argument("--days", type = float, default = 1, help = "Simulated days to run for.")
+    parser.add_argument("--trace", help = "CSV or JSON trace to replay instead of the thermal model.")
+    parser.add_argument("--seed", type = int, default = 0, help = "Seed of sensor noise and failures.")
+    parser.add_argument("--failure-rate", type = float, default = 0.02, help = "Probability that a sensor read fails.")
+    parser.add_argument("--json", help = "Also write the report to this file.")
+    parser.add_argument("--log-level", default = "WARNING", help = "Level of service logs printed while simulating.")
+    args = parser.parse_args()
+
+    simulation = Simulation(args.config, days = args.days, trace = args.trace, seed = args.seed, failure_rate = args.failure_rate)
+    logging.getLogger().setLevel(args.log_level.upper())
+
+    report = simulation.run()
+    print(format_report(report))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent = 2)
+
+if __name__ == "__main__":
+    main()
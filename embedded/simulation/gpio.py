@@ -0,0 +1,37 @@
+from collections import Counter
+
+from devices.gpio import FakeBackend
+from utils import Clock, DEFAULT_CLOCK
+
+class RecordingGPIO(FakeBackend):
+
+    name = "recording"
+
+    def __init__(self, clock: Clock = None):
+        """
+        In-memory GPIO backend that records every change of level.
+
+        Args:
+            clock (Clock, optional): Clock used to timestamp level changes. Defaults to the system clock.
+        """
+        super().__init__()
+
+        self.clock = clock or DEFAULT_CLOCK
+        """ Clock used to timestamp level changes. """
+
+        self.toggles = Counter()
+        """ Number of level changes of each pin. """
+
+        self.history = []
+        """ Every level change as (epoch time, pin, level). """
+
+    def write(self, pin, level):
+        self.write_many({pin: level})
+
+    def write_many(self, levels):
+        self.writes += 1
+        for pin, level in levels.items():
+            if self.levels.get(pin) != level:
+                self.toggles[pin] += 1
+                self.history.append((self.clock.time(), pin, level))
+            self.levels[pin] = level
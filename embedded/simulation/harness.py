@@ -0,0 +1,316 @@
+import logging
+import time
+
+from collections import Counter
+
+from devices import AcquisitionEngine
+from utils import SimulatedClock
+
+from .gpio import RecordingGPIO
+from .sources import ThermalModel, TraceReplay, SimulatedDHT
+
+LOGGER = logging.getLogger()
+
+class SimulatedDatabase:
+
+    def __init__(self, clock: SimulatedClock):
+        """
+        Stands in for `Database` during a simulation. Data is counted instead of sent.
+
+        Args:
+            clock (SimulatedClock): Clock used to timestamp device events.
+        """
+        self.clock = clock
+        self.config = None
+        self.sent = Counter()
+        """ Number of messages of each kind. """
+
+    def send_climate_data(self, data):
+        self.sent["climate"] += 1
+
+    def send_device_data(self, data):
+        self.sent["device"] += 1
+
+    def publish_device_event(self, data):
+        self.sent["device"] += 1
+
+    def send_climate_data_websocket(self, data):
+        self.sent["websocket"] += 1
+
+    def apply_config(self, config):
+        self.config = config
+
+    def close(self):
+        pass
+
+class ZoneStats:
+
+    def __init__(self):
+        """
+        Control metrics of one zone, integrated over the true climate of its source.
+        """
+        self.seconds = 0.0
+        """ Simulated seconds observed. """
+
+        self.too_cold = 0.0
+        """ Seconds below the temperature band. """
+
+        self.too_hot = 0.0
+        """ Seconds above the temperature band. """
+
+        self.too_dry = 0.0
+        """ Seconds below the humidity band. """
+
+        self.min_temp = None
+        self.max_temp = None
+
+    def observe(self, temp: float, hum: float, config, seconds: float):
+        """
+        Adds `seconds` spent at `temp` and `hum` under the setpoints of `config`.
+        """
+        self.seconds += seconds
+        if temp < config.desired_temp - config.temp_range:
+            self.too_cold += seconds
+        elif temp > config.desired_temp + config.temp_range:
+            self.too_hot += seconds
+        if hum < config.desired_hum - config.hum_range:
+            self.too_dry += seconds
+        self.min_temp = temp if self.min_temp is None else min(self.min_temp, temp)
+        self.max_temp = temp if self.max_temp is None else max(self.max_temp, temp)
+
+    def to_dict(self):
+        out_of_band = self.too_cold + self.too_hot
+        return {
+            "out_of_band_seconds": round(out_of_band, 1),
+            "out_of_band_fraction": round(out_of_band / self.seconds, 4) if self.seconds else 0.0,
+            "too_cold_seconds": round(self.too_cold, 1),
+            "too_hot_seconds": round(self.too_hot, 1),
+            "too_dry_seconds": round(self.too_dry, 1),
+            "min_temp": None if self.min_temp is None else round(self.min_temp, 2),
+            "max_temp": None if self.max_temp is None else round(self.max_temp, 2),
+        }
+
+class SteppedEngine(AcquisitionEngine):
+
+    simulation = None
+    """ Simulation that advances the clock and runs timers while this engine waits. """
+
+    def start(self):
+        """
+        Takes the first samples. The engine has no thread; sensors are sampled on the service's
+        thread while it waits for an update.
+        """
+        while not self.available() and not self.simulation.finished():
+            self.step(None)
+
+    def wait_for_update(self, timeout: float = None):
+        """
+        Advances the simulation until a sensor takes a new sample, the timeout passes, or the
+        simulation ends, then returns like `AcquisitionEngine.wait_for_update`.
+        """
+        deadline = None if timeout is None else self.clock.monotonic() + timeout
+        while not self.update_event.is_set() and not self.simulation.finished():
+            if deadline is not None and self.clock.monotonic() >= deadline:
+                break
+            self.step(deadline)
+        return super().wait_for_update(0)
+
+    def step(self, deadline: float):
+        """
+        Runs due timers and samples the sensor that is due next, or advances the clock to
+        whichever comes first, without passing `deadline` or the end of the simulation.
+        """
+        sensor = self.next_sensor()
+        delay = sensor.scheduler.delay()
+        timer_delay = self.simulation.service.timers.run_due()
+        if timer_delay is not None:
+            delay = min(delay, timer_delay)
+
+        if delay > 0:
+            limit = self.simulation.end
+            if deadline is not None:
+                limit = min(limit, deadline)
+            self.simulation.advance(min(delay, limit - self.clock.monotonic()))
+            return
+
+        with self.lock:
+            self.in_flight.add(sensor)
+        self._sample(sensor)
+        self.simulation.samples += 1
+        self.simulation.advance_climate()
+
+class Simulation:
+
+    def __init__(self, config_file: str, days: float = 1, trace: str = None, seed = 0, failure_rate = 0.02,
+                 start: float = None, step = 10):
+        """
+        Runs the real `Service`, `TempSensor` and `RelayDevice` code against simulated sensors
+        and relays, on a `SimulatedClock`. The service's main loop runs unchanged, but its
+        background threads are never started: a `SteppedEngine` samples the sensors while the
+        loop waits for an update, advancing the clock straight to the next sensor sample or
+        timer, so days of operation take seconds.
+
+        The `Adafruit_DHT` module used by the sensors is replaced for the life of the process,
+        so a simulation should run in its own process.
+
+        Args:
+            config_file (str): Service config to simulate.
+            days (float, optional): Simulated days to run for. Defaults to 1.
+            trace (str, optional): Trace file replayed by every sensor. If None, each zone uses a `ThermalModel`.
+            seed (int, optional): Seed of sensor noise and failures. Defaults to 0.
+            failure_rate (float, optional): Probability that a sensor read fails. Defaults to 0.02.
+            start (float, optional): Epoch time the simulation starts at. Defaults to the current time.
+            step (float, optional): Maximum simulated seconds the climate is advanced by at once. Defaults to 10.
+        """
+        # imported here so the mocks are only replaced when a simulation is created
+        import main
+        from devices import tempsensor, GPIOController
+
+        self.days = days
+        self.step = step
+
+        self.clock = SimulatedClock(start)
+        """ Clock shared by the service and the simulated hardware. """
+
+        self.gpio = RecordingGPIO(self.clock)
+        """ Records relay states. """
+
+        self.dht = SimulatedDHT(self.clock, seed = seed, failure_rate = failure_rate)
+        """ Serves sensor reads from the zone sources. """
+
+        tempsensor.Adafruit_DHT = self.dht
+
+        self.database = SimulatedDatabase(self.clock)
+
+        class SimulatedService(main.Service):
+
+            engine_class = SteppedEngine
+
+            def open_history(self, name, is_fahrenheit = True):
+                # simulated readings must never be mixed into the real history files
+                return None
+
+        self.service = SimulatedService(config_file, clock = self.clock, database = self.database, gpio = GPIOController(self.gpio))
+        """ The service under test. Its threads are never started; its engine steps the simulation instead. """
+
+        self.service.dht.simulation = self
+
+        self.sources = {}
+        """ Climate source of each zone. """
+
+        for zone in self.service.zones:
+            if trace is not None:
+                source = TraceReplay.load(trace)
+            else:
+                source = ThermalModel(devices = self.device_states(zone))
+            self.sources[zone.id] = source
+            for name in zone.config.sensors:
+                self.dht.attach(self.service.dht.get_sensor(name).pin, source)
+
+        self.stats = {zone.id: ZoneStats() for zone in self.service.zones}
+        """ Control metrics of each zone. """
+
+        self.last_time = self.clock.monotonic()
+        """ Simulated time the climate was last advanced to. """
+
+        self.end = self.last_time + days * 86400
+        """ Simulated time the simulation ends at. """
+
+        self.samples = 0
+        """ Number of sensor samples taken. """
+
+    def finished(self):
+        """
+        Returns True once the simulation has reached its end. Stops the service's main loop.
+        """
+        if self.clock.monotonic() >= self.end:
+            self.service.term.set()
+        return self.service.term.is_set()
+
+    def advance(self, seconds: float):
+        """
+        Advances the clock by `seconds` and the climate with it.
+        """
+        self.clock.advance(seconds)
+        self.advance_climate()
+
+    @staticmethod
+    def device_states(zone):
+        """
+        Returns a function reporting whether the heater, lamp and humidifier of `zone` are on.
+        """
+        return lambda: (zone.heater.is_on(), zone.lamp.is_on(), zone.humidifier.is_on())
+
+    def advance_climate(self):
+        """
+        Advances every source to the current simulated time and records time spent out of band.
+        """
+        elapsed = self.clock.monotonic() - self.last_time
+        start = self.clock.time() - elapsed
+        while elapsed > 0:
+            seconds = min(elapsed, self.step)
+            moment = self.clock.from_timestamp(start)
+            hour = moment.hour + moment.minute / 60
+            for zone in self.service.zones:
+                source = self.sources[zone.id]
+                temp, hum = source.value(start)
+                self.stats[zone.id].observe(temp, hum, zone.config, seconds)
+                source.step(hour, seconds)
+            start += seconds
+            elapsed -= seconds
+        self.last_time = self.clock.monotonic()
+
+    def run(self):
+        """
+        Runs the simulation.
+
+        Returns:
+            dict: Control and throughput metrics.
+        """
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+
+        self.service.start()
+
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        return self.report(self.samples, wall, cpu)
+
+    def report(self, samples: int, wall: float, cpu: float):
+        """
+        Collects the metrics of a finished run.
+        """
+        zones = {}
+        for zone in self.service.zones:
+            toggles = {}
+            for device in (zone.heater, zone.lamp, zone.humidifier):
+                toggles[device.name] = self.gpio.toggles[device.relay.pin]
+            zones[zone.id] = dict(self.stats[zone.id].to_dict(), toggles = toggles)
+
+        simulated = self.days * 86400
+        return {
+            "simulated_days": self.days,
+            "zones": zones,
+            "sensor_reads": self.dht.reads,
+            "failed_reads": self.dht.failures,
+            "messages": dict(self.database.sent),
+            "iterations": samples,
+            "wall_seconds": round(wall, 3),
+            "iterations_per_second": round(samples / wall, 1) if wall else None,
+            "cpu_us_per_iteration": round(cpu / samples * 1e6, 1) if samples else None,
+            "speedup": round(simulated / wall) if wall else None,
+        }
+
+def format_report(report: dict):
+    """
+    Formats a simulation report for the console.
+    """
+    lines = [f"Simulated {report['simulated_days']} days in {report['wall_seconds']}s ({report['speedup']}x real time)."]
+    for zone_id, zone in report["zones"].items():
+        toggles = ", ".join(f"{name}: {count}" for name, count in zone["toggles"].items())
+        lines.append(f"[{zone_id}] out of band {zone['out_of_band_fraction']:.2%} "
+                     f"(cold {zone['too_cold_seconds']}s, hot {zone['too_hot_seconds']}s), dry {zone['too_dry_seconds']}s, "
+                     f"temp {zone['min_temp']}-{zone['max_temp']}, toggles {toggles}")
+    lines.append(f"{report['iterations']} iterations, {report['iterations_per_second']}/s, "
+                 f"{report['cpu_us_per_iteration']}us CPU each. {report['failed_reads']}/{report['sensor_reads']} reads failed.")
+    return "\n".join(lines)
@@ -0,0 +1,195 @@
+import csv
+import json
+import math
+import random
+
+from bisect import bisect_right
+from datetime import datetime
+
+class ThermalModel:
+
+    def __init__(self, devices = None, temp = 72.0, hum = 50.0, ambient_temp = 68.0, ambient_swing = 6.0,
+                 ambient_hum = 40.0, heater_rise = 14.0, lamp_rise = 18.0, spray_rate = 0.5,
+                 temp_time_constant = 1800, hum_time_constant = 1200):
+        """
+        A simple thermal model of one enclosure. Temperature and humidity relax exponentially
+        towards an equilibrium set by the room and by whichever devices are on. The room
+        follows a daily cycle peaking in mid afternoon.
+
+        Args:
+            devices (Callable[[], tuple[bool, bool, bool]], optional): Returns whether the heater, lamp
+                and humidifier are on. If None, all devices are considered off.
+            temp (float, optional): Initial temperature, in Fahrenheit. Defaults to 72.
+            hum (float, optional): Initial relative humidity percentage. Defaults to 50.
+            ambient_temp (float, optional): Average room temperature, in Fahrenheit. Defaults to 68.
+            ambient_swing (float, optional): Daily room temperature amplitude, in Fahrenheit. Defaults to 6.
+            ambient_hum (float, optional): Room humidity percentage. Defaults to 40.
+            heater_rise (float, optional): Degrees the heater raises the equilibrium by. Defaults to 14.
+            lamp_rise (float, optional): Degrees the lamp raises the equilibrium by. Defaults to 18.
+            spray_rate (float, optional): Humidity percentage added per second while the humidifier runs. Defaults to 0.5.
+            temp_time_constant (float, optional): Seconds for 63% of a temperature change to happen. Defaults to 1800.
+            hum_time_constant (float, optional): Seconds for 63% of a humidity change to happen. Defaults to 1200.
+        """
+        self.devices = devices
+        self.temp = temp
+        self.hum = hum
+        self.ambient_temp = ambient_temp
+        self.ambient_swing = ambient_swing
+        self.ambient_hum = ambient_hum
+        self.heater_rise = heater_rise
+        self.lamp_rise = lamp_rise
+        self.spray_rate = spray_rate
+        self.temp_time_constant = temp_time_constant
+        self.hum_time_constant = hum_time_constant
+
+    def room_temp(self, hour: float):
+        """
+        Returns the room temperature at `hour` of the day, coldest at 3am and warmest at 3pm.
+        """
+        return self.ambient_temp - self.ambient_swing * math.cos((hour - 3) / 24 * 2 * math.pi)
+
+    def step(self, hour: float, seconds: float):
+        """
+        Moves the model forward by `seconds`, assuming the devices stay in their current state.
+        The exponential update is exact for constant inputs, so large steps are stable.
+
+        Args:
+            hour (float): Hour of the day at the start of the step, including its fraction.
+            seconds (float): Length of the step.
+        """
+        heater, lamp, humidifier = self.devices() if self.devices else (False, False, False)
+
+        target = self.room_temp(hour) + heater * self.heater_rise + lamp * self.lamp_rise
+        self.temp += (target - self.temp) * (1 - math.exp(-seconds / self.temp_time_constant))
+
+        self.hum += (self.ambient_hum - self.hum) * (1 - math.exp(-seconds / self.hum_time_constant))
+        if humidifier:
+            self.hum = min(100.0, self.hum + self.spray_rate * seconds)
+
+    def value(self, timestamp: float):
+        """
+        Returns the current (temperature, humidity).
+        """
+        return self.temp, self.hum
+
+class TraceReplay:
+
+    def __init__(self, times: list, temps: list, hums: list, start: float = None):
+        """
+        Replays a recorded trace of temperature and humidity, interpolating linearly between
+        points and looping once the end of the trace is reached. Recorded values don't react
+        to the devices, so this exercises the control logic against real sensor behaviour
+        rather than the climate it would produce.
+
+        Args:
+            times (list[float]): Seconds of each point from the start of the trace, ascending.
+            temps (list[float]): Temperatures, in Fahrenheit.
+            hums (list[float]): Humidity percentages.
+            start (float, optional): Epoch time the trace starts playing at. Defaults to the first read.
+        """
+        if len(times) < 2:
+            raise ValueError("A trace needs at least two points.")
+        self.times = times
+        self.temps = temps
+        self.hums = hums
+        self.start = start
+
+    @staticmethod
+    def load(path: str, start: float = None):
+        """
+        Loads a trace from a CSV file with `time`, `temperature` and `humidity` columns, or from
+        a JSON list of objects with those keys, such as the output of the backend's data API.
+        Times may be seconds or ISO 8601 datetimes.
+        """
+        with open(path, newline = "") as f:
+            if path.endswith(".json"):
+                rows = json.load(f)
+            else:
+                rows = list(csv.DictReader(f))
+
+        points = []
+        for row in rows:
+            time = row["time"]
+            try:
+                time = float(time)
+            except ValueError:
+                time = datetime.fromisoformat(str(time).replace("Z", "+00:00")).timestamp()
+            points.append((time, float(row["temperature"]), float(row["humidity"])))
+        points.sort()
+
+        first = points[0][0]
+        return TraceReplay([p[0] - first for p in points], [p[1] for p in points], [p[2] for p in points], start = start)
+
+    def step(self, hour: float, seconds: float):
+        pass
+
+    def value(self, timestamp: float):
+        """
+        Returns the (temperature, humidity) of the trace at epoch `timestamp`.
+        """
+        if self.start is None:
+            self.start = timestamp
+        offset = (timestamp - self.start) % self.times[-1]
+
+        index = bisect_right(self.times, offset)
+        if index >= len(self.times):
+            return self.temps[-1], self.hums[-1]
+        t0, t1 = self.times[index - 1], self.times[index]
+        weight = (offset - t0) / (t1 - t0) if t1 > t0 else 0.0
+        temp = self.temps[index - 1] + (self.temps[index] - self.temps[index - 1]) * weight
+        hum = self.hums[index - 1] + (self.hums[index] - self.hums[index - 1]) * weight
+        return temp, hum
+
+class SimulatedDHT:
+    """
+    Replacement for the `Adafruit_DHT` module that reads each pin from a simulated source,
+    adding sensor noise and occasional failed reads.
+    """
+
+    DHT22 = object()
+
+    def __init__(self, clock, seed = 0, temp_noise = 0.2, hum_noise = 1.0, failure_rate = 0.02):
+        """
+        Args:
+            clock (Clock): Clock whose wall time is passed to the sources.
+            seed (int, optional): Seed of the noise and failures. Defaults to 0.
+            temp_noise (float, optional): Standard deviation of temperature noise, in Fahrenheit. Defaults to 0.2.
+            hum_noise (float, optional): Standard deviation of humidity noise, in percent. Defaults to 1.
+            failure_rate (float, optional): Probability that a read fails. Defaults to 0.02.
+        """
+        self.clock = clock
+        self.random = random.Random(seed)
+        self.temp_noise = temp_noise
+        self.hum_noise = hum_noise
+        self.failure_rate = failure_rate
+
+        self.sources = {}
+        """ Source of each pin. """
+
+        self.reads = 0
+        """ Number of reads attempted. """
+
+        self.failures = 0
+        """ Number of reads that failed. """
+
+    def attach(self, pin: int, source):
+        """
+        Makes reads of `pin` return values from `source`.
+        """
+        self.sources[pin] = source
+
+    def read(self, sensor, pin: int):
+        """
+        Returns (humidity, temperature in Celsius) like `Adafruit_DHT.read`, or (None, None) on a failed read.
+        """
+        self.reads += 1
+        if self.random.random() < self.failure_rate:
+            self.failures += 1
+            return None, None
+
+        temp, hum = self.sources[pin].value(self.clock.time())
+        temp += self.random.gauss(0, self.temp_noise)
+        hum = min(100.0, max(0.0, hum + self.random.gauss(0, self.hum_noise)))
+        return hum, (temp - 32) * 5 / 9
+
+    read_retry = read
@@ -0,0 +1,19 @@
+import configparser
+import os
+
+EXAMPLE_CONFIG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config.example.ini")
+""" The example config, which the tests start from. """
+
+def write_config(path: str, settings: dict = None):
+    """
+    Writes the example config to `path`, with the values in `settings`, keyed by (section, option), replaced.
+    Sections missing from the example, such as zones, are added.
+    """
+    parser = configparser.ConfigParser()
+    parser.read(EXAMPLE_CONFIG)
+    for (section, option), value in (settings or {}).items():
+        if not parser.has_section(section):
+            parser.add_section(section)
+        parser.set(section, option, str(value))
+    with open(path, "w") as f:
+        parser.write(f)
@@ -0,0 +1,87 @@
+import unittest
+
+from devices import AcquisitionEngine
+from simulation import SimulatedDatabase
+from utils import SimulatedClock
+
+class AcquisitionEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = SimulatedClock()
+        self.database = SimulatedDatabase(self.clock)
+
+    def create(self, pins: dict, **kwargs):
+        engine = AcquisitionEngine.create(pins, self.database, clock = self.clock, **kwargs)
+        self.addCleanup(engine.executor.shutdown)
+        return engine
+
+    def offsets(self, engine: AcquisitionEngine):
+        return [sensor.scheduler.origin - self.clock.monotonic() for sensor in engine.sensors]
+
+    def test_create_staggers_sensors(self):
+        engine = self.create({"a": 4, "b": 17, "c": 27, "d": 22}, sample_interval = 4)
+
+        self.assertEqual([sensor.sensor_name for sensor in engine.sensors], ["a", "b", "c", "d"])
+        self.assertEqual([sensor.pin for sensor in engine.sensors], [4, 17, 27, 22])
+        self.assertEqual(self.offsets(engine), [0, 1, 2, 3])
+
+        # sensors come due one second apart, the longest overdue first
+        self.clock.advance(2.5)
+        self.assertEqual([sensor.scheduler.delay() for sensor in engine.sensors], [0, 0, 0, 0.5])
+        self.assertEqual(engine.next_sensor().sensor_name, "a")
+
+    def test_create_single_sensor_has_no_offset(self):
+        engine = self.create({"DHT22": 4})
+        self.assertEqual(self.offsets(engine), [0])
+
+    def test_create_gives_each_sensor_its_own_filters_and_history(self):
+        opened = []
+        def history(name, is_fahrenheit):
+            opened.append((name, is_fahrenheit))
+            return None
+
+        engine = self.create({"a": 4, "b": 17}, filters = lambda: object(), history = history, use_fahrenheit = False)
+        self.assertEqual(opened, [("a", False), ("b", False)])
+        self.assertIsNot(engine.sensors[0].filters, engine.sensors[1].filters)
+
+    def test_sensors_must_use_different_pins(self):
+        with self.assertRaises(ValueError):
+            self.create({"a": 4, "b": 4})
+
+    def test_get_avg_combines_buffers(self):
+        engine = self.create({"a": 4, "b": 17, "c": 27}, buffer_duration = 30)
+        a, b, c = (sensor.reading_buff for sensor in engine.sensors)
+        now = self.clock.time()
+        a.append_values(70, 40, now - 2)
+        a.append_values(72, 44, now - 1)
+        b.append_values(80, 60, now)
+
+        # every reading is weighted equally, so `a` counts twice
+        average = engine.get_avg()
+        self.assertAlmostEqual(average.temp, 74, places = 2)
+        self.assertAlmostEqual(average.hum, 48, places = 2)
+        self.assertEqual(average.timestamp, now)
+
+        self.assertAlmostEqual(engine.get_avg(["a"]).temp, 71, places = 2)
+        self.assertAlmostEqual(engine.get_avg(["a", "c"]).temp, 71, places = 2)
+        self.assertIsNone(engine.get_avg(["c"]))
+        self.assertEqual(engine.get_averages()["b"].temp, 80)
+        self.assertIsNone(engine.get_averages()["c"])
+
+    def test_get_avg_drops_expired_readings(self):
+        engine = self.create({"a": 4, "b": 17}, buffer_duration = 10)
+        a, b = (sensor.reading_buff for sensor in engine.sensors)
+        a.append_values(60, 30, self.clock.time())
+        self.clock.advance(6)
+        b.append_values(80, 50, self.clock.time())
+        self.assertAlmostEqual(engine.get_avg().temp, 70, places = 2)
+
+        self.clock.advance(6)
+        self.assertAlmostEqual(engine.get_avg().temp, 80, places = 2)
+
+        self.clock.advance(6)
+        self.assertIsNone(engine.get_avg())
+        self.assertFalse(engine.available())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+import os
+import signal
+import tempfile
+import unittest
+
+from config import ConfigWatcher
+from devices import tempsensor
+from simulation import Simulation
+
+from tests import write_config
+
+class ConfigWatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "config.ini")
+        write_config(self.path)
+
+        self.watcher = ConfigWatcher(self.path, poll_interval = 60)
+        self.reloads = []
+        self.watcher.add_listener(lambda old, new: self.reloads.append((old, new)))
+
+    def test_valid_change_is_applied(self):
+        old = self.watcher.current
+        write_config(self.path, {("THERMOSTAT", "desired_temp"): 80})
+
+        self.assertTrue(self.watcher.reload())
+        self.assertIsNot(self.watcher.current, old)
+        self.assertEqual(self.watcher.current.get_zone("default").desired_temp, 80)
+        self.assertEqual(self.reloads, [(old, self.watcher.current)])
+        # the old config is untouched, so readers holding it see a consistent snapshot
+        self.assertEqual(old.get_zone("default").desired_temp, 75)
+
+    def test_invalid_file_keeps_current_config(self):
+        old = self.watcher.current
+        write_config(self.path, {("THERMOSTAT", "desired_temp"): "warm"})
+
+        with self.assertLogs(level = "ERROR") as logs:
+            self.assertFalse(self.watcher.reload())
+        self.assertIs(self.watcher.current, old)
+        self.assertEqual(self.reloads, [])
+        self.assertIn("Rejected config reload", logs.output[0])
+
+    def test_restart_setting_change_is_rejected(self):
+        old = self.watcher.current
+        write_config(self.path, {("SENSOR", "sample_interval"): 5, ("THERMOSTAT", "desired_temp"): 80})
+
+        with self.assertLogs(level = "ERROR") as logs:
+            self.assertFalse(self.watcher.reload())
+        self.assertIs(self.watcher.current, old)
+        self.assertEqual(self.reloads, [])
+        self.assertIn("sample_interval", logs.output[0])
+
+    def test_zone_layout_change_is_rejected(self):
+        write_config(self.path, {("GPIO", "heater"): 12})
+        with self.assertLogs(level = "ERROR") as logs:
+            self.assertFalse(self.watcher.reload())
+        self.assertIn("zones", logs.output[0])
+
+    def test_frozen_config_cant_be_modified(self):
+        with self.assertRaises(AttributeError):
+            self.watcher.current.sample_interval = 5
+        with self.assertRaises(AttributeError):
+            self.watcher.current.get_zone("default").desired_temp = 80
+
+    @unittest.skipUnless(hasattr(signal, "SIGHUP"), "SIGHUP is not available on this platform.")
+    def test_sighup_reloads(self):
+        previous = signal.getsignal(signal.SIGHUP)
+        self.addCleanup(signal.signal, signal.SIGHUP, previous)
+        self.watcher.install_signal_handler()
+
+        write_config(self.path, {("THERMOSTAT", "desired_temp"): 80})
+        # keep the modification time, so only the signal can trigger the reload
+        os.utime(self.path, (self.watcher.mtime, self.watcher.mtime))
+        os.kill(os.getpid(), signal.SIGHUP)
+        self.assertTrue(self.watcher.reload_requested.is_set())
+
+        self.watcher.start()
+        self.addCleanup(self.watcher.join, 5)
+        self.addCleanup(self.watcher.terminate)
+        for _ in range(500):
+            if self.reloads:
+                break
+            self.watcher.term.wait(0.01)
+        self.assertEqual(self.watcher.current.get_zone("default").desired_temp, 80)
+
+class ServiceReloadTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "config.ini")
+        write_config(self.path)
+
+        # the simulation replaces the sensor library, so restore it for the other tests
+        self.addCleanup(setattr, tempsensor, "Adafruit_DHT", tempsensor.Adafruit_DHT)
+
+        self.simulation = Simulation(self.path, days = 0.01)
+        self.service = self.simulation.service
+
+    def test_reload_reaches_running_devices(self):
+        zone = self.service.zones[0]
+        write_config(self.path, {("THERMOSTAT", "desired_temp"): 80, ("THERMOSTAT", "buffer_duration"): 30})
+
+        self.assertTrue(self.service.watcher.reload())
+        self.assertIs(zone.config, self.service.config.get_zone(zone.id))
+        self.assertEqual(zone.config.desired_temp, 80)
+        self.assertEqual([sensor.reading_buff.duration for sensor in self.service.dht.sensors], [30])
+        self.assertIs(self.simulation.database.config, self.service.config)
+
+    def test_rejected_reload_leaves_devices_alone(self):
+        zone = self.service.zones[0]
+        config = zone.config
+        write_config(self.path, {("SENSOR", "sample_interval"): 5, ("THERMOSTAT", "desired_temp"): 80})
+
+        with self.assertLogs(level = "ERROR"):
+            self.assertFalse(self.service.watcher.reload())
+        self.assertIs(zone.config, config)
+        self.assertIsNone(self.simulation.database.config)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,179 @@
+import asyncio
+import json
+import os
+import queue
+import tempfile
+import unittest
+
+from threading import Thread, Event
+from unittest import mock
+
+from websockets import serve
+
+from config import Config
+from utils import SimulatedClock
+from utils.database import Database, SocketConnector
+from utils.outbox import BatchRejected
+
+from tests import write_config
+
+class SocketServer(Thread):
+
+    def __init__(self, port = 0):
+        """
+        Websocket server that accepts connections like the database's consumer and
+        records the messages it receives. Runs its own event loop in this thread.
+
+        Args:
+            port (int, optional): Port to listen on. Defaults to any free port.
+        """
+        Thread.__init__(self, name = "SocketServer")
+        self.daemon = True
+        self.port = port
+
+        self.messages = queue.Queue()
+        """ Messages received, in order. """
+
+        self.listening = Event()
+        self.loop = None
+        self.stopping = None
+
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+        try:
+            self.loop.run_until_complete(self.serve())
+        finally:
+            self.loop.close()
+
+    async def serve(self):
+        self.stopping = asyncio.Event()
+        async with serve(self.handler, "127.0.0.1", self.port) as server:
+            self.port = next(iter(server.sockets)).getsockname()[1]
+            self.listening.set()
+            await self.stopping.wait()
+
+    async def handler(self, ws, path = None):
+        await ws.send(json.dumps({"type": "websocket.accept"}))
+        async for frame in ws:
+            self.messages.put(json.loads(frame)["text"])
+
+    def start(self):
+        Thread.start(self)
+        if not self.listening.wait(5):
+            raise RuntimeError("Websocket server didn't start.")
+
+    def stop(self):
+        """
+        Closes every connection and stops listening.
+        """
+        if self.is_alive():
+            self.loop.call_soon_threadsafe(self.stopping.set)
+            self.join(5)
+
+    def received(self, count: int):
+        """
+        Returns the `value` of the next `count` messages, waiting for them to arrive.
+        """
+        return [self.messages.get(timeout = 5)["value"] for _ in range(count)]
+
+class SocketConnectorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = self.start_server()
+        self.clock = SimulatedClock()
+
+    def start_server(self, port = 0):
+        server = SocketServer(port)
+        server.start()
+        self.addCleanup(server.stop)
+        return server
+
+    def connector(self, **kwargs):
+        kwargs.setdefault("max_backoff", 0.1)
+        connector = SocketConnector(f"ws://127.0.0.1:{self.server.port}/ws/broadcastData/", "", "", clock = self.clock, **kwargs)
+        self.addCleanup(connector.stop)
+        return connector
+
+    def test_enqueue_leaves_message_alone(self):
+        connector = self.connector()
+        message = {"value": 1}
+        connector.enqueue(message)
+        connector.enqueue({"value": 2, "time": "earlier"})
+
+        self.assertEqual(message, {"value": 1})
+        self.assertEqual(connector.message_queue[0], {"value": 1, "time": str(self.clock.now())})
+        self.assertEqual(connector.message_queue[1]["time"], "earlier")
+
+    def test_sends_in_order(self):
+        connector = self.connector()
+        connector.start()
+        for value in range(20):
+            self.assertTrue(connector.enqueue({"value": value}))
+
+        self.assertEqual(self.server.received(20), list(range(20)))
+
+    def test_full_queue_drops_oldest(self):
+        connector = self.connector(queue_size = 3)
+        with self.assertLogs(level = "WARNING"):
+            results = [connector.enqueue({"value": value}) for value in range(5)]
+        self.assertEqual(results, [True, True, True, False, False])
+        self.assertEqual(connector.dropped, 2)
+
+        connector.start()
+        self.assertEqual(self.server.received(3), [2, 3, 4])
+
+    def test_reconnects_after_server_goes_away(self):
+        connector = self.connector()
+        connector.start()
+        connector.enqueue({"value": 1})
+        self.assertEqual(self.server.received(1), [1])
+
+        port = self.server.port
+        self.server.stop()
+        with self.assertLogs(level = "ERROR"):
+            connector.enqueue({"value": 2})
+            connector.enqueue({"value": 3})
+            # messages are kept while the database is unreachable
+            self.server = self.start_server(port)
+            self.assertEqual(self.server.received(2), [2, 3])
+
+class DatabaseTest(unittest.TestCase):
+
+    def setUp(self):
+        server = SocketServer()
+        server.start()
+        self.addCleanup(server.stop)
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "config.ini")
+        write_config(path, {("OUTBOX", "enabled"): "false", ("SERVER", "server_hostname"): "127.0.0.1",
+                            ("SERVER", "server_port"): server.port})
+
+        self.database = Database(Config(path), clock = SimulatedClock())
+        self.addCleanup(self.database.close)
+
+    def send_device_batch(self, error: Exception):
+        """
+        Sends a device batch without the outbox, as if the database failed it with `error`,
+        and waits for the worker to finish with it.
+        """
+        with mock.patch.object(self.database, "send_batch", side_effect = error):
+            future = self.database.send_device_batch([{"device": "Lamp"}, {"device": "Heater"}])
+            # shutting down waits for the worker, which runs the future's callbacks before it exits
+            self.database.executor.shutdown(wait = True)
+        self.assertIsInstance(future.exception(), type(error))
+
+    def test_rejected_device_batch_is_logged(self):
+        with self.assertLogs(level = "ERROR") as logs:
+            self.send_device_batch(BatchRejected(400, "invalid device"))
+        self.assertIn("Dropped 2 entries sent to /api/device/", logs.output[0])
+        self.assertIn("invalid device", logs.output[0])
+
+    def test_failed_device_batch_is_logged(self):
+        with self.assertLogs(level = "ERROR") as logs:
+            self.send_device_batch(ValueError("bad JSON"))
+        self.assertIn("Failed to send 2 entries to /api/device/. ValueError: bad JSON", logs.output[0])
+
+if __name__ == "__main__":
+    unittest.main()
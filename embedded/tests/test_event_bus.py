@@ -0,0 +1,79 @@
+import queue
+import time
+import unittest
+
+from utils.event_bus import EventBus, EVENTS_DROPPED
+
+class EventBusTest(unittest.TestCase):
+
+    def setUp(self):
+        self.batches = queue.Queue()
+        """ Batches passed to the handler, in order. """
+
+    def bus(self, **kwargs):
+        bus = EventBus(self.batches.put, name = f"TestBus-{self.id()}", **kwargs)
+        self.addCleanup(bus.terminate)
+        return bus
+
+    def test_full_batch_is_dispatched_immediately(self):
+        bus = self.bus(batch_size = 3, flush_interval = 60)
+        bus.start()
+        for value in range(3):
+            bus.publish({"value": value})
+        self.assertEqual(self.batches.get(timeout = 5), [{"value": 0}, {"value": 1}, {"value": 2}])
+
+        # a partial batch waits for the flush interval
+        bus.publish({"value": 3})
+        time.sleep(0.05)
+        self.assertTrue(self.batches.empty())
+        self.assertEqual(list(bus.queue), [{"value": 3}])
+
+    def test_partial_batch_is_dispatched_after_flush_interval(self):
+        bus = self.bus(batch_size = 100, flush_interval = 0.05)
+        bus.publish({"value": 1})
+        bus.publish({"value": 2})
+        start = time.monotonic()
+        bus.start()
+
+        self.assertEqual(self.batches.get(timeout = 5), [{"value": 1}, {"value": 2}])
+        self.assertLess(time.monotonic() - start, 2)
+
+    def test_terminate_dispatches_queued_events(self):
+        bus = self.bus(batch_size = 2, flush_interval = 60)
+        for value in range(3):
+            bus.publish({"value": value})
+        bus.terminate()
+
+        self.assertEqual(self.batches.get_nowait(), [{"value": 0}, {"value": 1}])
+        self.assertEqual(self.batches.get_nowait(), [{"value": 2}])
+
+    def test_handler_errors_dont_stop_dispatch(self):
+        batches = []
+        def handler(batch):
+            batches.append(batch)
+            raise ConnectionError("database unreachable")
+
+        bus = EventBus(handler, batch_size = 1)
+        with self.assertLogs(level = "ERROR") as logs:
+            bus.publish({"value": 1})
+            bus.publish({"value": 2})
+            bus.dispatch()
+        self.assertEqual(batches, [[{"value": 1}], [{"value": 2}]])
+        self.assertEqual(len(logs.output), 2)
+
+    def test_overflow_drops_oldest_and_counts(self):
+        bus = self.bus(batch_size = 10, max_size = 3)
+        dropped = EVENTS_DROPPED.labels(bus = bus.name)
+
+        with self.assertLogs(level = "WARNING") as logs:
+            results = [bus.publish({"value": value}) for value in range(5)]
+        self.assertEqual(results, [True, True, True, False, False])
+        self.assertEqual(bus.dropped, 2)
+        self.assertEqual(dropped.get(), 2)
+        self.assertIn("Dropped oldest event (2 dropped total)", logs.output[-1])
+
+        bus.dispatch()
+        self.assertEqual(self.batches.get_nowait(), [{"value": 2}, {"value": 3}, {"value": 4}])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import random
+import statistics
+import unittest
+
+from utils import Reading
+from utils.filters import EWMA, FilterPipeline, RangeClamp, RateOfChange, RollingMedian, StreamingMedian
+
+class StreamingMedianTest(unittest.TestCase):
+
+    def check(self, values, window):
+        median = StreamingMedian(window)
+        for index, value in enumerate(values):
+            median.add(value)
+            expected = statistics.median(values[max(0, index - window + 1):index + 1])
+            self.assertEqual(median.median(), expected, f"window {window}, after {index + 1} values")
+
+    def test_matches_statistics_median(self):
+        rng = random.Random(0)
+        for window in (1, 2, 3, 4, 5, 8, 21):
+            self.check([rng.uniform(60, 90) for _ in range(500)], window)
+
+    def test_repeated_values(self):
+        rng = random.Random(1)
+        for window in (2, 5, 6):
+            self.check([float(rng.randint(70, 73)) for _ in range(500)], window)
+
+    def test_monotonic_values(self):
+        self.check([float(value) for value in range(200)], 5)
+        self.check([float(value) for value in range(200, 0, -1)], 6)
+
+    def test_heaps_stay_bounded(self):
+        median = StreamingMedian(5)
+        for value in range(10000):
+            median.add(float(value % 97))
+            self.assertLessEqual(len(median.low) + len(median.high), 2 * median.window + 1)
+
+class FilterStageTest(unittest.TestCase):
+
+    def test_range_clamp(self):
+        stage = RangeClamp(temp_min = 0, temp_max = 100, hum_min = 0, hum_max = 100)
+        self.assertEqual(stage.process(70.0, 50.0, 0), (70.0, 50.0))
+        self.assertIsNone(stage.process(-1.0, 50.0, 0))
+        self.assertIsNone(stage.process(70.0, 101.0, 0))
+
+    def test_rate_of_change_accepts_sustained_change(self):
+        stage = RateOfChange(max_temp_rate = 1, max_hum_rate = 5, max_rejections = 3)
+        self.assertIsNotNone(stage.process(70.0, 50.0, 0))
+        # a spike is rejected
+        self.assertIsNone(stage.process(90.0, 50.0, 2))
+        self.assertEqual(stage.process(71.0, 50.0, 4), (71.0, 50.0))
+        # a change that persists is accepted after `max_rejections` rejections
+        results = [stage.process(90.0, 50.0, 6 + 2 * i) for i in range(4)]
+        self.assertEqual(results, [None, None, None, (90.0, 50.0)])
+
+    def test_rolling_median_removes_spikes(self):
+        stage = RollingMedian(window = 3)
+        outputs = [stage.process(temp, 50.0, 0)[0] for temp in (70.0, 71.0, 99.0, 72.0, 73.0)]
+        self.assertEqual(outputs, [70.0, 70.5, 71.0, 72.0, 73.0])
+
+    def test_ewma_weights_by_elapsed_time(self):
+        stage = EWMA(time_constant = 10)
+        self.assertEqual(stage.process(70.0, 50.0, 0), (70.0, 50.0))
+        short = EWMA(time_constant = 10)
+        short.process(70.0, 50.0, 0)
+        # a longer gap moves the average further towards the new value
+        self.assertGreater(stage.process(80.0, 50.0, 20)[0], short.process(80.0, 50.0, 2)[0])
+
+class FilterPipelineTest(unittest.TestCase):
+
+    def test_rejected_samples_are_counted(self):
+        pipeline = FilterPipeline([RangeClamp(), RollingMedian(window = 3)])
+        self.assertIsNone(pipeline.apply(Reading(500.0, 50.0, timestamp = 0, convert = False)))
+
+        reading = pipeline.apply(Reading(70.0, 50.0, timestamp = 10, convert = False))
+        self.assertEqual((reading.temp, reading.hum, reading.timestamp), (70.0, 50.0, 10))
+        self.assertEqual(pipeline.stats(), {
+            "range": {"passed": 1, "rejected": 1},
+            "median": {"passed": 1, "rejected": 0},
+        })
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+import unittest
+
+from devices.gpio import GPIOController, FakeBackend, HIGH, LOW, create_backend
+from utils import SimulatedClock
+from utils.timers import TimerScheduler
+
+class FailingBackend(FakeBackend):
+
+    def write_many(self, levels):
+        raise OSError("GPIO chip went away")
+
+class GPIOControllerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = create_backend("fake")
+        self.gpio = GPIOController(self.backend)
+        for pin in (5, 6, 13):
+            self.gpio.setup_output(pin)
+
+    def test_writes_only_changes(self):
+        self.gpio.write(5, HIGH)
+        self.gpio.write(5, HIGH)
+        self.gpio.write(5, True)
+        self.assertEqual(self.backend.writes, 1)
+        self.assertEqual(self.gpio.read(5), HIGH)
+
+    def test_batch_writes_once(self):
+        with self.gpio.batch():
+            self.gpio.write(5, HIGH)
+            self.gpio.write(6, HIGH)
+            self.gpio.write(13, HIGH)
+            # the shadow register is updated immediately, the hardware when the batch ends
+            self.assertEqual(self.gpio.read(6), HIGH)
+            self.assertEqual(self.backend.levels[6], LOW)
+            self.assertEqual(self.backend.writes, 0)
+
+        self.assertEqual(self.backend.writes, 1)
+        self.assertEqual(self.backend.levels, {5: HIGH, 6: HIGH, 13: HIGH})
+        self.assertFalse(self.gpio.unflushed)
+
+    def test_nested_batches_merge(self):
+        with self.gpio.batch():
+            self.gpio.write(5, HIGH)
+            with self.gpio.batch():
+                self.gpio.write(6, HIGH)
+            self.assertEqual(self.backend.writes, 0)
+            self.gpio.write(13, HIGH)
+
+        self.assertEqual(self.backend.writes, 1)
+        self.assertEqual(self.backend.levels, {5: HIGH, 6: HIGH, 13: HIGH})
+
+    def test_exception_in_batch_still_flushes(self):
+        with self.assertRaises(RuntimeError):
+            with self.gpio.batch():
+                self.gpio.write(5, HIGH)
+                raise RuntimeError("zone update failed")
+
+        self.assertEqual(self.backend.levels[5], HIGH)
+        self.assertEqual(self.gpio.read(5), HIGH)
+        self.assertFalse(self.gpio.unflushed)
+        self.assertIsNone(self.gpio.local.pending)
+
+        # writes after the failed batch go straight to the hardware
+        self.gpio.write(6, HIGH)
+        self.assertEqual(self.backend.levels[6], HIGH)
+
+    def test_failed_flush_is_repaired_by_verify(self):
+        backend = FailingBackend()
+        gpio = GPIOController(backend)
+        gpio.setup_output(5)
+
+        with self.assertRaises(OSError):
+            with gpio.batch():
+                gpio.write(5, HIGH)
+
+        self.assertFalse(gpio.unflushed)
+        self.assertEqual(backend.levels[5], LOW)
+        with self.assertLogs(level = "WARNING"):
+            self.assertEqual(gpio.verify(), [5])
+        self.assertEqual(backend.levels[5], HIGH)
+
+    def test_verify_restores_changed_pins(self):
+        self.gpio.write(5, HIGH)
+        self.assertEqual(self.gpio.verify(), [])
+
+        # another process changes pins behind the controller's back
+        self.backend.levels[5] = LOW
+        self.backend.levels[13] = HIGH
+        with self.assertLogs(level = "WARNING"):
+            self.assertEqual(sorted(self.gpio.verify()), [5, 13])
+        self.assertEqual(self.backend.levels, {5: HIGH, 6: LOW, 13: LOW})
+        self.assertEqual(self.gpio.mismatches, 2)
+
+    def test_verify_skips_pins_waiting_in_a_batch(self):
+        with self.gpio.batch():
+            self.gpio.write(5, HIGH)
+            self.assertEqual(self.gpio.verify(), [])
+            self.assertEqual(self.backend.levels[5], LOW)
+        self.assertEqual(self.backend.levels[5], HIGH)
+        self.assertEqual(self.gpio.mismatches, 0)
+
+    def test_verify_every_repairs_on_schedule(self):
+        clock = SimulatedClock()
+        timers = TimerScheduler(clock)
+        self.gpio.verify_every(timers, 30)
+        self.gpio.write(6, HIGH)
+
+        self.backend.levels[6] = LOW
+        clock.advance(29)
+        timers.run_due()
+        self.assertEqual(self.backend.levels[6], LOW)
+
+        clock.advance(1)
+        with self.assertLogs(level = "WARNING"):
+            timers.run_due()
+        self.assertEqual(self.backend.levels[6], HIGH)
+
+        # the check keeps running
+        self.backend.levels[6] = LOW
+        clock.advance(30)
+        with self.assertLogs(level = "WARNING"):
+            timers.run_due()
+        self.assertEqual(self.backend.levels[6], HIGH)
+        self.assertEqual(self.gpio.mismatches, 2)
+
+if __name__ == "__main__":
+    unittest.main()
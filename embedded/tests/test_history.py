@@ -0,0 +1,111 @@
+import os
+import tempfile
+import unittest
+
+from utils import history
+from utils.history import HistoryFile
+
+class HistoryFileTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "sensor.ring")
+
+    def open(self, capacity: int, is_fahrenheit = True):
+        file = HistoryFile(self.path, capacity, is_fahrenheit = is_fahrenheit)
+        self.addCleanup(file.close)
+        return file
+
+    @staticmethod
+    def fill(file: HistoryFile, start: int, stop: int):
+        for t in range(start, stop):
+            file.append(float(t), 70.0 + t % 10, 50.0)
+
+    def times(self, records):
+        return [record[0] for record in records]
+
+    def test_wraps_around(self):
+        file = self.open(5)
+        self.fill(file, 0, 3)
+        self.assertEqual(self.times(file.since()), [0, 1, 2])
+
+        self.fill(file, 3, 12)
+        self.assertEqual(file.count, 12)
+        self.assertEqual(self.times(file.since()), [7, 8, 9, 10, 11])
+        self.assertEqual(self.times(file.since(9.5)), [10, 11])
+        self.assertEqual(file.since()[-1], (11.0, 71.0, 50.0))
+
+    def test_survives_reopening(self):
+        file = self.open(5)
+        self.fill(file, 0, 8)
+        file.close()
+
+        self.assertEqual(self.times(self.open(5).since()), [3, 4, 5, 6, 7])
+        self.assertEqual(self.times(history.read(self.path)), [3, 4, 5, 6, 7])
+
+    def test_resize_carries_over_recent_readings(self):
+        file = self.open(6)
+        self.fill(file, 0, 10)
+        file.close()
+
+        # shrinking keeps the newest readings
+        file = self.open(3)
+        self.assertEqual(self.times(file.since()), [7, 8, 9])
+        file.close()
+
+        # growing keeps them all and makes room for more
+        file = self.open(8)
+        self.assertEqual(self.times(file.since()), [7, 8, 9])
+        self.fill(file, 10, 14)
+        self.assertEqual(self.times(file.since()), [7, 8, 9, 10, 11, 12, 13])
+
+    def test_unit_change_starts_over(self):
+        file = self.open(5, is_fahrenheit = True)
+        self.fill(file, 0, 3)
+        file.close()
+
+        file = self.open(5, is_fahrenheit = False)
+        self.assertEqual(file.since(), [])
+        self.assertFalse(file.is_fahrenheit)
+
+    def test_other_files_are_replaced(self):
+        with open(self.path, "wb") as f:
+            f.write(b"not a history file" * 10)
+        file = self.open(4)
+        self.assertEqual(file.since(), [])
+        self.fill(file, 0, 2)
+        self.assertEqual(self.times(file.since()), [0, 1])
+
+    def test_readings_are_restored_exactly(self):
+        file = self.open(4)
+        file.append(1700000000.125, 70.1, 45.3)
+        file.close()
+
+        self.assertEqual(self.open(4).since(), [(1700000000.125, 70.1, 45.3)])
+        self.assertEqual(history.read(self.path), [(1700000000.125, 70.1, 45.3)])
+
+    def test_older_versions_start_over(self):
+        file = self.open(4)
+        self.fill(file, 0, 2)
+        file.close()
+        # rewrite the header as an older layout version
+        with open(self.path, "r+b") as f:
+            f.seek(len(history.MAGIC))
+            f.write((history.VERSION - 1).to_bytes(2, "little"))
+
+        with self.assertRaises(ValueError):
+            history.read(self.path)
+        self.assertEqual(self.open(4).since(), [])
+
+    def test_appends_after_close_are_dropped(self):
+        file = self.open(4)
+        self.fill(file, 0, 2)
+        file.close()
+        file.close()
+        file.append(5.0, 70.0, 50.0)
+        self.assertEqual(file.since(), [])
+        self.assertEqual(self.times(history.read(self.path)), [0, 1])
+
+if __name__ == "__main__":
+    unittest.main()
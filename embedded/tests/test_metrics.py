@@ -0,0 +1,102 @@
+import unittest
+
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+from utils.metrics import Counter, Gauge, MetricsRegistry, MetricsServer
+
+class CounterGaugeTest(unittest.TestCase):
+
+    def test_counter_only_counts_up(self):
+        counter = Counter()
+        counter.inc()
+        counter.inc(2.5)
+        self.assertEqual(counter.get(), 3.5)
+
+    def test_gauge_moves_both_ways(self):
+        gauge = Gauge()
+        gauge.set(10)
+        gauge.inc(2)
+        gauge.dec(5)
+        self.assertEqual(gauge.get(), 7)
+
+    def test_gauge_function_is_called_on_each_collect(self):
+        queue = [1, 2]
+        gauge = Gauge()
+        gauge.set(100)
+        gauge.set_function(lambda: len(queue))
+        self.assertEqual(gauge.get(), 2)
+        queue.append(3)
+        self.assertEqual(gauge.get(), 3)
+
+class MetricFamilyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_collect_renders_text_format(self):
+        family = self.registry.counter("relay_toggles_total", "Relay toggles.", ("zone", "relay"))
+        family.labels(zone = "a", relay = "heater").inc(3)
+        family.labels(zone = 'say "hi"', relay = "fan").inc()
+
+        self.assertEqual(family.collect(), [
+            "# HELP relay_toggles_total Relay toggles.",
+            "# TYPE relay_toggles_total counter",
+            'relay_toggles_total{zone="a",relay="heater"} 3.0',
+            'relay_toggles_total{zone="say \\"hi\\"",relay="fan"} 1.0',
+        ])
+
+    def test_collect_renders_histogram_buckets(self):
+        family = self.registry.histogram("read_seconds", "Read latency.", [0.1, 1])
+        histogram = family.labels()
+        for value in (0.05, 0.5, 0.7, 5):
+            histogram.observe(value)
+
+        self.assertEqual(family.collect()[2:], [
+            'read_seconds_bucket{le="0.1"} 1',
+            'read_seconds_bucket{le="1.0"} 3',
+            'read_seconds_bucket{le="+Inf"} 4',
+            "read_seconds_sum 6.25",
+            "read_seconds_count 4",
+        ])
+
+    def test_collect_skips_failing_functions(self):
+        family = self.registry.gauge("queue_depth", "Queue depth.", ("queue",))
+        family.labels(queue = "ok").set_function(lambda: 4)
+        family.labels(queue = "broken").set_function(lambda: 1 / 0)
+        self.assertEqual(family.collect()[2:], ['queue_depth{queue="ok"} 4.0'])
+
+    def test_labels_must_match(self):
+        family = self.registry.counter("requests_total", "Requests.", ("endpoint",))
+        with self.assertRaises(ValueError):
+            family.labels(status = 200)
+
+    def test_kind_conflict_is_rejected(self):
+        self.registry.counter("events_total", "Events.")
+        with self.assertRaises(ValueError):
+            self.registry.gauge("events_total", "Events.")
+
+class MetricsServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = MetricsRegistry()
+        self.registry.counter("readings_total", "Readings.").labels().inc(2)
+        self.server = MetricsServer("127.0.0.1", 0, self.registry)
+        self.server.start()
+        self.url = f"http://127.0.0.1:{self.server.server.server_address[1]}"
+
+    def tearDown(self):
+        self.server.terminate()
+
+    def test_serves_metrics(self):
+        with urlopen(f"{self.url}/metrics", timeout = 5) as response:
+            self.assertEqual(response.status, 200)
+            self.assertTrue(response.headers["Content-Type"].startswith("text/plain; version=0.0.4"))
+            body = response.read().decode()
+        self.assertEqual(body, self.registry.render())
+        self.assertIn("readings_total 2.0\n", body)
+
+    def test_other_paths_are_not_found(self):
+        with self.assertRaises(HTTPError) as context:
+            urlopen(f"{self.url}/", timeout = 5)
+        self.assertEqual(context.exception.code, 404)
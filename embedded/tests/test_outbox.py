@@ -0,0 +1,124 @@
+import os
+import tempfile
+import unittest
+
+from utils import SimulatedClock
+from utils.outbox import Outbox, BatchRejected
+
+class RecordingEndpoint:
+
+    def __init__(self, reject = (), fail = ()):
+        """
+        Stands in for the database. Rejects batches containing a value in `reject`, and fails
+        batches sent to an endpoint in `fail` as if the database were unreachable.
+        """
+        self.reject = set(reject)
+        self.fail = set(fail)
+        self.batches = []
+        """ (endpoint, values) of each accepted batch. """
+
+    def __call__(self, endpoint, rows):
+        values = [row["value"] for row in rows]
+        if endpoint in self.fail:
+            return False
+        if self.reject.intersection(values):
+            raise BatchRejected(400, "invalid value")
+        self.batches.append((endpoint, values))
+        return True
+
+    def sent(self, endpoint):
+        return [value for name, values in self.batches if name == endpoint for value in values]
+
+class OutboxTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "outbox.sqlite3")
+        self.clock = SimulatedClock()
+
+    def outbox(self, endpoint, **kwargs):
+        outbox = Outbox(self.path, endpoint, clock = self.clock, **kwargs)
+        self.addCleanup(outbox.db.close)
+        return outbox
+
+    def test_flush_sends_in_order_and_in_batches(self):
+        endpoint = RecordingEndpoint()
+        outbox = self.outbox(endpoint, batch_size = 4)
+        for value in range(10):
+            outbox.put("/api/data/", {"value": value})
+        outbox.put_many("/api/device/", [{"value": "on"}, {"value": "off"}])
+
+        self.assertEqual(outbox.flush(), 12)
+        self.assertEqual(endpoint.sent("/api/data/"), list(range(10)))
+        self.assertEqual(endpoint.sent("/api/device/"), ["on", "off"])
+        self.assertTrue(all(len(values) <= 4 for _, values in endpoint.batches))
+        self.assertEqual(len(outbox), 0)
+
+    def test_failed_batches_are_kept_for_retry(self):
+        endpoint = RecordingEndpoint(fail = {"/api/data/"})
+        outbox = self.outbox(endpoint)
+        outbox.put_many("/api/data/", [{"value": 1}, {"value": 2}])
+        outbox.put("/api/device/", {"value": "on"})
+
+        # the other endpoint is still flushed
+        self.assertEqual(outbox.flush(), 1)
+        self.assertEqual(len(outbox), 2)
+
+        endpoint.fail.clear()
+        self.assertEqual(outbox.flush(), 2)
+        self.assertEqual(endpoint.sent("/api/data/"), [1, 2])
+        self.assertEqual(len(outbox), 0)
+
+    def test_rejected_rows_are_dead_lettered(self):
+        endpoint = RecordingEndpoint(reject = {3, 11})
+        outbox = self.outbox(endpoint, batch_size = 8)
+        outbox.put_many("/api/data/", [{"value": value} for value in range(16)])
+
+        self.assertEqual(outbox.flush(), 14)
+        self.assertEqual(endpoint.sent("/api/data/"), [value for value in range(16) if value not in (3, 11)])
+        self.assertEqual([data["value"] for _, data, _ in outbox.dead_letters()], [3, 11])
+        self.assertEqual(len(outbox), 0)
+
+    def test_data_survives_a_restart(self):
+        outbox = self.outbox(RecordingEndpoint(fail = {"/api/data/"}))
+        outbox.put_many("/api/data/", [{"value": value} for value in range(3)])
+        outbox.terminate()
+        outbox.db.close()
+
+        endpoint = RecordingEndpoint()
+        outbox = self.outbox(endpoint)
+        self.assertEqual(outbox.flush(), 3)
+        self.assertEqual(endpoint.sent("/api/data/"), [0, 1, 2])
+
+    def test_writes_are_committed_in_groups(self):
+        outbox = self.outbox(RecordingEndpoint(), batch_size = 5, commit_interval = 5)
+        outbox.put("/api/data/", {"value": 0})
+        self.assertEqual(outbox.pending, 1)
+
+        # a full batch is committed
+        outbox.put_many("/api/data/", [{"value": value} for value in range(1, 5)])
+        self.assertEqual(outbox.pending, 0)
+
+        # as is a write made after the commit interval
+        outbox.put("/api/data/", {"value": 5})
+        self.clock.advance(5)
+        outbox.put("/api/data/", {"value": 6})
+        self.assertEqual(outbox.pending, 0)
+
+    def test_oldest_rows_are_trimmed(self):
+        endpoint = RecordingEndpoint()
+        outbox = self.outbox(endpoint, batch_size = 100, max_size = 64 * 1024)
+        for start in range(0, 2000, 100):
+            outbox.put_many("/api/data/", [{"value": value, "padding": "x" * 200} for value in range(start, start + 100)])
+
+        self.assertLess(len(outbox), 2000)
+
+        # the newest rows are kept, in order
+        outbox.flush()
+        sent = endpoint.sent("/api/data/")
+        self.assertGreater(len(sent), 0)
+        self.assertEqual(sent, list(range(2000 - len(sent), 2000)))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import unittest
+
+from utils import ReadingBuffer, SimulatedClock
+
+START = 1_700_000_000
+""" Wall-clock time the tests start at. """
+
+class ReadingBufferTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = SimulatedClock(start = START)
+        self.buffer = ReadingBuffer(10, clock = self.clock)
+
+    def fill(self, count: int):
+        """
+        Appends `count` readings one second apart. The temperature of each is its index.
+        """
+        for i in range(count):
+            self.clock.advance(1)
+            self.buffer.append_values(float(i), 50.0, self.clock.time())
+
+    def test_expired_entries_are_evicted(self):
+        self.fill(10)
+        self.assertEqual(len(self.buffer), 10)
+
+        # the oldest entry was appended at 1 and expires once it is older than 10 seconds
+        self.clock.advance(1.5)
+        self.assertEqual(len(self.buffer), 9)
+        self.assertEqual(self.buffer.oldest().temp, 1.0)
+        self.assertEqual(self.buffer.latest().temp, 9.0)
+
+        self.clock.advance(100)
+        self.assertEqual(len(self.buffer), 0)
+        self.assertIsNone(self.buffer.average())
+        self.assertIsNone(self.buffer.latest())
+
+    def test_average_tracks_evictions(self):
+        self.fill(10)
+        self.clock.advance(4.5)
+        temps = [reading.temp for reading in self.buffer]
+        self.assertEqual(temps, [4.0, 5.0, 6.0, 7.0, 8.0, 9.0])
+        self.assertAlmostEqual(self.buffer.average().temp, sum(temps) / len(temps), places = 2)
+        self.assertAlmostEqual(self.buffer.average().hum, 50.0)
+
+        count, temp_sum, hum_sum, timestamp, is_fahrenheit = self.buffer.totals()
+        self.assertEqual((count, temp_sum, hum_sum), (6, sum(temps), 300.0))
+        self.assertEqual(timestamp, START + 10)
+        self.assertTrue(is_fahrenheit)
+
+    def test_columns_are_compacted(self):
+        self.fill(10)
+
+        # a few evictions only move the head
+        self.clock.advance(3.5)
+        self.buffer.remove_old_entries()
+        self.assertEqual(self.buffer.head, 3)
+        self.assertEqual(len(self.buffer.temps), 10)
+
+        # once more than half of the columns is dead space they are compacted
+        self.clock.advance(4)
+        self.buffer.remove_old_entries()
+        self.assertEqual(self.buffer.head, 0)
+        self.assertEqual(list(self.buffer.temps), [7.0, 8.0, 9.0])
+        self.assertEqual(len(self.buffer.monotonic), 3)
+        self.assertAlmostEqual(self.buffer.average().temp, 8.0)
+
+    def test_long_running_buffer_stays_bounded(self):
+        for i in range(1000):
+            self.clock.advance(1)
+            self.buffer.append_values(float(i % 7), 50.0, self.clock.time())
+            self.assertLessEqual(len(self.buffer.temps), 2 * 11)
+
+        temps = [reading.temp for reading in self.buffer]
+        self.assertEqual(len(temps), 11)
+        self.assertAlmostEqual(self.buffer.average().temp, sum(temps) / len(temps), places = 2)
+
+    def test_snapshot_is_cached_until_modified(self):
+        self.fill(3)
+        snapshot = self.buffer.snapshot()
+        self.assertIs(self.buffer.snapshot(), snapshot)
+
+        self.buffer.append_values(1.0, 2.0, self.clock.time())
+        self.assertIsNot(self.buffer.snapshot(), snapshot)
+        self.assertEqual(len(snapshot), 3)
+
+    def test_restore_skips_stale_and_future_entries(self):
+        now = self.clock.time()
+        entries = [
+            (now - 30, 1.0, 50.0),
+            (now - 8, 2.0, 50.0),
+            (now - 3, 3.0, 50.0),
+            (now + 5, 4.0, 50.0),
+        ]
+        self.assertEqual(self.buffer.restore(entries), 2)
+        self.assertEqual([reading.temp for reading in self.buffer], [2.0, 3.0])
+        self.assertEqual(self.buffer.oldest().timestamp, now - 8)
+
+        # restored entries expire by their capture time
+        self.clock.advance(2.5)
+        self.assertEqual([reading.temp for reading in self.buffer], [3.0])
+
+    def test_restore_keeps_entries_ordered(self):
+        self.fill(5)
+        now = self.clock.time()
+
+        # entries older than the newest buffered one would break the eviction order
+        restored = self.buffer.restore([(now - 2, 10.0, 50.0), (now, 11.0, 50.0)], is_fahrenheit = False)
+        self.assertEqual(restored, 1)
+        self.assertEqual(self.buffer.latest().temp, 11.0)
+        self.assertFalse(self.buffer.latest().is_fahrenheit)
+
+if __name__ == "__main__":
+    unittest.main()
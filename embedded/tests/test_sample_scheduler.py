@@ -0,0 +1,78 @@
+import unittest
+
+from utils import SimulatedClock
+from utils.sample_scheduler import SampleScheduler
+
+class SensorStub:
+
+    def __init__(self, clock: SimulatedClock, results, read_time = 0.5):
+        """
+        A sensor whose reads take `read_time` seconds and return the next value of `results`.
+        """
+        self.clock = clock
+        self.results = list(results)
+        self.read_time = read_time
+        self.attempts = []
+        """ Monotonic time of each read. """
+
+    def __call__(self):
+        self.attempts.append(self.clock.monotonic())
+        self.clock.advance(self.read_time)
+        return self.results.pop(0) if self.results else None
+
+class SampleSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = SimulatedClock()
+
+    def run_samples(self, scheduler: SampleScheduler, read, count: int):
+        """
+        Takes `count` samples, waiting for each to come due. Returns the start time of each sample.
+        """
+        starts = []
+        for _ in range(count):
+            self.clock.advance(scheduler.delay())
+            starts.append(self.clock.monotonic())
+            scheduler.sample(read)
+        return starts
+
+    def test_samples_stay_on_the_grid(self):
+        scheduler = SampleScheduler(period = 2, clock = self.clock)
+        read = SensorStub(self.clock, [1] * 5, read_time = 0.7)
+
+        # read time doesn't make the cadence drift
+        self.assertEqual(self.run_samples(scheduler, read, 5), [0, 2, 4, 6, 8])
+        self.assertEqual(scheduler.latency.count, 5)
+        self.assertEqual(scheduler.retries.counts[0], 5)
+
+    def test_offset_staggers_the_grid(self):
+        scheduler = SampleScheduler(period = 4, offset = 1, clock = self.clock)
+        read = SensorStub(self.clock, [1] * 3)
+        self.assertEqual(self.run_samples(scheduler, read, 3), [1, 5, 9])
+
+    def test_retries_respect_min_interval_and_deadline(self):
+        scheduler = SampleScheduler(period = 2, deadline = 6, min_interval = 2, clock = self.clock)
+        read = SensorStub(self.clock, [], read_time = 0.5)
+
+        self.assertIsNone(scheduler.sample(read))
+        gaps = [b - a for a, b in zip(read.attempts, read.attempts[1:])]
+        self.assertTrue(all(gap >= 2 for gap in gaps))
+        self.assertLessEqual(read.attempts[-1] + read.read_time - read.attempts[0], 6)
+        self.assertEqual(scheduler.failures, 1)
+
+    def test_failures_back_off(self):
+        scheduler = SampleScheduler(period = 2, deadline = 0, max_backoff = 16, clock = self.clock)
+        read = SensorStub(self.clock, [], read_time = 0)
+
+        starts = self.run_samples(scheduler, read, 6)
+        gaps = [b - a for a, b in zip(starts, starts[1:])]
+        self.assertEqual(gaps, [4, 8, 16, 16, 16])
+
+        # a success returns to the normal cadence
+        read.results = [1, 1, 1]
+        starts = self.run_samples(scheduler, read, 3)
+        self.assertEqual([b - a for a, b in zip(starts, starts[1:])], [2, 2])
+        self.assertEqual(scheduler.failures, 0)
+
+if __name__ == "__main__":
+    unittest.main()
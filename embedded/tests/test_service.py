@@ -0,0 +1,100 @@
+import os
+import tempfile
+import unittest
+
+from unittest import mock
+
+from devices import tempsensor
+from main import STALE_READING_TIMEOUT
+from simulation import Simulation
+
+from tests import write_config
+
+ZONES = {
+    ("SENSOR", "sensors"): "left:4, right:17",
+    ("THERMOSTAT", "hardware_interval"): 10,
+    ("ZONE left", "sensors"): "left",
+    ("ZONE left", "heater"): 23,
+    ("ZONE left", "humidifier"): 24,
+    ("ZONE left", "lamp"): 25,
+    ("ZONE left", "desired_temp"): 80,
+    ("ZONE right", "sensors"): "right",
+    ("ZONE right", "heater"): 5,
+    ("ZONE right", "humidifier"): 6,
+    ("ZONE right", "lamp"): 13,
+    ("ZONE right", "desired_temp"): 60,
+}
+""" Two zones with one sensor each. Sensors are sampled every 2 seconds, staggered by 1 second. """
+
+class ServiceLoopTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "config.ini")
+        write_config(self.path, ZONES)
+
+        # the simulation replaces the sensor library, so restore it for the other tests
+        self.addCleanup(setattr, tempsensor, "Adafruit_DHT", tempsensor.Adafruit_DHT)
+
+    def run_service(self, seconds: float, events: dict = None):
+        """
+        Runs the service's main loop for `seconds` of simulated time, calling each function in
+        `events` with the simulation when the number of seconds it is keyed by have passed.
+
+        Returns:
+            list[tuple[str, float]]: Zone and monotonic time of each zone update, in order.
+        """
+        self.simulation = Simulation(self.path, days = seconds / 86400, failure_rate = 0)
+        self.service = self.simulation.service
+        self.start = self.simulation.clock.monotonic()
+        for delay, event in (events or {}).items():
+            self.service.timers.schedule(delay, delay, lambda event = event: event(self.simulation))
+
+        updates = []
+        update_zone = self.service.update_zone
+        def record(zone, current):
+            updates.append((zone.id, current - self.start))
+            update_zone(zone, current)
+
+        with mock.patch.object(self.service, "update_zone", side_effect = record):
+            self.service.start()
+        return updates
+
+    def test_zone_updates_when_its_sensor_samples(self):
+        updates = self.run_service(60)
+
+        left = [time for zone, time in updates if zone == "left"]
+        right = [time for zone, time in updates if zone == "right"]
+        self.assertEqual(left, [float(t) for t in range(0, 60, 2)])
+        self.assertEqual(right, [float(t) for t in range(1, 60, 2)])
+
+    def test_zone_devices_follow_their_setpoints(self):
+        self.run_service(30)
+        left, right = self.service.zones
+
+        # both enclosures start at 72F, below the left zone's setpoint and above the right one's
+        levels = self.simulation.gpio.levels
+        self.assertEqual(levels[left.heater.relay.pin], left.heater.relay.ON)
+        self.assertEqual(levels[right.heater.relay.pin], right.heater.relay.OFF)
+
+    def test_stale_readings_are_reported_and_recovered_from(self):
+        def set_failure_rate(rate):
+            return lambda simulation: setattr(simulation.dht, "failure_rate", rate)
+
+        # the sensors stop responding at 10 seconds and recover at 150
+        with self.assertLogs(level = "ERROR") as logs:
+            updates = self.run_service(200, {10: set_failure_rate(1.0), 150: set_failure_rate(0.0)})
+
+        # reported every 60 seconds until the sensors come out of their backoff at 196 seconds
+        stale = [line for line in logs.output if "No new sensor readings" in line]
+        self.assertEqual(len(stale), 3)
+        self.assertIn(f"in {STALE_READING_TIMEOUT} seconds", stale[0])
+
+        times = [time for zone, time in updates]
+        self.assertTrue([time for time in times if time <= 10])
+        self.assertFalse([time for time in times if 10 < time < 150])
+        self.assertTrue([time for time in times if time >= 150])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+
+from utils import SimulatedClock
+from utils.timers import TimerScheduler
+
+class TimerSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = SimulatedClock()
+        self.timers = TimerScheduler(self.clock)
+        self.calls = []
+
+    def callback(self, name):
+        return lambda: self.calls.append((name, self.clock.monotonic()))
+
+    def run_until(self, seconds: float):
+        """
+        Advances the clock to `seconds`, running timers as their deadlines pass.
+        """
+        while True:
+            delay = self.timers.run_due()
+            if delay is None or self.clock.monotonic() + delay > seconds:
+                break
+            self.clock.advance(delay)
+        self.clock.advance(seconds - self.clock.monotonic())
+        self.timers.run_due()
+
+    def test_timers_run_in_deadline_order(self):
+        self.timers.schedule("b", 5, self.callback("b"))
+        self.timers.schedule("a", 2, self.callback("a"))
+        self.timers.schedule("c", 9, self.callback("c"))
+
+        self.assertEqual(self.timers.run_due(), 2)
+        self.run_until(10)
+        self.assertEqual(self.calls, [("a", 2), ("b", 5), ("c", 9)])
+        self.assertIsNone(self.timers.run_due())
+
+    def test_rescheduling_extends_to_the_later_deadline(self):
+        self.timers.schedule("spray", 5, self.callback("first"))
+        self.clock.advance(2)
+        self.timers.schedule("spray", 5, self.callback("second"))
+
+        self.run_until(20)
+        self.assertEqual(self.calls, [("second", 7)])
+
+    def test_rescheduling_earlier_keeps_the_deadline(self):
+        self.timers.schedule("spray", 10, self.callback("first"))
+        self.timers.schedule("spray", 3, self.callback("second"))
+        self.assertTrue(self.timers.pending("spray"))
+
+        # the callback is replaced, but only called once at the later deadline
+        self.run_until(20)
+        self.assertEqual(self.calls, [("second", 10)])
+
+    def test_cancel(self):
+        self.timers.schedule("a", 5, self.callback("a"))
+        self.timers.schedule("b", 6, self.callback("b"))
+
+        self.assertTrue(self.timers.cancel("a"))
+        self.assertFalse(self.timers.cancel("a"))
+        self.assertFalse(self.timers.pending("a"))
+
+        self.run_until(10)
+        self.assertEqual(self.calls, [("b", 6)])
+
+    def test_cancel_all(self):
+        for key in range(3):
+            self.timers.schedule(key, key + 1, self.callback(key))
+        self.assertEqual(self.timers.cancel_all(), 3)
+
+        self.run_until(10)
+        self.assertEqual(self.calls, [])
+
+    def test_callbacks_can_reschedule(self):
+        def repeat():
+            self.calls.append(("repeat", self.clock.monotonic()))
+            self.timers.schedule("repeat", 4, repeat)
+        self.timers.schedule("repeat", 4, repeat)
+
+        self.run_until(13)
+        self.assertEqual(self.calls, [("repeat", 4), ("repeat", 8), ("repeat", 12)])
+
+    def test_failing_callback_doesnt_stop_others(self):
+        def fail():
+            raise RuntimeError("relay failed")
+        self.timers.schedule("fail", 1, fail)
+        self.timers.schedule("ok", 1, self.callback("ok"))
+
+        with self.assertLogs(level = "ERROR"):
+            self.run_until(2)
+        self.assertEqual(self.calls, [("ok", 1)])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,4 +1,5 @@
-from .reading_buffer import ReadingBuffer
+from .clock import Clock, SimulatedClock, DEFAULT_CLOCK
+from .reading_buffer import ReadingBuffer, ReadingView
 from .database import Database, SocketConnector
 from .reading import Reading
-from .now import now
\ No newline at end of file
+from .now import now
@@ -0,0 +1,115 @@
+import time
+
+from datetime import datetime
+from threading import Event, Lock
+
+import pytz
+
+TIMEZONE = pytz.timezone("US/Central")
+""" The timezone used for all wall-clock timestamps. Looked up once at import. """
+
+class Clock:
+
+    def __init__(self, timezone = TIMEZONE):
+        """
+        Source of time for the application. It provides a monotonic clock for measuring
+        intervals and expiring data, and a wall clock for timestamping data.
+
+        All components that need the time accept a `Clock` so that it can be replaced
+        by a `SimulatedClock` in tests and benchmarks.
+
+        Args:
+            timezone (tzinfo, optional): Timezone of datetimes returned by `now`. Defaults to US/Central.
+        """
+        self.timezone = timezone
+        """ Timezone of datetimes returned by `now`. """
+
+    def monotonic(self):
+        """
+        Returns seconds from a monotonic clock. Only differences between values are meaningful.
+        """
+        return time.monotonic()
+
+    def time(self):
+        """
+        Returns the current wall-clock time in seconds since the epoch.
+        """
+        return time.time()
+
+    def now(self):
+        """
+        Returns the current time as a timezone-aware datetime.
+        """
+        return datetime.fromtimestamp(self.time(), self.timezone)
+
+    def from_timestamp(self, timestamp: float):
+        """
+        Returns the epoch `timestamp` as a timezone-aware datetime.
+        """
+        return datetime.fromtimestamp(timestamp, self.timezone)
+
+    def wait(self, event: Event, timeout: float):
+        """
+        Waits up to `timeout` seconds for `event` to be set.
+
+        Returns:
+            bool: True if the event is set, False otherwise.
+        """
+        return event.wait(timeout)
+
+    def sleep(self, seconds: float):
+        """
+        Blocks for `seconds` seconds.
+        """
+        time.sleep(seconds)
+
+class SimulatedClock(Clock):
+
+    def __init__(self, start: float = None, timezone = TIMEZONE):
+        """
+        A clock that only moves when it is advanced. Waiting and sleeping advance the
+        clock instantly instead of blocking, so code driven by this clock can run many
+        times faster than real time.
+
+        Args:
+            start (float, optional): Initial wall-clock time in seconds since the epoch. Defaults to the current time.
+            timezone (tzinfo, optional): Timezone of datetimes returned by `now`. Defaults to US/Central.
+        """
+        super().__init__(timezone)
+
+        self.lock = Lock()
+        """ Guards the current time. """
+
+        self._monotonic = 0.0
+        """ Current monotonic time. """
+
+        self._time = time.time() if start is None else start
+        """ Current wall-clock time. """
+
+    def advance(self, seconds: float):
+        """
+        Moves the clock forward by `seconds` seconds.
+        """
+        if seconds <= 0:
+            return
+        with self.lock:
+            self._monotonic += seconds
+            self._time += seconds
+
+    def monotonic(self):
+        return self._monotonic
+
+    def time(self):
+        return self._time
+
+    def wait(self, event: Event, timeout: float):
+        if event.is_set():
+            return True
+        self.advance(timeout)
+        return event.is_set()
+
+    def sleep(self, seconds: float):
+        self.advance(seconds)
+
+DEFAULT_CLOCK = Clock()
+""" The clock used by components that aren't given one. """
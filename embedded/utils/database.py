@@ -3,27 +3,112 @@ import requests
 import json
 import asyncio
 import os
-from queue import Queue
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from random import random
+from threading import Thread, Event, Lock
+from requests.adapters import HTTPAdapter
 from config import Config
 from utils.reading import Reading
 from websockets import connect
 
-from .now import now
+from .clock import Clock, DEFAULT_CLOCK
+from .event_bus import EventBus
+from .metrics import REGISTRY
+from .outbox import Outbox, BatchRejected
 
 
 LOGGER = logging.getLogger()
 
 logging.getLogger("websockets").setLevel(logging.WARNING)
 
+REQUEST_BOUNDS = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+""" Bucket bounds of the request latency histograms, in seconds. """
+
+HTTP_LATENCY = REGISTRY.histogram("climate_http_request_seconds", "Latency of requests to the database.", REQUEST_BOUNDS, ("endpoint",))
+HTTP_REQUESTS = REGISTRY.counter("climate_http_requests_total", "Requests to the database by outcome.", ("endpoint", "result"))
+WEBSOCKET_LATENCY = REGISTRY.histogram("climate_websocket_send_seconds", "Time taken to send each websocket message.", REQUEST_BOUNDS)
+WEBSOCKET_MESSAGES = REGISTRY.counter("climate_websocket_messages_total", "Websocket messages by outcome.", ("result",))
+QUEUE_DEPTH = REGISTRY.gauge("climate_uplink_queue_depth", "Entries waiting to be sent to the database.", ("queue",))
+
+class EndpointStats:
+
+    def __init__(self, endpoint: str = ""):
+        """
+        Success, failure and latency counters for requests made to a single endpoint.
+        They are also exported as metrics labelled with `endpoint`.
+        """
+        self.lock = Lock()
+        """ Guards all counters. """
+
+        self.successes = 0
+        """ Number of requests that returned the expected status code. """
+
+        self.failures = 0
+        """ Number of requests that failed or returned an unexpected status code. """
+
+        self.total_latency = 0.0
+        """ Sum of the latencies of all requests, in seconds. """
+
+        self.max_latency = 0.0
+        """ Highest latency of any request, in seconds. """
+
+        self.latency = HTTP_LATENCY.labels(endpoint = endpoint)
+        self.ok = HTTP_REQUESTS.labels(endpoint = endpoint, result = "ok")
+        self.failed = HTTP_REQUESTS.labels(endpoint = endpoint, result = "failed")
+
+    def record(self, success: bool, latency: float):
+        """
+        Records the outcome of a single request.
+
+        Args:
+            success (bool): True if the request succeeded.
+            latency (float): Time taken by the request, in seconds.
+        """
+        with self.lock:
+            if success:
+                self.successes += 1
+            else:
+                self.failures += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+        self.latency.observe(latency)
+        (self.ok if success else self.failed).inc()
+
+    def to_dict(self):
+        """
+        Returns the current counters as a dictionary.
+        """
+        with self.lock:
+            count = self.successes + self.failures
+            return {
+                "successes": self.successes,
+                "failures": self.failures,
+                "avg_latency": self.total_latency / count if count else 0.0,
+                "max_latency": self.max_latency,
+            }
+
+    def __str__(self):
+        stats = self.to_dict()
+        return f"{stats['successes']} ok, {stats['failures']} failed, avg {stats['avg_latency'] * 1000:.0f}ms, max {stats['max_latency'] * 1000:.0f}ms"
+
 class Database():
 
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, clock: Clock = None):
         """
         Utility for posting data to the local database server.
+
+        Args:
+            config (Config): Application configuration.
+            clock (Clock, optional): Clock used to timestamp outgoing data. Defaults to the system clock.
         """
         self.config = config
         """ Application configuration. """
 
+        self.clock = clock or DEFAULT_CLOCK
+        """ Clock used to timestamp outgoing data. """
+
         self.http_url = f"http://{config.server_hostname}:{config.server_port}"
         """ HTTP URL to the database. """
 
@@ -36,105 +121,429 @@ class Database():
         self.password = os.getenv("DJANGO_PASSWORD")
         """ Database Password. """
 
-        self.websocket = SocketConnector(self.ws_url + config.socket_endpoint, self.user, self.password)
+        self.timeout = (config.http_connect_timeout, config.http_read_timeout)
+        """ Connect and read timeouts of HTTP requests, in seconds. """
+
+        self.session = requests.Session()
+        """ HTTP session that keeps connections to the database alive between requests. """
+
+        self.session.auth = (self.user, self.password)
+        self.session.mount("http://", HTTPAdapter(pool_connections = 1, pool_maxsize = config.http_workers))
+
+        self.executor = ThreadPoolExecutor(max_workers = config.http_workers, thread_name_prefix = "Database")
+        """ Worker pool that sends HTTP requests so callers never wait on the network. """
+
+        self.stats: dict[str, EndpointStats] = {}
+        """ Request counters for each endpoint. """
+
+        self.stats_lock = Lock()
+        """ Guards creation of entries in `stats`. """
+
+        self.outbox = None
+        """ Durable queue that climate and device data is stored in until the database accepts it. None if disabled. """
+
+        if config.outbox_enabled:
+            self.outbox = Outbox(config.outbox_path, self.send_batch, clock = self.clock, batch_size = config.outbox_batch_size,
+                                 flush_interval = config.outbox_flush_interval, max_size = config.outbox_max_size)
+            self.outbox.start()
+
+        self.device_events = EventBus(self.send_device_batch, name = "DeviceEvents")
+        """ Device events are published here and shipped to the database in batches. """
+
+        self.device_events.start()
+
+        self.websocket = SocketConnector(self.ws_url + config.socket_endpoint, self.user, self.password,
+                                         clock = self.clock, queue_size = config.socket_queue_size)
         """ Database websocket connection. """
 
+        self.websocket.start()
+
+        QUEUE_DEPTH.labels(queue = "websocket").set_function(lambda: len(self.websocket.message_queue))
+        QUEUE_DEPTH.labels(queue = "device_events").set_function(lambda: len(self.device_events.queue))
+        if self.outbox is not None:
+            QUEUE_DEPTH.labels(queue = "outbox").set_function(lambda: len(self.outbox))
+
+    def apply_config(self, config: Config):
+        """
+        Switches to a reloaded `config`. Endpoints and HTTP timeouts take effect with the
+        next request; the server address and connection pools only change on restart.
+        """
+        self.timeout = (config.http_connect_timeout, config.http_read_timeout)
+        self.config = config
+
     def send_climate_data(self, data: Reading):
-        self.__send_data(data, self.config.climate_endpoint)
+        """
+        Sends climate `data` to the database. If the outbox is enabled the data is stored
+        locally and sent with the next batch, otherwise it is posted in the background.
+        """
+        return self.store(data, self.config.climate_endpoint)
 
     def send_device_data(self, data):
-        self.__send_data(data, self.config.device_endpoint)
+        """
+        Sends device `data` to the database. If the outbox is enabled the data is stored
+        locally and sent with the next batch, otherwise it is posted in the background.
+        """
+        return self.store(data, self.config.device_endpoint)
+
+    def publish_device_event(self, data):
+        """
+        Queues device `data` to be sent to the database with the next batch of device events.
+        This does no I/O, so it is safe to call while switching hardware.
+        """
+        self.device_events.publish(data)
+
+    def send_device_batch(self, batch):
+        """
+        Sends a batch of device events to the database. They are added to the outbox in a
+        single write if it is enabled, otherwise they are posted to `createbatch` in the background.
+        """
+        endpoint = self.config.device_endpoint
+        if self.outbox is None:
+            future = self.executor.submit(self.send_batch, endpoint, batch)
+            future.add_done_callback(lambda future: self.log_batch_error(future, endpoint, len(batch)))
+            return future
+        self.outbox.put_many(endpoint, batch)
+
+    def log_batch_error(self, future, endpoint, count):
+        """
+        Logs the error of a batch posted in the background. Nothing else waits on the
+        future, so without this a rejected batch would be dropped silently.
+        """
+        if future.cancelled():
+            return
+        e = future.exception()
+        if isinstance(e, BatchRejected):
+            LOGGER.error(f"Dropped {count} entries sent to {endpoint}. {str(e)}")
+        elif e is not None:
+            LOGGER.error(f"Failed to send {count} entries to {endpoint}. {type(e).__name__}: {e}")
+
+    def store(self, data, endpoint):
+        """
+        Adds `data` to the outbox to be sent to `endpoint`, or posts it in the background if the outbox is disabled.
+        """
+        if self.outbox is None:
+            return self.post(data, endpoint)
+
+        if "time" not in data.keys():
+            data["time"] = str(self.clock.now())
+        self.outbox.put(endpoint, data)
+
+    def post(self, data, endpoint):
+        """
+        Queues a post request containing `data` to the database server at
+        `endpoint`. This returns immediately; the request is made by a worker thread.
+
+        Returns:
+            Future: Resolves to True if the database stored the data, False otherwise.
+        """
+        # timestamp when the data is captured, not when a worker gets to it
+        if "time" not in data.keys():
+            data["time"] = str(self.clock.now())
+        return self.executor.submit(self.__send_data, data, endpoint)
+
+    def send_batch(self, endpoint, batch):
+        """
+        Posts a list of entries to the `createbatch` action of `endpoint`. This blocks
+        until the request completes and is used by the outbox thread.
+
+        Returns:
+            bool: True if the database stored every entry, False if the request failed and can be retried.
+
+        Raises:
+            BatchRejected: If the database refused the batch with a 4xx status, e.g. because an entry is invalid.
+        """
+        response = self.__send_data({"batch": batch}, endpoint + "createbatch/", response = True)
+        if response is None:
+            return False
+        if 400 <= response.status_code < 500:
+            raise BatchRejected(response.status_code, response.text)
+        return response.status_code == 201
+
+    def get_stats(self, endpoint):
+        """
+        Returns the request counters for `endpoint`, creating them if needed.
+        """
+        stats = self.stats.get(endpoint)
+        if stats is None:
+            with self.stats_lock:
+                stats = self.stats.setdefault(endpoint, EndpointStats(endpoint))
+        return stats
 
     def send_climate_data_websocket(self, data: Reading):
-        self.websocket.send(data)
+        """
+        Queues `data` to be broadcast over the websocket. Never blocks.
+        """
+        self.websocket.enqueue(data)
 
-    def __send_data(self, data, endpoint, timeout = 20):
+    def close(self):
+        """
+        Stops the websocket uplink, the outbox and the HTTP workers. Requests already in
+        progress are allowed to finish, and unsent outbox entries are kept on disk.
+        """
+        self.websocket.stop()
+        self.device_events.terminate()
+        if self.outbox is not None:
+            self.outbox.terminate()
+        self.executor.shutdown(wait = False)
+        for endpoint, stats in self.stats.items():
+            LOGGER.info(f"Requests to {endpoint}: {stats}")
+
+    def __send_data(self, data, endpoint, response = False):
         """
         Makes a post request containing `data` to the database
         server at the specified `endpoint`.
-        """
-        if "time" not in data.keys():
-            data["time"] = str(now())
 
+        Returns:
+            bool, Response: True if the database stored the data. If `response` is True, the
+                response instead, or None if the request failed.
+        """
+        stats = self.get_stats(endpoint)
+        start = time.perf_counter()
         try:
-            r = requests.post(self.http_url + endpoint, timeout = timeout, json = data, auth = (self.user, self.password))
+            r = self.session.post(self.http_url + endpoint, timeout = self.timeout, json = data)
         except Exception as e:
+            stats.record(False, time.perf_counter() - start)
             LOGGER.error(f"Failed to update database. Error: {e}")
-            return False
-        if r.status_code == 201:
-            LOGGER.debug(f"Database updated successfully with entry {data}")
-            return True
-        LOGGER.error(f"Database returned status code of {r.status_code}. Content: {r.content}")
-        return False
+            return None if response else False
+
+        success = r.status_code == 201
+        stats.record(success, time.perf_counter() - start)
+        if success:
+            LOGGER.debug(f"Database updated successfully at {endpoint}")
+        else:
+            LOGGER.error(f"Database returned status code of {r.status_code}. Content: {r.content}")
+        return r if response else success
 
-class SocketConnector:
+class SocketConnector(Thread):
 
-    def __init__(self, url: str, user: str, password: str):
+    def __init__(self, url: str, user: str, password: str, clock: Clock = None, queue_size = 100,
+                 connect_timeout = 5, max_backoff = 60):
         """
-        Utility for posting data to the local database server.
+        Uplink to the database websocket. This runs its own asyncio event loop in a background
+        thread which owns a persistent websocket connection. Messages are handed to it through
+        `enqueue`, which never blocks, so a backend outage can't stall the caller.
+
+        If the queue is full the oldest message is dropped, since only the most recent
+        readings are useful to live clients. If the connection fails it is retried with
+        exponential backoff.
+
+        Args:
+            url (str): Websocket URL.
+            user (str): Database username.
+            password (str): Database password.
+            clock (Clock, optional): Clock used to timestamp messages. Defaults to the system clock.
+            queue_size (int, optional): Maximum number of messages waiting to be sent. Defaults to 100.
+            connect_timeout (int, optional): Seconds to wait for the connection and its handshake. Defaults to 5.
+            max_backoff (int, optional): Maximum seconds to wait between reconnection attempts. Defaults to 60.
         """
+        Thread.__init__(self, name = "SocketConnector")
+
+        self.daemon = True
+        """ Sets this thread in `daemon` mode so it never keeps the process alive. """
+
         self.url = url
         self.user = user
         self.password = password
+        self.clock = clock or DEFAULT_CLOCK
+
         self.ws = None
-        self.message_queue = Queue()
-        self.loop = asyncio.get_event_loop()
+        """ The open websocket connection, or None if disconnected. """
+
+        self.connect_timeout = connect_timeout
+        """ Seconds to wait for the connection and its handshake. """
+
+        self.max_backoff = max_backoff
+        """ Maximum seconds to wait between reconnection attempts. """
+
+        self.message_queue = deque(maxlen = queue_size)
+        """ Messages waiting to be sent. Appending to a full queue drops its oldest message. """
+
+        self.dropped = 0
+        """ Number of messages dropped because the queue was full. """
+
+        self.loop = None
+        """ The event loop owned by this thread. Set once the thread has started. """
+
+        self._ready = Event()
+        """ Set once `loop` and the asyncio events below exist. """
+
+        self._wakeup = None
+        """ asyncio Event set whenever a message is enqueued. """
+
+        self._stopping = None
+        """ asyncio Event set when the thread should exit. """
+
+    def enqueue(self, message: dict):
+        """
+        Queues `message` to be sent over the websocket. Never blocks.
+
+        Args:
+            message (dict): JSON-compatible message. If it has no `time` key, a copy with one is queued instead.
+
+        Returns:
+            bool: False if an older message had to be dropped to make room, True otherwise.
+        """
+        if "time" not in message:
+            message = dict(message, time = str(self.clock.now()))
+
+        queue = self.message_queue
+        dropped = len(queue) == queue.maxlen
+        queue.append(message)
+
+        if dropped:
+            self.dropped += 1
+            WEBSOCKET_MESSAGES.labels(result = "dropped").inc()
+            LOGGER.warning(f"Websocket queue is full. Dropped oldest message ({self.dropped} dropped total).")
+
+        if self._ready.is_set() and not self.loop.is_closed():
+            try:
+                self.loop.call_soon_threadsafe(self._wakeup.set)
+            except RuntimeError:
+                # the uplink was stopped and its loop closed in the meantime; the message is
+                # discarded with the rest of the queue
+                pass
+        return not dropped
+
+    def send(self, data, timeout = 5):
+        """
+        Queues `data` to be sent over the websocket. Kept for compatibility; see `enqueue`.
+        """
+        return self.enqueue(data)
+
+    def run(self):
+        """
+        Runs the uplink event loop until `stop` is called.
+        """
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self._main())
+        finally:
+            self.loop.close()
+
+    async def _main(self):
+        self._wakeup = asyncio.Event()
+        self._stopping = asyncio.Event()
+        self._ready.set()
+
+        failures = 0
+        while not self._stopping.is_set():
 
-    async def connect(self, close_timeout = 5):
+            if not await self.connect():
+                # exponential backoff with jitter, interrupted only by `stop`
+                delay = min(self.max_backoff, 2 ** failures) * (1 + random() / 10)
+                failures += 1
+                LOGGER.debug(f"Retrying websocket connection in {delay:.1f} seconds.")
+                await self._wait(self._stopping, delay)
+                continue
+            failures = 0
+
+            if not await self._drain():
+                continue
+
+            await self._wait(self._wakeup, None)
+            self._wakeup.clear()
+
+        await self.close()
+
+    async def _wait(self, event: asyncio.Event, timeout):
+        """
+        Waits up to `timeout` seconds for `event`, waking early if the thread is stopping.
+        """
+        waiters = {asyncio.ensure_future(event.wait()), asyncio.ensure_future(self._stopping.wait())}
+        _, pending = await asyncio.wait(waiters, timeout = timeout, return_when = asyncio.FIRST_COMPLETED)
+        for waiter in pending:
+            waiter.cancel()
+
+    async def _drain(self):
+        """
+        Sends all queued messages. A message is only removed from the queue once it has been sent.
+
+        Returns:
+            bool: True if the queue was emptied, False if the connection was lost.
+        """
+        queue = self.message_queue
+        while queue:
+            message = queue[0]
+            start = time.perf_counter()
+            try:
+                await self._send(message)
+            except Exception as e:
+                WEBSOCKET_MESSAGES.labels(result = "failed").inc()
+                LOGGER.error(f"Lost websocket connection to database. Error: {e}")
+                await self.close()
+                return False
+
+            WEBSOCKET_LATENCY.labels().observe(time.perf_counter() - start)
+            WEBSOCKET_MESSAGES.labels(result = "sent").inc()
+
+            # the sensor thread may have pushed the message out of a full queue while it was being sent
+            if queue and queue[0] is message:
+                queue.popleft()
+        return True
+
+    async def connect(self):
         """
         This connects to the websocket and verifies a successful
         connection.
         """
-        if self.ws and self.ws.open:
+        if self.ws is not None:
             return True
 
         LOGGER.debug(f"Connecting to {self.url}")
         try:
-            self.ws = await connect(self.url, close_timeout = close_timeout)
-        except asyncio.TimeoutError as e:
-            LOGGER.error("Failed to make socket connection to database.")
+            ws = await asyncio.wait_for(connect(self.url, close_timeout = self.connect_timeout), self.connect_timeout)
+
+            # makes sure the backend responded with "websocket.accept"
+            response = json.loads(await asyncio.wait_for(ws.recv(), self.connect_timeout))
+        except Exception as e:
+            LOGGER.error(f"Failed to make socket connection to database. Error: {e}")
             return False
 
-        # makes sure the backend responded with "websocket.accept"
-        response = json.loads(await self.ws.recv())
         if "type" in response.keys() and response["type"] == "websocket.accept":
             LOGGER.info("Websocket connection established.")
+            self.ws = ws
             return True
 
+        LOGGER.error(f"Database rejected websocket connection. Response: {response}")
+        await ws.close()
         return False
 
-    async def _send(self, message):
-
-        if not await self.connect():
-            return False
-
-        if "time" not in message.keys():
-            message["time"] = str(now())
-
-        await self.ws.send(
-            json.dumps(
-                {
-                    "type": "receive.json",
-                    "text": message
-                }
-            )
+    @staticmethod
+    def frame(message):
+        """
+        Wraps `message` in the envelope expected by the database's consumer and encodes it.
+        """
+        return json.dumps(
+            {
+                "type": "receive.json",
+                "text": message
+            }
         )
-        return True
-
-    async def begin_event_loop(self):
-
-        while True:
-            while not self.message_queue.empty():
-                await self._send(self.message_queue.popleft())
-            asyncio.sleep(1)
-
-    def start(self):
-        asyncio.run(self.begin_event_loop())
 
-    async def stop(self):
-        if self.ws is not None:
-            await self.ws.close()
-
-    def send(self, data, timeout = 5):
-        return self.loop.run_until_complete(self._send(data))
+    async def _send(self, message):
+        await self.ws.send(self.frame(message))
 
+    async def close(self):
+        """
+        Closes the websocket connection, if open.
+        """
+        ws, self.ws = self.ws, None
+        if ws is not None:
+            try:
+                await ws.close()
+            except Exception:
+                pass
+
+    def stop(self, timeout = 5):
+        """
+        Stops the uplink thread and closes the connection. Unsent messages are discarded.
+        """
+        if self._ready.is_set() and not self.loop.is_closed():
+            try:
+                self.loop.call_soon_threadsafe(self._stopping.set)
+            except RuntimeError:
+                # loop closed in the meantime
+                pass
+        if self.is_alive():
+            self.join(timeout)
@@ -0,0 +1,106 @@
+import logging
+
+from collections import deque
+from threading import Thread, Event
+
+from .metrics import REGISTRY
+
+LOGGER = logging.getLogger()
+
+EVENTS_DROPPED = REGISTRY.counter("climate_events_dropped_total", "Events dropped because an event bus was full.", ("bus",))
+
+class EventBus(Thread):
+
+    def __init__(self, handler, name = "EventBus", batch_size = 100, flush_interval = 1, max_size = 1000):
+        """
+        In-memory queue that decouples producers of events from whatever ships them. Publishing
+        an event only appends it to a queue; this thread collects queued events into batches
+        and passes each batch to `handler`.
+
+        Args:
+            handler (Callable[[list[dict]], None]): Called from this thread with each batch of events.
+            name (str, optional): Name of the thread. Defaults to "EventBus".
+            batch_size (int, optional): Maximum number of events per batch. A full batch is
+                dispatched immediately. Defaults to 100.
+            flush_interval (int, optional): Maximum seconds an event waits before being dispatched. Defaults to 1.
+            max_size (int, optional): Maximum number of queued events. The oldest event is
+                dropped when full, which is counted and logged. Defaults to 1000.
+        """
+        Thread.__init__(self, name = name)
+
+        self.daemon = True
+        """ Sets this thread in `daemon` mode so it never keeps the process alive. """
+
+        self.handler = handler
+        """ Called with each batch of events. """
+
+        self.batch_size = batch_size
+        """ Maximum number of events per batch. """
+
+        self.flush_interval = flush_interval
+        """ Maximum seconds an event waits before being dispatched. """
+
+        self.queue = deque(maxlen = max_size)
+        """ Events waiting to be dispatched. Appending to a full queue drops its oldest event. """
+
+        self.dropped = 0
+        """ Number of events dropped because the queue was full. """
+
+        self.term = Event()
+        """ Used to terminate this thread. """
+
+        self.wakeup = Event()
+        """ Set when a full batch is waiting. """
+
+    def publish(self, event: dict):
+        """
+        Queues `event` to be dispatched. Never blocks and does no I/O.
+
+        Returns:
+            bool: False if an older event had to be dropped to make room, True otherwise.
+        """
+        queue = self.queue
+        dropped = len(queue) == queue.maxlen
+        queue.append(event)
+        if len(queue) >= self.batch_size:
+            self.wakeup.set()
+
+        if dropped:
+            self.dropped += 1
+            EVENTS_DROPPED.labels(bus = self.name).inc()
+            LOGGER.warning(f"{self.name} queue is full. Dropped oldest event ({self.dropped} dropped total).")
+        return not dropped
+
+    def dispatch(self):
+        """
+        Passes all queued events to the handler in batches of up to `batch_size`.
+        """
+        queue = self.queue
+        while queue:
+            batch = []
+            while queue and len(batch) < self.batch_size:
+                batch.append(queue.popleft())
+            try:
+                self.handler(batch)
+            except Exception as e:
+                LOGGER.error(f"Failed to dispatch {len(batch)} events from {self.name}: {str(e)}")
+
+    def run(self):
+        """
+        Dispatches queued events every `flush_interval` seconds, or as soon as a batch
+        is full, until terminate() is called.
+        """
+        while not self.term.is_set():
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self.dispatch()
+
+    def terminate(self, timeout = 5):
+        """
+        Stops this thread after dispatching any queued events.
+        """
+        self.term.set()
+        self.wakeup.set()
+        if self.is_alive():
+            self.join(timeout)
+        self.dispatch()
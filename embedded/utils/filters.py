@@ -0,0 +1,288 @@
+import heapq
+import logging
+import math
+
+from collections import Counter, deque
+
+from .reading import Reading
+
+LOGGER = logging.getLogger()
+
+class FilterStage:
+    """
+    A single step of a `FilterPipeline`. Each stage sees every sample that passed the
+    stages before it and either returns (possibly adjusted) values or rejects the sample.
+    """
+
+    name = "stage"
+    """ Name of the stage in counters and logs. """
+
+    def __init__(self):
+        self.passed = 0
+        """ Number of samples this stage passed on. """
+
+        self.rejected = 0
+        """ Number of samples this stage rejected. """
+
+    def process(self, temp: float, hum: float, timestamp: float):
+        """
+        Filters a sample.
+
+        Returns:
+            tuple[float, float], None: Filtered (temperature, humidity), or None to reject the sample.
+        """
+        raise NotImplementedError()
+
+class RangeClamp(FilterStage):
+
+    name = "range"
+
+    def __init__(self, temp_min = -40.0, temp_max = 176.0, hum_min = 0.0, hum_max = 100.0):
+        """
+        Rejects samples outside the physical range of the sensor. The defaults are the
+        DHT22's rated range in Fahrenheit.
+        """
+        super().__init__()
+        self.temp_min = temp_min
+        self.temp_max = temp_max
+        self.hum_min = hum_min
+        self.hum_max = hum_max
+
+    def process(self, temp, hum, timestamp):
+        if not (self.temp_min <= temp <= self.temp_max and self.hum_min <= hum <= self.hum_max):
+            return None
+        return temp, hum
+
+class RateOfChange(FilterStage):
+
+    name = "rate"
+
+    def __init__(self, max_temp_rate = 1.0, max_hum_rate = 5.0, max_rejections = 3):
+        """
+        Rejects samples that differ from the last accepted sample by more than a maximum
+        rate. After `max_rejections` rejections in a row the change is assumed to be real,
+        and the next sample is accepted as the new reference.
+
+        Args:
+            max_temp_rate (float, optional): Maximum temperature change per second. Defaults to 1.
+            max_hum_rate (float, optional): Maximum humidity percentage change per second. Defaults to 5.
+            max_rejections (int, optional): Consecutive rejections before the reference is reset. Defaults to 3.
+        """
+        super().__init__()
+        self.max_temp_rate = max_temp_rate
+        self.max_hum_rate = max_hum_rate
+        self.max_rejections = max_rejections
+        self.last = None
+        """ Last accepted (temperature, humidity, timestamp). """
+        self.streak = 0
+        """ Number of consecutive rejections. """
+
+    def process(self, temp, hum, timestamp):
+        if self.last is not None and self.streak < self.max_rejections:
+            last_temp, last_hum, last_time = self.last
+            # readings are never closer than the sensor's 2 second minimum
+            elapsed = max(timestamp - last_time, 1.0)
+            if abs(temp - last_temp) > self.max_temp_rate * elapsed or abs(hum - last_hum) > self.max_hum_rate * elapsed:
+                self.streak += 1
+                return None
+
+        self.streak = 0
+        self.last = (temp, hum, timestamp)
+        return temp, hum
+
+class StreamingMedian:
+
+    def __init__(self, window: int):
+        """
+        Median of the last `window` values. The lower half of the window is kept in a
+        max-heap and the upper half in a min-heap. Values leaving the window are only
+        marked for deletion, and removed once they reach the top of their heap. The heaps
+        are rebuilt whenever deleted values make up half of them, so each update is
+        amortized O(log w).
+        """
+        self.window = window
+        self.values = deque()
+        """ Values in the window, oldest first. """
+        self.low = []
+        """ Max-heap of the lower half, stored negated. """
+        self.high = []
+        """ Min-heap of the upper half. """
+        self.low_size = 0
+        """ Number of live values in `low`. """
+        self.high_size = 0
+        """ Number of live values in `high`. """
+        self.deleted = Counter()
+        """ Values that left the window but are still in a heap. """
+
+    def _prune(self, heap: list, sign: int):
+        while heap and self.deleted[sign * heap[0]] > 0:
+            self.deleted[sign * heap[0]] -= 1
+            heapq.heappop(heap)
+
+    def _balance(self):
+        if self.low_size > self.high_size + 1:
+            heapq.heappush(self.high, -heapq.heappop(self.low))
+            self.low_size -= 1
+            self.high_size += 1
+            self._prune(self.low, -1)
+        elif self.low_size < self.high_size:
+            heapq.heappush(self.low, -heapq.heappop(self.high))
+            self.high_size -= 1
+            self.low_size += 1
+            self._prune(self.high, 1)
+
+    def add(self, value: float):
+        """
+        Adds `value` to the window, evicting the oldest value if the window is full.
+        """
+        if not self.low or value <= -self.low[0]:
+            heapq.heappush(self.low, -value)
+            self.low_size += 1
+        else:
+            heapq.heappush(self.high, value)
+            self.high_size += 1
+        self._balance()
+
+        self.values.append(value)
+        if len(self.values) > self.window:
+            old = self.values.popleft()
+            self.deleted[old] += 1
+            if old <= -self.low[0]:
+                self.low_size -= 1
+                if old == -self.low[0]:
+                    self._prune(self.low, -1)
+            else:
+                self.high_size -= 1
+                if old == self.high[0]:
+                    self._prune(self.high, 1)
+            self._balance()
+
+            # deleted values deep in a heap are only pruned once they reach the top,
+            # so rebuild the heaps if they have grown to twice the window
+            if len(self.low) + len(self.high) > 2 * self.window:
+                self._rebuild()
+
+    def _rebuild(self):
+        """
+        Rebuilds both heaps from the values in the window, dropping deleted values.
+        """
+        ordered = sorted(self.values)
+        half = (len(ordered) + 1) // 2
+        self.low = [-value for value in ordered[:half]]
+        self.high = ordered[half:]
+        heapq.heapify(self.low)
+        self.low_size = len(self.low)
+        self.high_size = len(self.high)
+        self.deleted.clear()
+
+    def median(self):
+        if self.low_size > self.high_size:
+            return -self.low[0]
+        return (-self.low[0] + self.high[0]) / 2
+
+class RollingMedian(FilterStage):
+
+    name = "median"
+
+    def __init__(self, window = 5):
+        """
+        Replaces each sample with the median of the last `window` samples, which removes
+        isolated spikes without the lag of a long average.
+        """
+        super().__init__()
+        self.temps = StreamingMedian(window)
+        self.hums = StreamingMedian(window)
+
+    def process(self, temp, hum, timestamp):
+        self.temps.add(temp)
+        self.hums.add(hum)
+        return self.temps.median(), self.hums.median()
+
+class EWMA(FilterStage):
+
+    name = "ewma"
+
+    def __init__(self, time_constant = 10.0):
+        """
+        Exponentially weighted moving average. The weight of each sample depends on the
+        time since the previous one, so gaps from failed reads are handled correctly.
+
+        Args:
+            time_constant (float, optional): Seconds for the average to move 63% of the way to a new value. Defaults to 10.
+        """
+        super().__init__()
+        self.time_constant = time_constant
+        self.state = None
+        """ Current (temperature, humidity, timestamp). """
+
+    def process(self, temp, hum, timestamp):
+        if self.state is not None:
+            last_temp, last_hum, last_time = self.state
+            alpha = 1 - math.exp(-max(timestamp - last_time, 0.0) / self.time_constant)
+            temp = last_temp + alpha * (temp - last_temp)
+            hum = last_hum + alpha * (hum - last_hum)
+        self.state = (temp, hum, timestamp)
+        return temp, hum
+
+STAGES = {stage.name: stage for stage in (RangeClamp, RateOfChange, RollingMedian, EWMA)}
+""" Filter stages by the name used in the config. """
+
+class FilterPipeline:
+
+    def __init__(self, stages: list):
+        """
+        Runs each sample through a sequence of filter stages. A sample rejected by any
+        stage is dropped and never reaches the reading buffer.
+
+        Args:
+            stages (list[FilterStage]): Stages, in the order samples pass through them.
+        """
+        self.stages = stages
+
+    @staticmethod
+    def from_config(config):
+        """
+        Creates a pipeline from the FILTER settings of `config`. Each sensor needs its own
+        pipeline, since stages keep state between samples.
+        """
+        stages = []
+        for name in config.filter_stages:
+            if name == RangeClamp.name:
+                stages.append(RangeClamp(config.filter_temp_min, config.filter_temp_max, config.filter_hum_min, config.filter_hum_max))
+            elif name == RateOfChange.name:
+                stages.append(RateOfChange(config.filter_max_temp_rate, config.filter_max_hum_rate))
+            elif name == RollingMedian.name:
+                stages.append(RollingMedian(config.filter_median_window))
+            elif name == EWMA.name:
+                stages.append(EWMA(config.filter_ewma_time_constant))
+        return FilterPipeline(stages)
+
+    def apply(self, reading: Reading):
+        """
+        Filters `reading`.
+
+        Returns:
+            Reading, None: A reading with the filtered values and the original timestamp, or None if it was rejected.
+        """
+        temp, hum, timestamp = reading.temp, reading.hum, reading.timestamp
+        for stage in self.stages:
+            values = stage.process(temp, hum, timestamp)
+            if values is None:
+                stage.rejected += 1
+                LOGGER.debug(f"Filter '{stage.name}' rejected {reading}.")
+                return None
+            stage.passed += 1
+            temp, hum = values
+
+        if not self.stages:
+            return reading
+        return Reading(temp, hum, timestamp = timestamp, is_fahrenheit = reading.is_fahrenheit, convert = False, clock = reading.clock)
+
+    def stats(self):
+        """
+        Returns the number of samples passed and rejected by each stage.
+        """
+        return {stage.name: {"passed": stage.passed, "rejected": stage.rejected} for stage in self.stages}
+
+    def __str__(self):
+        return ", ".join(f"{stage.name} rejected {stage.rejected}/{stage.passed + stage.rejected}" for stage in self.stages)
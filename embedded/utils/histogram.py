@@ -0,0 +1,58 @@
+from bisect import bisect_left
+from threading import Lock
+
+class Histogram:
+
+    def __init__(self, bounds: list):
+        """
+        Counts observations in fixed buckets. Each bucket counts observations that are less
+        than or equal to its upper bound, plus one overflow bucket for anything larger.
+
+        Args:
+            bounds (list[float]): Sorted upper bounds of the buckets.
+        """
+        self.bounds = list(bounds)
+        """ Sorted upper bounds of the buckets. """
+
+        self.counts = [0] * (len(self.bounds) + 1)
+        """ Number of observations in each bucket. The last entry is the overflow bucket. """
+
+        self.count = 0
+        """ Total number of observations. """
+
+        self.sum = 0.0
+        """ Sum of all observations. """
+
+        self.lock = Lock()
+        """ Guards all counters. """
+
+    def observe(self, value: float):
+        """
+        Records a single observation.
+        """
+        index = bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def quantile(self, q: float):
+        """
+        Returns the upper bound of the bucket containing the `q` quantile, from 0 to 1.
+        Returns infinity if it falls in the overflow bucket, or None if nothing was observed.
+        """
+        with self.lock:
+            if self.count == 0:
+                return None
+            target = q * self.count
+            seen = 0
+            for bound, count in zip(self.bounds, self.counts):
+                seen += count
+                if seen >= target:
+                    return bound
+            return float("inf")
+
+    def __str__(self):
+        if self.count == 0:
+            return "no observations"
+        return f"n={self.count} avg={self.sum / self.count:.3g} p50<={self.quantile(0.5)} p99<={self.quantile(0.99)}"
@@ -0,0 +1,200 @@
+"""
+Fixed-size history of sensor readings, kept in a memory-mapped ring file.
+
+Run as a module to print the history of a sensor, e.g. for the simulation's trace replay:
+
+    python -m utils.history data/history/DHT22.ring --hours 1 > trace.csv
+"""
+import argparse
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+
+from threading import Lock
+
+LOGGER = logging.getLogger()
+
+MAGIC = b"CCRH"
+""" Identifies history files. """
+
+VERSION = 2
+""" Version of the file layout. Version 1 stored temperature and humidity as 32-bit floats. """
+
+HEADER = struct.Struct("<4sHHIBxxxQ")
+""" File header: magic, version, record size, capacity, is_fahrenheit, padding and the number of records ever written. """
+
+RECORD = struct.Struct("<ddd")
+""" A reading: capture time in seconds since the epoch, temperature and humidity. """
+
+COUNT_OFFSET = HEADER.size - 8
+""" Offset of the record count in the header. """
+
+class HistoryFile:
+
+    def __init__(self, path: str, capacity: int, is_fahrenheit = True):
+        """
+        Ring buffer of the most recent `capacity` readings of a sensor, stored in a memory-mapped
+        file. Each reading is a fixed 24 byte record written in place, followed by an update of
+        the record count in the header, so appending costs two small memory writes and no system
+        calls. The kernel writes dirty pages back in the background, so the file survives
+        restarts and crashes of the process; only the last few seconds may be lost on power loss.
+
+        If the file exists with a different capacity, its most recent readings are carried over.
+        If it was written in a different unit or layout version, or is not a history file, it is started over.
+
+        Args:
+            path (str): Path of the file. Created if it doesn't exist.
+            capacity (int): Number of readings kept.
+            is_fahrenheit (bool, optional): Unit of the temperatures stored. Defaults to True.
+        """
+        self.path = path
+        self.capacity = capacity
+        self.is_fahrenheit = is_fahrenheit
+        self.lock = Lock()
+        """ Guards appends. """
+
+        carried = self._carry_over()
+
+        size = HEADER.size + capacity * RECORD.size
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size != size or carried is not None:
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, size)
+            self.map = mmap.mmap(fd, size)
+            """ The mapped file. """
+        finally:
+            os.close(fd)
+
+        magic, version, record_size, file_capacity, unit, self.count = HEADER.unpack_from(self.map, 0)
+        if (magic, version, record_size, file_capacity, bool(unit)) != (MAGIC, VERSION, RECORD.size, capacity, is_fahrenheit):
+            HEADER.pack_into(self.map, 0, MAGIC, VERSION, RECORD.size, capacity, int(is_fahrenheit), 0)
+            self.count = 0
+            for record in carried or []:
+                self.append(*record)
+
+    def _carry_over(self):
+        """
+        Returns the readings of an existing file that must be resized, or None if it doesn't need to be.
+        """
+        try:
+            with open(self.path, "rb") as f:
+                header = f.read(HEADER.size)
+        except FileNotFoundError:
+            return None
+        if len(header) < HEADER.size:
+            return None
+
+        magic, version, record_size, capacity, unit, _ = HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION or record_size != RECORD.size or bool(unit) != self.is_fahrenheit:
+            return None
+        if capacity == self.capacity:
+            return None
+
+        LOGGER.info(f"Resizing {self.path} from {capacity} to {self.capacity} readings.")
+        return read(self.path)[-self.capacity:]
+
+    def append(self, timestamp: float, temp: float, hum: float):
+        """
+        Writes a reading over the oldest one.
+        """
+        with self.lock:
+            if self.map.closed:
+                return
+            index = self.count % self.capacity
+            RECORD.pack_into(self.map, HEADER.size + index * RECORD.size, timestamp, temp, hum)
+            # the count is written last, so readers never see a partly written record
+            self.count += 1
+            struct.pack_into("<Q", self.map, COUNT_OFFSET, self.count)
+
+    def since(self, timestamp: float = None):
+        """
+        Returns the stored readings captured at or after `timestamp`, oldest first.
+
+        Returns:
+            list[tuple[float, float, float]]: (timestamp, temperature, humidity) of each reading.
+        """
+        with self.lock:
+            if self.map.closed:
+                return []
+            return records(self.map, self.capacity, self.count, timestamp)
+
+    def flush(self):
+        """
+        Writes the file to disk now instead of waiting for the kernel.
+        """
+        self.map.flush()
+
+    def close(self):
+        """
+        Writes the file to disk and unmaps it. Readings appended afterwards are dropped.
+        Closing a closed file does nothing.
+        """
+        with self.lock:
+            if self.map.closed:
+                return
+            self.map.flush()
+            self.map.close()
+
+def records(buffer, capacity: int, count: int, since: float = None):
+    """
+    Returns the readings in a mapped history file, oldest first, skipping those before `since`.
+    Readings are scanned newest first, so reading a short window of a large file is cheap.
+    """
+    result = []
+    for n in range(count - 1, count - min(count, capacity) - 1, -1):
+        record = RECORD.unpack_from(buffer, HEADER.size + (n % capacity) * RECORD.size)
+        if since is not None and record[0] < since:
+            break
+        result.append(record)
+    result.reverse()
+    return result
+
+def read(path: str, since: float = None):
+    """
+    Reads the readings in the history file at `path` without locking it, so it can be used
+    while the service is writing to it. Readings overwritten during the read are dropped.
+
+    Returns:
+        list[tuple[float, float, float]]: (timestamp, temperature, humidity) of each reading, oldest first.
+    """
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ) as buffer:
+            magic, version, record_size, capacity, _, count = HEADER.unpack_from(buffer, 0)
+            if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+                raise ValueError(f"{path} is not a history file.")
+            result = records(buffer, capacity, count)
+            written = struct.unpack_from("<Q", buffer, COUNT_OFFSET)[0] - count
+
+    # the writer may have wrapped around onto the oldest records while they were copied
+    if written > 0:
+        result = result[written:]
+    if since is not None:
+        result = [record for record in result if record[0] >= since]
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(prog = "python -m utils.history", description = "Print the readings in a sensor history file.")
+    parser.add_argument("path", help = "History file.")
+    parser.add_argument("--hours", type = float, help = "Only print the last HOURS of readings.")
+    parser.add_argument("--format", choices = ("csv", "json"), default = "csv", help = "Output format.")
+    args = parser.parse_args()
+
+    since = time.time() - args.hours * 3600 if args.hours else None
+    rows = read(args.path, since)
+
+    if args.format == "json":
+        json.dump([{"time": t, "temperature": round(temp, 2), "humidity": round(hum, 2)} for t, temp, hum in rows], sys.stdout)
+        print()
+        return
+
+    print("time,temperature,humidity")
+    for t, temp, hum in rows:
+        print(f"{t:.3f},{temp:.2f},{hum:.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import gzip
+import logging
+import os
+import queue
+import shutil
+
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+
+class CompressingFileHandler(TimedRotatingFileHandler):
+
+    def __init__(self, filename: str, retention = 14):
+        """
+        Writes to `filename` and rotates it at midnight. Rotated files are gzip compressed
+        and only the latest `retention` of them are kept.
+
+        Args:
+            filename (str): Path of the current log file.
+            retention (int, optional): Number of rotated files to keep. Defaults to 14.
+        """
+        super().__init__(filename, when = "midnight", backupCount = retention, encoding = "utf-8", delay = True)
+        self.namer = lambda name: name + ".gz"
+        self.rotator = CompressingFileHandler.compress
+
+    @staticmethod
+    def compress(source: str, dest: str):
+        """
+        Compresses the rotated file `source` into `dest`.
+        """
+        with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        os.remove(source)
+
+class DeferredQueueHandler(QueueHandler):
+
+    def __init__(self, log_queue: queue.Queue):
+        """
+        Hands log records to a `QueueListener` without formatting them. Messages are
+        formatted by the listener thread, so arguments passed to a log call must not be
+        modified afterwards. If the queue is full the record is dropped instead of blocking.
+
+        Args:
+            log_queue (Queue): Queue read by the listener.
+        """
+        super().__init__(log_queue)
+
+        self.dropped = 0
+        """ Number of records dropped because the queue was full. """
+
+    def prepare(self, record: logging.LogRecord):
+        # tracebacks refer to the caller's frames, so they must be formatted now
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+def setup_logging(logger: logging.Logger, formatter: logging.Formatter, handlers: list, queue_size = 10000):
+    """
+    Routes all records of `logger` through a queue to `handlers`, which run on a
+    background listener thread. Callers only pay for putting a record on the queue,
+    so slow file or console writes never block them.
+
+    Args:
+        logger (Logger): Logger to attach the queue to.
+        formatter (Formatter): Formatter used by all handlers.
+        handlers (list[Handler]): Handlers that do the actual output.
+        queue_size (int, optional): Maximum number of records waiting to be written. Defaults to 10000.
+
+    Returns:
+        QueueListener: The started listener. Call `stop()` to flush it on exit.
+    """
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(queue_size)
+    logger.addHandler(DeferredQueueHandler(log_queue))
+
+    listener = QueueListener(log_queue, *handlers, respect_handler_level = True)
+    listener.start()
+    return listener
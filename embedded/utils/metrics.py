@@ -0,0 +1,246 @@
+import logging
+import math
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread, Lock
+
+from .histogram import Histogram
+
+LOGGER = logging.getLogger()
+
+class Counter:
+
+    def __init__(self):
+        """
+        A value that only goes up.
+        """
+        self.value = 0.0
+        self.lock = Lock()
+
+    def inc(self, amount: float = 1):
+        with self.lock:
+            self.value += amount
+
+    def get(self):
+        return self.value
+
+class Gauge:
+
+    def __init__(self):
+        """
+        A value that can go up and down. It can also be computed by a function when it is
+        collected, which keeps the cost of tracking things like queue sizes off the hot path.
+        """
+        self.value = 0.0
+        self.function = None
+        self.lock = Lock()
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.inc(-amount)
+
+    def set_function(self, function):
+        """
+        Computes the value by calling `function` each time it is collected.
+        """
+        self.function = function
+
+    def get(self):
+        if self.function is not None:
+            return self.function()
+        return self.value
+
+class MetricFamily:
+
+    def __init__(self, name: str, help: str, kind: str, labels: tuple, factory):
+        """
+        All metrics with the same name, one for each combination of label values.
+
+        Args:
+            name (str): Metric name.
+            help (str): Description of the metric.
+            kind (str): "counter", "gauge" or "histogram".
+            labels (tuple[str]): Names of the labels.
+            factory (Callable[[], object]): Creates the metric of a new combination of label values.
+        """
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.label_names = tuple(labels)
+        self.factory = factory
+        self.children = {}
+        """ Metric of each combination of label values. """
+        self.lock = Lock()
+
+    def key(self, labels: dict):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"Metric {self.name} takes labels {self.label_names}, got {tuple(labels)}.")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def labels(self, **labels):
+        """
+        Returns the metric for these label values, creating it if needed.
+        """
+        key = self.key(labels)
+        child = self.children.get(key)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(key, self.factory())
+        return child
+
+    def attach(self, child, **labels):
+        """
+        Collects an existing metric under these label values, replacing any metric already there.
+        Lets components that already keep a `Histogram` expose it without observing twice.
+        """
+        key = self.key(labels)
+        with self.lock:
+            self.children[key] = child
+        return child
+
+    def collect(self):
+        """
+        Returns the lines of this family in the Prometheus text format.
+        """
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            children = list(self.children.items())
+
+        for key, child in children:
+            labels = list(zip(self.label_names, key))
+            if self.kind == "histogram":
+                with child.lock:
+                    counts = list(child.counts)
+                    total = child.count
+                    observed = child.sum
+                cumulative = 0
+                for bound, count in zip(child.bounds, counts):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{format_labels(labels + [('le', format_value(bound))])} {cumulative}")
+                lines.append(f"{self.name}_bucket{format_labels(labels + [('le', '+Inf')])} {total}")
+                lines.append(f"{self.name}_sum{format_labels(labels)} {format_value(observed)}")
+                lines.append(f"{self.name}_count{format_labels(labels)} {total}")
+            else:
+                try:
+                    value = child.get()
+                except Exception as e:
+                    LOGGER.debug(f"Failed to collect {self.name}: {str(e)}")
+                    continue
+                lines.append(f"{self.name}{format_labels(labels)} {format_value(value)}")
+        return lines
+
+def format_labels(labels: list):
+    if not labels:
+        return ""
+    escaped = (
+        f'{name}="' + str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for name, value in labels
+    )
+    return "{" + ",".join(escaped) + "}"
+
+def format_value(value: float):
+    value = float(value)
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    return repr(value)
+
+class MetricsRegistry:
+
+    def __init__(self):
+        """
+        Holds all metrics of the process and renders them in the Prometheus text format.
+        Metrics are created on first use, so modules can declare them at import.
+        """
+        self.families = {}
+        """ Metric families by name. """
+        self.lock = Lock()
+
+    def _family(self, name, help, kind, labels, factory):
+        with self.lock:
+            family = self.families.get(name)
+            if family is None:
+                family = self.families[name] = MetricFamily(name, help, kind, labels, factory)
+            elif family.kind != kind:
+                raise ValueError(f"Metric {name} is already registered as a {family.kind}.")
+            return family
+
+    def counter(self, name: str, help: str, labels: tuple = ()):
+        return self._family(name, help, "counter", labels, Counter)
+
+    def gauge(self, name: str, help: str, labels: tuple = ()):
+        return self._family(name, help, "gauge", labels, Gauge)
+
+    def histogram(self, name: str, help: str, bounds: list, labels: tuple = ()):
+        return self._family(name, help, "histogram", labels, lambda: Histogram(bounds))
+
+    def render(self):
+        """
+        Returns all metrics in the Prometheus text exposition format.
+        """
+        with self.lock:
+            families = list(self.families.values())
+        lines = []
+        for family in families:
+            lines.extend(family.collect())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
+""" Registry of all metrics of the service. """
+
+class MetricsServer(Thread):
+
+    def __init__(self, host = "127.0.0.1", port = 9110, registry: MetricsRegistry = None):
+        """
+        Serves the metrics of `registry` at `/metrics` for Prometheus to scrape.
+
+        Args:
+            host (str, optional): Address to listen on. Defaults to local connections only.
+            port (int, optional): Port to listen on. Defaults to 9110.
+            registry (MetricsRegistry, optional): Metrics to serve. Defaults to the service's registry.
+        """
+        Thread.__init__(self, name = "MetricsServer")
+
+        self.daemon = True
+        """ Sets this thread in `daemon` mode so it never keeps the process alive. """
+
+        registry = registry or REGISTRY
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        """ HTTP server. Bound on creation so a port conflict is reported immediately. """
+
+        self.server.daemon_threads = True
+
+    def run(self):
+        LOGGER.info(f"Serving metrics on port {self.server.server_address[1]}.")
+        self.server.serve_forever()
+
+    def terminate(self):
+        """
+        Stops the server.
+        """
+        self.server.shutdown()
+        self.server.server_close()
@@ -1,11 +1,13 @@
-from datetime import datetime
-import pytz
+from .clock import DEFAULT_CLOCK
 
 def now():
     """
     Returns the current time in the US/Central timezone.
     """
-    current_time = datetime.now()
-    tz = pytz.timezone("US/Central")
+    return DEFAULT_CLOCK.now()
 
-    return current_time.replace(tzinfo=tz)
\ No newline at end of file
+def from_timestamp(timestamp: float):
+    """
+    Returns the epoch `timestamp` as a datetime in the US/Central timezone.
+    """
+    return DEFAULT_CLOCK.from_timestamp(timestamp)
@@ -0,0 +1,298 @@
+import json
+import logging
+import os
+import sqlite3
+
+from threading import Thread, Event, Lock
+
+from .clock import Clock, DEFAULT_CLOCK
+
+LOGGER = logging.getLogger()
+
+DEAD_LETTER_LIMIT = 1000
+""" Number of rejected entries kept for inspection. """
+
+class BatchRejected(Exception):
+
+    def __init__(self, status: int, content = ""):
+        """
+        Raised by `send_batch` when the database refuses a batch because of its content, e.g. a
+        4xx response to an invalid row. Sending the same batch again would fail the same way.
+
+        Args:
+            status (int): HTTP status code of the response.
+            content (str, optional): Body of the response.
+        """
+        super().__init__(f"Database rejected the batch with status {status}: {content}")
+        self.status = status
+        self.content = content
+
+class Outbox(Thread):
+
+    def __init__(self, path: str, send_batch, clock: Clock = None, batch_size = 500, flush_interval = 30,
+                 commit_interval = 5, max_size = 10 * 1024 * 1024):
+        """
+        Durable store-and-forward queue for data that is posted to the database. Data is
+        appended to a local SQLite file and this thread periodically drains it to the
+        database in batches. Rows are only deleted once a batch has been accepted, so
+        nothing is lost while the database is unreachable.
+
+        A batch the database rejects as invalid is split in halves until the offending entries
+        are isolated. Those are moved to a `dead_letter` table, which keeps the last
+        `DEAD_LETTER_LIMIT` of them, and the rest are sent as usual.
+
+        Writes are committed in groups rather than one at a time, and the file uses a
+        write-ahead log with `synchronous=NORMAL`, so the SD card is not synced on every write.
+
+        Args:
+            path (str): Path to the SQLite file. Created along with its directory if it doesn't exist.
+            send_batch (Callable[[str, list[dict]], bool]): Called with an endpoint and a list of rows.
+                Must return True only if the database stored every row, and raise `BatchRejected` if
+                the rows were refused in a way that retrying can't fix.
+            clock (Clock, optional): Clock used to pace commits and flushes. Defaults to the system clock.
+            batch_size (int, optional): Maximum number of rows sent per request. Defaults to 500.
+            flush_interval (int, optional): Seconds between attempts to drain the outbox. Defaults to 30.
+            commit_interval (int, optional): Maximum seconds a write can stay uncommitted. Pending writes
+                are committed by this thread if no further write does so first. Defaults to 5.
+            max_size (int, optional): Maximum bytes of data stored. The oldest rows are discarded
+                to stay under this limit. Defaults to 10MB.
+        """
+        Thread.__init__(self, name = "Outbox")
+
+        self.daemon = True
+        """ Sets this thread in `daemon` mode so it never keeps the process alive. """
+
+        self.path = path
+        """ Path to the SQLite file. """
+
+        self.send_batch = send_batch
+        """ Sends a batch of rows to an endpoint. Returns True on success. """
+
+        self.clock = clock or DEFAULT_CLOCK
+        """ Clock used to pace commits and flushes. """
+
+        self.batch_size = batch_size
+        """ Maximum number of rows sent per request. """
+
+        self.flush_interval = flush_interval
+        """ Seconds between attempts to drain the outbox. """
+
+        self.commit_interval = commit_interval
+        """ Maximum seconds a write can stay uncommitted. """
+
+        self.max_size = max_size
+        """ Maximum bytes of data stored. """
+
+        self.lock = Lock()
+        """ Guards `db`, which is shared between the writing threads and this thread. """
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok = True)
+        self.db = sqlite3.connect(path, check_same_thread = False, isolation_level = None)
+        """ Connection to the outbox file. Transactions are managed explicitly. """
+
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS outbox (id INTEGER PRIMARY KEY AUTOINCREMENT, endpoint TEXT NOT NULL, payload TEXT NOT NULL)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS dead_letter (id INTEGER PRIMARY KEY AUTOINCREMENT, endpoint TEXT NOT NULL, "
+                        "payload TEXT NOT NULL, error TEXT NOT NULL)")
+
+        self.pending = 0
+        """ Number of uncommitted writes. """
+
+        self.last_commit = self.clock.monotonic()
+        """ Monotonic time of the last commit. """
+
+        self.term = Event()
+        """ Used to terminate this thread. """
+
+        self.wakeup = Event()
+        """ Set to make this thread flush immediately. """
+
+    def put(self, endpoint: str, data: dict):
+        """
+        Stores `data` to be posted to `endpoint`. This only writes to the local file.
+
+        Args:
+            endpoint (str): Database endpoint the data belongs to.
+            data (dict): JSON-compatible data. Should already contain its capture time.
+        """
+        self.put_many(endpoint, [data])
+
+    def put_many(self, endpoint: str, entries: list):
+        """
+        Stores a list of entries to be posted to `endpoint` in a single write.
+
+        Args:
+            endpoint (str): Database endpoint the data belongs to.
+            entries (list[dict]): JSON-compatible entries. Should already contain their capture times.
+        """
+        rows = [(endpoint, json.dumps(data)) for data in entries]
+        with self.lock:
+            if self.pending == 0:
+                self.db.execute("BEGIN")
+            self.db.executemany("INSERT INTO outbox (endpoint, payload) VALUES (?, ?)", rows)
+            self.pending += len(rows)
+
+            if self.pending >= self.batch_size or self.clock.monotonic() - self.last_commit >= self.commit_interval:
+                self._commit()
+
+    def _commit(self, trim = True):
+        """
+        Commits pending writes and enforces `max_size`. Must be called with `self.lock` held.
+
+        Args:
+            trim (bool, optional): If False, `max_size` isn't enforced. Used after rows are removed,
+                which never grows the data, so the rows of a flush in progress aren't discarded. Defaults to True.
+        """
+        if self.pending > 0:
+            self.db.execute("COMMIT")
+            self.pending = 0
+        self.last_commit = self.clock.monotonic()
+        if trim:
+            self._enforce_size()
+
+    def _enforce_size(self):
+        """
+        Discards the oldest rows until the data stored fits in `max_size`. Must be called with `self.lock` held.
+        """
+        page_size = self.db.execute("PRAGMA page_size").fetchone()[0]
+        page_count = self.db.execute("PRAGMA page_count").fetchone()[0]
+        free_pages = self.db.execute("PRAGMA freelist_count").fetchone()[0]
+        used = (page_count - free_pages) * page_size
+        if used <= self.max_size:
+            return
+
+        # drop a tenth of the rows at a time so this doesn't run on every commit
+        rows = self.db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+        discard = max(1, rows // 10)
+        self.db.execute("DELETE FROM outbox WHERE id IN (SELECT id FROM outbox ORDER BY id LIMIT ?)", (discard,))
+        LOGGER.warning(f"Outbox exceeded {self.max_size} bytes. Discarded the {discard} oldest entries.")
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def flush(self):
+        """
+        Sends all stored rows to the database in batches of `batch_size`, oldest first.
+        If a batch fails to send, the rest of its endpoint is left in place to be retried and
+        the other endpoints are still flushed. Rejected rows are moved to the dead letter table.
+
+        Returns:
+            int: Number of rows sent.
+        """
+        with self.lock:
+            self._commit()
+            endpoints = [row[0] for row in self.db.execute("SELECT DISTINCT endpoint FROM outbox")]
+
+        sent = 0
+        for endpoint in endpoints:
+            while not self.term.is_set():
+                with self.lock:
+                    rows = self.db.execute("SELECT id, payload FROM outbox WHERE endpoint = ? ORDER BY id LIMIT ?",
+                                           (endpoint, self.batch_size)).fetchall()
+                if not rows:
+                    break
+
+                count = self._send(endpoint, rows)
+                if count is None:
+                    LOGGER.error(f"Failed to flush entries to {endpoint}. Will retry in {self.flush_interval} seconds.")
+                    break
+                sent += count
+
+        if sent:
+            LOGGER.debug(f"Flushed {sent} entries from the outbox.")
+        return sent
+
+    def _send(self, endpoint: str, rows: list):
+        """
+        Sends `rows` and removes them from the outbox. If the database rejects them, they are
+        split in halves and resent until the rejected rows are isolated and dead-lettered.
+
+        Args:
+            endpoint (str): Endpoint the rows belong to.
+            rows (list[tuple[int, str]]): Consecutive (id, payload) rows of the endpoint.
+
+        Returns:
+            int, None: Number of rows sent, or None if sending failed and should be retried.
+                Rows sent before the failure are removed.
+        """
+        try:
+            if not self.send_batch(endpoint, [json.loads(payload) for _, payload in rows]):
+                return None
+        except BatchRejected as e:
+            if len(rows) == 1:
+                self._dead_letter(endpoint, rows, e)
+                return 0
+            middle = len(rows) // 2
+            first = self._send(endpoint, rows[:middle])
+            if first is None:
+                return None
+            second = self._send(endpoint, rows[middle:])
+            return None if second is None else first + second
+
+        # only delete what was sent; rows may have been added in the meantime
+        with self.lock:
+            self.db.execute("DELETE FROM outbox WHERE endpoint = ? AND id BETWEEN ? AND ?", (endpoint, rows[0][0], rows[-1][0]))
+            self._commit(trim = False)
+        return len(rows)
+
+    def _dead_letter(self, endpoint: str, rows: list, error: BatchRejected):
+        """
+        Moves rejected `rows` out of the outbox into the dead letter table.
+        """
+        LOGGER.error(f"Moved {len(rows)} entries for {endpoint} to the dead letter table. {error}")
+        with self.lock:
+            if self.pending == 0:
+                self.db.execute("BEGIN")
+            self.db.executemany("INSERT INTO dead_letter (endpoint, payload, error) VALUES (?, ?, ?)",
+                                [(endpoint, payload, str(error)) for _, payload in rows])
+            self.db.execute("DELETE FROM outbox WHERE endpoint = ? AND id BETWEEN ? AND ?", (endpoint, rows[0][0], rows[-1][0]))
+            self.db.execute("DELETE FROM dead_letter WHERE id <= (SELECT MAX(id) FROM dead_letter) - ?", (DEAD_LETTER_LIMIT,))
+            self.pending += len(rows)
+            self._commit(trim = False)
+
+    def dead_letters(self):
+        """
+        Returns the rejected entries kept in the dead letter table, oldest first.
+
+        Returns:
+            list[tuple[str, dict, str]]: (endpoint, data, error) of each entry.
+        """
+        with self.lock:
+            rows = self.db.execute("SELECT endpoint, payload, error FROM dead_letter ORDER BY id").fetchall()
+        return [(endpoint, json.loads(payload), error) for endpoint, payload, error in rows]
+
+    def run(self):
+        """
+        Flushes the outbox every `flush_interval` seconds until terminate() is called. In
+        between, pending writes are committed once they are `commit_interval` seconds old.
+        """
+        next_flush = self.clock.monotonic()
+        while not self.term.is_set():
+            current = self.clock.monotonic()
+            if current >= next_flush:
+                try:
+                    self.flush()
+                except Exception as e:
+                    LOGGER.error(f"Error flushing outbox: {str(e)}")
+                next_flush = self.clock.monotonic() + self.flush_interval
+            else:
+                with self.lock:
+                    if self.pending > 0 and current - self.last_commit >= self.commit_interval:
+                        self._commit()
+
+            if self.wakeup.wait(max(0, min(self.commit_interval, next_flush - self.clock.monotonic()))):
+                self.wakeup.clear()
+                next_flush = self.clock.monotonic()
+
+    def terminate(self, timeout = 5):
+        """
+        Stops this thread and commits any pending writes so they are sent after a restart.
+        """
+        self.term.set()
+        self.wakeup.set()
+        if self.is_alive():
+            self.join(timeout)
+        with self.lock:
+            self._commit()
@@ -1,9 +1,12 @@
 from datetime import datetime
-from .now import now
+from .clock import Clock, DEFAULT_CLOCK
 
 
 class Reading:
-    def __init__(self, temp: int, hum: int, time: datetime = None, is_fahrenheit = False, convert = True):
+
+    __slots__ = ("temp", "hum", "timestamp", "is_fahrenheit", "clock")
+
+    def __init__(self, temp: int, hum: int, time: datetime = None, is_fahrenheit = False, convert = True, timestamp: float = None, clock: Clock = None):
         """
          Holds temperature and humidity data, as well as the time of data capture.
 
@@ -16,18 +19,45 @@ class Reading:
             convert (bool, optional): If True, will convert `temp` to Celsius if `is_fahrenheit` is true.
                 If `is_fahrenheit` is false, `temp` will be converted to Celsius.
                 If false, no conversion will take place.
+            timestamp (float, optional): Time of capture as seconds since the epoch. Takes precedence over `time`.
+            clock (Clock, optional): Clock used to timestamp this reading if neither `time` nor `timestamp` is given,
+                and whose timezone `time` is expressed in. Defaults to the system clock.
         """
-        self.temp = temp
-        self.hum = hum
-        self.time = now() if time is None else time
+        self.clock = clock
+        """ Clock this reading was captured with. None for the system clock. """
+
+        if timestamp is None:
+            if time is None:
+                timestamp = (clock or DEFAULT_CLOCK).time()
+            else:
+                timestamp = time.timestamp()
+
+        self.timestamp = timestamp
+        """ Time of capture, in seconds since the epoch. """
+
         self.is_fahrenheit = is_fahrenheit
+        """ True if `temp` is in Fahrenheit, False if it is in Celsius. """
 
-        if self.temp != None:
-            if convert:
-                self.convert()
-            self.temp = round(self.temp, 2)
-        if self.hum != None:
-            self.hum = round(hum, 2)
+        if temp is not None and convert:
+            # converts and rounds in a single step
+            if is_fahrenheit:
+                temp = (temp - 32) * (5/9)
+            else:
+                temp = (temp * 9/5) + 32
+            self.is_fahrenheit = not is_fahrenheit
+
+        self.temp = None if temp is None else round(temp, 2)
+        """ Temperature, in the units described by `is_fahrenheit`. """
+
+        self.hum = None if hum is None else round(hum, 2)
+        """ Humidity percentage. """
+
+    @property
+    def time(self):
+        """
+        Time of capture as a datetime in the timezone of this reading's clock. This is created on access.
+        """
+        return (self.clock or DEFAULT_CLOCK).from_timestamp(self.timestamp)
 
     def convert(self):
         """
@@ -55,20 +85,27 @@ class Reading:
         self.temp = round((self.temp - 32) * (5/9), 2)
         self.is_fahrenheit = False
 
-    def to_dict(self):
+    @staticmethod
+    def make_dict(temp: float, hum: float, timestamp: float, clock: Clock = None):
         """
-        Converts this reading into a JSON-compatible dictionary.
+        Creates a JSON-compatible dictionary from raw reading values, without
+        creating a `Reading` object. The time is expressed in the timezone of `clock`.
         """
         return {
-            "temperature": self.temp,
-            "humidity": self.hum,
-            "time": str(self.time)
+            "temperature": temp,
+            "humidity": hum,
+            "time": str((clock or DEFAULT_CLOCK).from_timestamp(timestamp))
         }
 
+    def to_dict(self):
+        """
+        Converts this reading into a JSON-compatible dictionary.
+        """
+        return Reading.make_dict(self.temp, self.hum, self.timestamp, self.clock)
+
     def __str__(self):
         if self.temp == None or self.hum == None:
             return "Read error."
 
         unit = "F" if self.is_fahrenheit else "C"
         return f"{self.temp}°{unit} {self.hum}% {self.time.strftime('%H:%M:%S')}"
-
@@ -1,34 +1,126 @@
 import logging
 
+from array import array
+from threading import Lock
+
+from .clock import Clock, DEFAULT_CLOCK
 from .reading import Reading
-from .now import now
 
 LOGGER = logging.getLogger()
 
+class ReadingView:
+
+    def __init__(self, temps: array, hums: array, timestamps: array, units: array, clock: Clock = None):
+        """
+        An immutable, column-oriented view of readings. `Reading` objects are only created
+        when an entry is accessed by index or iteration; the raw columns can be read directly
+        through `temps`, `hums` and `timestamps`.
+
+        Args:
+            temps (array): Temperature column.
+            hums (array): Humidity column.
+            timestamps (array): Capture time column, in seconds since the epoch.
+            units (array): Unit column. 1 if the temperature is in Fahrenheit, 0 if it is in Celsius.
+            clock (Clock, optional): Clock the readings were captured with. Defaults to the system clock.
+        """
+        self.temps = temps
+        self.hums = hums
+        self.timestamps = timestamps
+        self.units = units
+        self.clock = clock
+
+    def reading(self, index: int):
+        """
+        Creates a `Reading` object for the entry at `index`.
+        """
+        return Reading(self.temps[index], self.hums[index], timestamp = self.timestamps[index],
+                       is_fahrenheit = bool(self.units[index]), convert = False, clock = self.clock)
+
+    def to_dicts(self):
+        """
+        Converts all entries into JSON-compatible dictionaries without creating `Reading` objects.
+        """
+        return [Reading.make_dict(t, h, ts, self.clock) for t, h, ts in zip(self.temps, self.hums, self.timestamps)]
+
+    def __getitem__(self, index: int):
+        return self.reading(index)
+
+    def __len__(self):
+        return len(self.temps)
+
+    def __iter__(self):
+        return (self.reading(i) for i in range(len(self.temps)))
+
+    def __str__(self):
+        return str([str(r) for r in self])
+
 class ReadingBuffer:
 
-    def __init__(self, duration: int):
+    def __init__(self, duration: int, clock: Clock = None):
         """
-        This class holds a list containing `Reading` objects. If an entry is older than `duration` seconds,
-        it is removed automatically. Therefore all entries in the list stay within the last `duration` seconds.
+        This class holds a queue of readings. If an entry is older than `duration` seconds,
+        it is removed automatically. Therefore all entries in the queue stay within the last `duration` seconds.
+
+        Readings are stored column-wise in compact `array('d')` columns rather than as `Reading` objects,
+        and `Reading` objects are only created when a caller asks for one. Entries are ordered by the
+        monotonic clock at the time they were appended, so expired entries are always at the head of
+        the queue and can be evicted in amortized O(1). Running sums of temperature and humidity are
+        kept so averages never have to iterate over the buffer.
 
-        All methods that add or retrieve from this list automatically clean out old entries before returning.
+        All methods are thread-safe, and all methods that add or retrieve from this queue automatically
+        clean out old entries before returning.
 
         Args:
             duration (int): Amount of time that the entries should span, in seconds.
+            clock (Clock, optional): Clock used to expire entries. Defaults to the system clock.
         """
         self.duration = duration
-        self.list: list[Reading] = []
+        """ Amount of time that the entries should span, in seconds. """
+
+        self.clock = clock or DEFAULT_CLOCK
+        """ Clock used to expire entries. """
+
+        self.monotonic = array('d')
+        """ Monotonic time each entry was appended at. Used for expiry. """
+
+        self.temps = array('d')
+        """ Temperature column. """
+
+        self.hums = array('d')
+        """ Humidity column. """
+
+        self.timestamps = array('d')
+        """ Capture time column, in seconds since the epoch. """
+
+        self.units = array('b')
+        """ Unit column. 1 if the temperature is in Fahrenheit, 0 if it is in Celsius. """
+
+        self.head = 0
+        """ Index of the oldest live entry in each column. Entries before it have been evicted. """
+
+        self.lock = Lock()
+        """ Guards all access to the columns, the running sums and the snapshot. """
+
+        self.temp_sum = 0.0
+        """ Running sum of the temperatures of all entries. """
+
+        self.hum_sum = 0.0
+        """ Running sum of the humidities of all entries. """
+
+        self._evictions = 0
+        """ Number of evictions since the running sums were last recomputed. """
+
+        self._snapshot = None
+        """ Cached `ReadingView`, invalidated whenever the buffer changes. """
 
     def all(self):
         """
         Returns all readings in the queue.
 
         Returns:
-            list[Reading]: All reading objects.
+            ReadingView: All readings, oldest first.
         """
-        self.remove_old_entries()
-        return self.list
+        return self.snapshot()
 
     def append(self, reading: Reading):
         """
@@ -37,47 +129,208 @@ class ReadingBuffer:
         Args:
             reading (Reading): The reading to add to the queue.
         """
-        entry = now() if reading is None else reading
-        self.remove_old_entries()
-        self.list.append(entry)
+        self.append_values(reading.temp, reading.hum, reading.timestamp, reading.is_fahrenheit)
+
+    def append_values(self, temp: float, hum: float, timestamp: float, is_fahrenheit = True):
+        """
+        Adds a reading to the queue from its raw values, without requiring a `Reading` object.
+
+        Args:
+            temp (float): Temperature.
+            hum (float): Humidity percentage.
+            timestamp (float): Time of capture, in seconds since the epoch.
+            is_fahrenheit (bool, optional): If True, `temp` is in Fahrenheit. Defaults to True.
+        """
+        current = self.clock.monotonic()
+        with self.lock:
+            self._evict(current)
+            self.monotonic.append(current)
+            self.temps.append(temp)
+            self.hums.append(hum)
+            self.timestamps.append(timestamp)
+            self.units.append(1 if is_fahrenheit else 0)
+            self.temp_sum += temp
+            self.hum_sum += hum
+            self._snapshot = None
+
+    def restore(self, entries: list, is_fahrenheit = True):
+        """
+        Adds readings captured before this buffer was created, e.g. from a `HistoryFile` after
+        a restart. Each entry expires `duration` seconds after its capture time, and entries
+        that have already expired are discarded.
+
+        Args:
+            entries (list[tuple[float, float, float]]): (timestamp, temperature, humidity) of each reading, oldest first.
+            is_fahrenheit (bool, optional): If True, the temperatures are in Fahrenheit. Defaults to True.
+
+        Returns:
+            int: Number of entries restored.
+        """
+        current = self.clock.monotonic()
+        now = self.clock.time()
+        restored = 0
+        with self.lock:
+            last = self.monotonic[-1] if len(self.monotonic) > self.head else None
+            for timestamp, temp, hum in entries:
+                # place each entry on the monotonic clock by its age
+                age = now - timestamp
+                if age > self.duration or age < 0:
+                    continue
+                monotonic = current - age
+                if last is not None and monotonic < last:
+                    continue
+                last = monotonic
+                self.monotonic.append(monotonic)
+                self.temps.append(temp)
+                self.hums.append(hum)
+                self.timestamps.append(timestamp)
+                self.units.append(1 if is_fahrenheit else 0)
+                self.temp_sum += temp
+                self.hum_sum += hum
+                restored += 1
+            self._snapshot = None
+        return restored
 
     def remove_old_entries(self):
         """
         Removes all entries that are older than `self.duration` seconds.
         """
-        if len(self.list) == 0:
+        with self.lock:
+            self._evict(self.clock.monotonic())
+
+    def _evict(self, current: float):
+        """
+        Evicts expired entries from the head of the queue. Must be called with `self.lock` held.
+        """
+        monotonic = self.monotonic
+        end = len(monotonic)
+        cutoff = current - self.duration
+        head = self.head
+
+        while head < end and monotonic[head] < cutoff:
+            self.temp_sum -= self.temps[head]
+            self.hum_sum -= self.hums[head]
+            head += 1
+
+        if head == self.head:
             return
 
-        for reading in self.list:
-            if (now() - reading.time).total_seconds() > self.duration:
-                self.list.remove(reading)
+        self._evictions += head - self.head
+        self.head = head
+        self._snapshot = None
+
+        if head == end:
+            self._clear()
+            return
+
+        # compact the columns once more than half of them is dead space.
+        # This keeps eviction amortized O(1) while bounding memory use.
+        if head > end - head:
+            for column in (self.monotonic, self.temps, self.hums, self.timestamps, self.units):
+                del column[:head]
+            self.head = 0
+
+        if self._evictions > len(self.monotonic) - self.head:
+            # periodically recompute the sums so floating point error from
+            # repeated subtraction can't accumulate over long uptimes
+            self.temp_sum = sum(self.temps[self.head:])
+            self.hum_sum = sum(self.hums[self.head:])
+            self._evictions = 0
+
+    def _clear(self):
+        """
+        Removes all entries. Must be called with `self.lock` held.
+        """
+        for column in (self.monotonic, self.temps, self.hums, self.timestamps, self.units):
+            del column[:]
+        self.head = 0
+        self.temp_sum = 0.0
+        self.hum_sum = 0.0
+        self._evictions = 0
+        self._snapshot = None
+
+    def average(self):
+        """
+        Returns a reading containing the average temperature and humidity of all entries.
+        Its time and unit are those of the latest entry.
+
+        Returns:
+            Reading, None: Averaged reading if the buffer has entries. None otherwise.
+        """
+        with self.lock:
+            self._evict(self.clock.monotonic())
+            count = len(self.monotonic) - self.head
+            if count == 0:
+                return None
+            return Reading(self.temp_sum / count, self.hum_sum / count, timestamp = self.timestamps[-1],
+                           is_fahrenheit = bool(self.units[-1]), convert = False, clock = self.clock)
+
+    def totals(self):
+        """
+        Returns the raw running totals of the buffer, used to combine averages across buffers.
+
+        Returns:
+            tuple[int, float, float, float, bool]: (count, temperature sum, humidity sum, latest timestamp, latest is_fahrenheit).
+                The last two are None if the buffer is empty.
+        """
+        with self.lock:
+            self._evict(self.clock.monotonic())
+            count = len(self.monotonic) - self.head
+            if count == 0:
+                return 0, 0.0, 0.0, None, None
+            return count, self.temp_sum, self.hum_sum, self.timestamps[-1], bool(self.units[-1])
+
+    def snapshot(self):
+        """
+        Returns an immutable copy of all readings in the queue. The copy is cached and shared
+        between callers until the buffer is next modified.
+
+        Returns:
+            ReadingView: All readings, oldest first.
+        """
+        with self.lock:
+            self._evict(self.clock.monotonic())
+            if self._snapshot is None:
+                head = self.head
+                self._snapshot = ReadingView(self.temps[head:], self.hums[head:], self.timestamps[head:], self.units[head:], self.clock)
+            return self._snapshot
 
     def latest(self):
         """
         Returns latest reading.
         """
-        self.remove_old_entries()
-        if len(self.list) > 0:
-            return self.list[-1]
-        return None
+        with self.lock:
+            self._evict(self.clock.monotonic())
+            if len(self.monotonic) > self.head:
+                return Reading(self.temps[-1], self.hums[-1], timestamp = self.timestamps[-1],
+                               is_fahrenheit = bool(self.units[-1]), convert = False, clock = self.clock)
+            return None
 
     def oldest(self):
         """
         Returns oldest reading.
         """
-        self.remove_old_entries()
-        if len(self.list) > 0:
-            return self.list[0]
-        return None
+        with self.lock:
+            self._evict(self.clock.monotonic())
+            head = self.head
+            if len(self.monotonic) > head:
+                return Reading(self.temps[head], self.hums[head], timestamp = self.timestamps[head],
+                               is_fahrenheit = bool(self.units[head]), convert = False, clock = self.clock)
+            return None
 
     def toList(self):
         """
         Returns this all readings as a list.
         """
-        return self.all()
+        return list(self.snapshot())
 
     def __len__(self):
-        return len(self.all())
+        with self.lock:
+            self._evict(self.clock.monotonic())
+            return len(self.monotonic) - self.head
 
     def __iter__(self):
-        return iter(self.all())
\ No newline at end of file
+        return iter(self.snapshot())
+
+    def __str__(self):
+        return str(self.snapshot())
@@ -0,0 +1,148 @@
+import logging
+
+from threading import Event
+
+from .clock import Clock, DEFAULT_CLOCK
+from .histogram import Histogram
+
+LOGGER = logging.getLogger()
+
+LATENCY_BOUNDS = [0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32]
+""" Bucket bounds of the read latency histogram, in seconds. """
+
+RETRY_BOUNDS = [0, 1, 2, 3, 5, 8]
+""" Bucket bounds of the retry histogram. """
+
+class SampleScheduler:
+
+    def __init__(self, period = 2, deadline = 6, min_interval = 2, max_backoff = 60, offset = 0, clock: Clock = None):
+        """
+        Paces reads from a slow, unreliable sensor. Samples are taken on a fixed grid of
+        `period` seconds measured from the monotonic clock, so the time spent reading does not
+        make the sample rate drift. Each sample is given `deadline` seconds for its retries,
+        after which it is abandoned. When samples keep failing, the scheduler backs off by
+        skipping grid points, up to `max_backoff` seconds between samples.
+
+        Args:
+            period (float, optional): Seconds between samples. Defaults to 2.
+            deadline (float, optional): Maximum seconds spent on a single sample, including retries. Defaults to 6.
+            min_interval (float, optional): Minimum seconds between two attempts to read the sensor. Defaults to 2,
+                which is the minimum supported by DHT sensors.
+            max_backoff (float, optional): Maximum seconds between samples while the sensor is failing. Defaults to 60.
+            offset (float, optional): Seconds to shift the grid by. Used to stagger several sensors. Defaults to 0.
+            clock (Clock, optional): Clock used for pacing. Defaults to the system clock.
+        """
+        self.period = max(period, min_interval)
+        """ Seconds between samples. Never less than `min_interval`. """
+
+        self.deadline = deadline
+        """ Maximum seconds spent on a single sample, including retries. """
+
+        self.min_interval = min_interval
+        """ Minimum seconds between two attempts to read the sensor. """
+
+        self.max_backoff = max_backoff
+        """ Maximum seconds between samples while the sensor is failing. """
+
+        self.clock = clock or DEFAULT_CLOCK
+        """ Clock used for pacing. """
+
+        self.origin = self.clock.monotonic() + offset
+        """ Monotonic time of the first grid point. """
+
+        self.next_time = self.origin
+        """ Monotonic time of the next sample. """
+
+        self.last_attempt = None
+        """ Monotonic time of the last attempt to read the sensor. """
+
+        self.failures = 0
+        """ Number of consecutive failed samples. """
+
+        self.latency = Histogram(LATENCY_BOUNDS)
+        """ Time taken by each sample, including retries, in seconds. """
+
+        self.retries = Histogram(RETRY_BOUNDS)
+        """ Number of retries needed by each sample. """
+
+    def delay(self):
+        """
+        Returns the number of seconds until the next sample is due.
+        """
+        return max(0.0, self.next_time - self.clock.monotonic())
+
+    def wait(self, term: Event):
+        """
+        Waits until the next sample is due or `term` is set.
+
+        Returns:
+            bool: True if `term` is set, False otherwise.
+        """
+        delay = self.delay()
+        if delay > 0:
+            return self.clock.wait(term, delay)
+        return term.is_set()
+
+    def sample(self, read, term: Event = None):
+        """
+        Takes a sample by calling `read` until it returns a value other than None or the
+        deadline passes, then schedules the next sample.
+
+        Args:
+            read (Callable[[], Any]): Makes a single attempt to read the sensor. Returns None on failure.
+            term (Event, optional): Abandons the sample when set.
+
+        Returns:
+            Any: The value returned by `read`, or None if every attempt failed.
+        """
+        term = term or Event()
+        start = self.clock.monotonic()
+        attempts = 0
+        value = None
+
+        while True:
+            # respect the minimum time between reads, including reads made by previous samples
+            if self.last_attempt is not None:
+                wait = self.last_attempt + self.min_interval - self.clock.monotonic()
+                if wait > 0 and self.clock.wait(term, wait):
+                    break
+
+            self.last_attempt = self.clock.monotonic()
+            attempts += 1
+            value = read()
+            if value is not None:
+                break
+
+            if self.clock.monotonic() + self.min_interval - start > self.deadline or term.is_set():
+                break
+
+        if attempts == 0:
+            # abandoned before the sensor was read
+            return None
+
+        self.latency.observe(self.clock.monotonic() - start)
+        self.retries.observe(attempts - 1)
+
+        if value is None:
+            self.failures += 1
+            LOGGER.debug(f"Sample failed after {attempts} attempts ({self.failures} consecutive failures).")
+        else:
+            self.failures = 0
+
+        self.schedule()
+        return value
+
+    def schedule(self):
+        """
+        Sets `next_time` to the first grid point after the current time. While samples are
+        failing, grid points are skipped so the time between samples doubles with each failure.
+        """
+        current = self.clock.monotonic()
+        step = self.period
+        if self.failures > 0:
+            step = min(self.max_backoff, self.period * 2 ** self.failures)
+
+        # skip grid points that were missed while reading, then round up to the grid
+        target = max(current, self.next_time + step)
+        periods = -(-(target - self.origin) // self.period)
+        self.next_time = self.origin + periods * self.period
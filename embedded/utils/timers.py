@@ -0,0 +1,153 @@
+import heapq
+import logging
+
+from itertools import count
+from threading import Thread, Event, Lock
+
+from .clock import Clock, DEFAULT_CLOCK
+
+LOGGER = logging.getLogger()
+
+class TimerScheduler(Thread):
+
+    def __init__(self, clock: Clock = None):
+        """
+        Runs delayed callbacks from a single thread, no matter how many are scheduled.
+        Timers are kept in a heap ordered by their monotonic deadline and are identified
+        by a key. Scheduling a key that is already pending coalesces with it rather than
+        adding a second timer.
+
+        Args:
+            clock (Clock, optional): Clock used for deadlines. Defaults to the system clock.
+        """
+        Thread.__init__(self, name = "TimerScheduler")
+
+        self.daemon = True
+        """ Sets this thread in `daemon` mode so it never keeps the process alive. """
+
+        self.clock = clock or DEFAULT_CLOCK
+        """ Clock used for deadlines. """
+
+        self.heap = []
+        """ Entries of (deadline, sequence, key). Entries whose deadline no longer matches `timers` are stale. """
+
+        self.timers = {}
+        """ Pending timers, mapping each key to its (deadline, callback). """
+
+        self.sequence = count()
+        """ Breaks ties between equal deadlines so keys are never compared. """
+
+        self.lock = Lock()
+        """ Guards `heap` and `timers`. """
+
+        self.term = Event()
+        """ Used to terminate this thread. """
+
+        self.wakeup = Event()
+        """ Set when the earliest deadline may have changed. """
+
+    def schedule(self, key, delay: float, callback):
+        """
+        Calls `callback` from the scheduler thread after `delay` seconds. If a timer with
+        the same `key` is pending, it is extended to whichever deadline is later and its
+        callback is replaced, so only one call is made.
+
+        Args:
+            key (Hashable): Identifies the timer.
+            delay (float): Seconds until `callback` is called.
+            callback (Callable[[], None]): Function to call.
+        """
+        deadline = self.clock.monotonic() + delay
+        with self.lock:
+            pending = self.timers.get(key)
+            if pending is not None and pending[0] >= deadline:
+                self.timers[key] = (pending[0], callback)
+                return
+
+            self.timers[key] = (deadline, callback)
+            heapq.heappush(self.heap, (deadline, next(self.sequence), key))
+        self.wakeup.set()
+
+    def cancel(self, key):
+        """
+        Cancels the pending timer for `key`, if any.
+
+        Returns:
+            bool: True if a timer was cancelled.
+        """
+        with self.lock:
+            return self.timers.pop(key, None) is not None
+
+    def cancel_all(self):
+        """
+        Cancels all pending timers.
+
+        Returns:
+            int: Number of timers cancelled.
+        """
+        with self.lock:
+            cancelled = len(self.timers)
+            self.timers.clear()
+            self.heap.clear()
+        return cancelled
+
+    def pending(self, key):
+        """
+        Returns True if a timer for `key` is pending.
+        """
+        with self.lock:
+            return key in self.timers
+
+    def run_due(self):
+        """
+        Calls the callbacks of all timers whose deadlines have passed.
+
+        Returns:
+            float, None: Seconds until the next deadline, or None if no timers are pending.
+        """
+        while True:
+            with self.lock:
+                # discard heap entries of cancelled or extended timers
+                while self.heap:
+                    deadline, _, key = self.heap[0]
+                    pending = self.timers.get(key)
+                    if pending is not None and pending[0] == deadline:
+                        break
+                    heapq.heappop(self.heap)
+
+                if not self.heap:
+                    return None
+
+                delay = self.heap[0][0] - self.clock.monotonic()
+                if delay > 0:
+                    return delay
+
+                _, _, key = heapq.heappop(self.heap)
+                _, callback = self.timers.pop(key)
+
+            try:
+                callback()
+            except Exception as e:
+                LOGGER.error(f"Error running timer {key}: {str(e)}")
+
+    def run(self):
+        """
+        Calls timer callbacks as their deadlines pass until terminate() is called.
+        """
+        while not self.term.is_set():
+            delay = self.run_due()
+            if delay is None:
+                self.wakeup.wait()
+            else:
+                self.clock.wait(self.wakeup, delay)
+            self.wakeup.clear()
+
+    def terminate(self):
+        """
+        Cancels all pending timers and stops this thread.
+        """
+        cancelled = self.cancel_all()
+        if cancelled:
+            LOGGER.info(f"Cancelled {cancelled} pending timers.")
+        self.term.set()
+        self.wakeup.set()